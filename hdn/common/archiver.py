@@ -0,0 +1,122 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+from oslo_config import cfg
+from oslo_log import log
+
+from hdn.common import metrics
+from hdn.common import utils
+from hdn.db import tasks_db
+
+LOG = log.getLogger(__name__)
+
+LEASE_NAME = 'hdn-task-archiver'
+
+
+class Archiver(utils.LeasedJob):
+    """Move tasks which ended a while ago to the archive table.
+
+    Completed and failed tasks not updated for max_age seconds are moved
+    in batches of batch_size, each in its own short transaction, pausing
+    for pause seconds between batches so that the archiver does not
+    compete with API requests for the table. Changes of tasks no longer
+    needed by watchers are removed from the change log the same way. A
+    lease stored in the database ensures that a single server runs the
+    archiver at any time.
+    """
+
+    lease_name = LEASE_NAME
+
+    def __init__(self, batch_size=500, max_age=604800, pause=0.1,
+                 lease_duration=300):
+        super(Archiver, self).__init__(lease_duration)
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.pause = pause
+
+    def run_leader(self, session):
+        start = time.time()
+        archived = 0
+        marker = None
+        while True:
+            ids = tasks_db.archive_tasks(session, self.max_age,
+                                         self.batch_size, marker=marker)
+            if not ids:
+                break
+            archived += len(ids)
+            metrics.REGISTRY.inc('tasks_archived_total', len(ids))
+            marker = ids[-1]
+            if len(ids) < self.batch_size:
+                break
+            if not self.renew_lease(session):
+                LOG.warning("Task archiver lease lost, stopping")
+                break
+            time.sleep(self.pause)
+        purged = 0
+        while True:
+            count = tasks_db.purge_changes(session, self.batch_size)
+            if not count:
+                break
+            purged += count
+            if not self.renew_lease(session):
+                LOG.warning("Task archiver lease lost, stopping")
+                break
+            time.sleep(self.pause)
+        elapsed = time.time() - start
+        self._stats['archived'] += archived
+        self._stats['changes_purged'] += purged
+        self._stats['runs'] += 1
+        self._last_run = {'leader': True,
+                          'archived': archived,
+                          'changes_purged': purged,
+                          'seconds': elapsed}
+        if archived:
+            LOG.info("Archived %(archived)d tasks in %(elapsed).1f seconds",
+                     {'archived': archived, 'elapsed': elapsed})
+        return False
+
+
+def _make_archiver():
+    conf = cfg.CONF.HDN
+    return Archiver(batch_size=conf.task_archive_batch_size,
+                    max_age=conf.task_archive_age,
+                    pause=conf.task_archive_batch_pause,
+                    lease_duration=conf.task_archive_lease_duration)
+
+
+_runner = utils.LeasedJobRunner(
+    'hdn-task-archiver', _make_archiver,
+    lambda: cfg.CONF.HDN.task_archive_interval)
+
+
+def start_archiver():
+    """Start the task archiver in the current process, if enabled.
+
+    Every server runs its own worker, but only the one holding the lease
+    archives tasks.
+    """
+    return _runner.start()
+
+
+def get_stats():
+    """Return counters of the task archiver."""
+    return _runner.get_stats()
+
+
+def stop_archiver():
+    """Stop the archiver and let another server take over right away."""
+    _runner.stop()
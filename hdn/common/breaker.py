@@ -0,0 +1,144 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import itertools
+import os
+import threading
+import time
+
+from oslo_log import log
+from oslo_serialization import jsonutils
+
+LOG = log.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+    """Stop using a transport after too many consecutive failures.
+
+    The breaker opens after failure_threshold consecutive failures. While
+    it is open callers should not use the transport at all. After
+    reset_timeout seconds a single probe is allowed (half-open state); the
+    breaker closes if the probe succeeds and opens again otherwise.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        return self.state == STATE_CLOSED
+
+    def attempt_reset(self):
+        """Move to half-open if the breaker has been open long enough.
+
+        Returns True if the caller may use the transport, either because the
+        breaker is closed or because it is now the half-open probe.
+        """
+        with self._lock:
+            if (self.state == STATE_OPEN and
+                    time.time() - self.opened_at >= self.reset_timeout):
+                self.state = STATE_HALF_OPEN
+                LOG.info("Probing notification transport")
+                return True
+            return self.state == STATE_CLOSED
+
+    def record_success(self):
+        with self._lock:
+            if self.state != STATE_CLOSED:
+                LOG.info("Notification transport recovered")
+            self.state = STATE_CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if (self.state == STATE_HALF_OPEN or
+                    (self.state == STATE_CLOSED and
+                     self.failures >= self.failure_threshold)):
+                LOG.warning("Notification transport failed %d times, "
+                            "spooling notifications", self.failures)
+                self.state = STATE_OPEN
+                self.opened_at = time.time()
+
+
+class Spool(object):
+    """A durable FIFO of notifications stored as files in a directory.
+
+    Notifications which the transport rejected for good are stored in the
+    rejected subdirectory instead, where they are kept for operators to
+    inspect.
+    """
+
+    SUFFIX = '.json'
+    REJECTED = 'rejected'
+
+    def __init__(self, path):
+        self.path = path
+        self.rejected_path = os.path.join(path, self.REJECTED)
+        self._sequence = itertools.count()
+        try:
+            os.makedirs(self.rejected_path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _write(self, path, message):
+        name = '%017.6f-%d-%08d%s' % (time.time(), os.getpid(),
+                                      next(self._sequence), self.SUFFIX)
+        tmp_path = os.path.join(path, '.' + name)
+        with open(tmp_path, 'w') as spool_file:
+            spool_file.write(jsonutils.dumps(message))
+            spool_file.flush()
+            os.fsync(spool_file.fileno())
+        # Renaming makes the message visible only once fully written
+        os.rename(tmp_path, os.path.join(path, name))
+
+    def put(self, subject, text):
+        self._write(self.path, {'subject': subject, 'text': text})
+
+    def put_rejected(self, subject, text, error):
+        self._write(self.rejected_path, {'subject': subject, 'text': text,
+                                         'error': str(error)})
+
+    def names(self):
+        """Return the names of spooled messages, oldest first."""
+        return sorted(name for name in os.listdir(self.path)
+                      if name.endswith(self.SUFFIX) and
+                      not name.startswith('.'))
+
+    def get(self, name):
+        with open(os.path.join(self.path, name)) as spool_file:
+            message = jsonutils.loads(spool_file.read())
+        return message['subject'], message['text']
+
+    def remove(self, name):
+        try:
+            os.unlink(os.path.join(self.path, name))
+        except OSError as e:
+            # Another server might have sent it already
+            if e.errno != errno.ENOENT:
+                raise
+
+    def __len__(self):
+        return len(self.names())
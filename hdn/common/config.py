@@ -17,10 +17,201 @@
 from oslo_config import cfg
 
 hdn_opts = [
+    cfg.StrOpt('notification_driver', default='smtp',
+               help=_("Driver used for delivering notifications to HDN "
+                      "operators: smtp, lmtp, maildir, mbox, jsonfile, "
+                      "null, or memory")),
+    cfg.StrOpt('lmtp_socket',
+               help=_("Path of the Unix socket of the LMTP server used by "
+                      "the lmtp driver")),
+    cfg.StrOpt('notification_path',
+               help=_("Maildir directory, mbox file, or JSON file where the "
+                      "maildir, mbox, and jsonfile drivers store "
+                      "notifications")),
     cfg.StrOpt('smtp_user', help=_("SMTP user name")),
     cfg.StrOpt('smtp_password', help=_("SMTP password")),
     cfg.StrOpt('smtp_server', help=_("SMTP server address")),
     cfg.IntOpt('smtp_port', default=25, help=_("SMTP server port")),
+    cfg.ListOpt('smtp_servers', default=[],
+                help=_("SMTP relays, as host or host:port, across which "
+                       "notifications are spread. Overrides smtp_server")),
+    cfg.StrOpt('smtp_balancing', default='round_robin',
+               choices=['round_robin', 'least_outstanding'],
+               help=_("How notifications are spread across smtp_servers")),
+    cfg.IntOpt('smtp_relay_down_interval', default=30,
+               help=_("Seconds for which a failed SMTP relay is used only "
+                      "if all the others are failing")),
+    cfg.BoolOpt('smtp_starttls', default=True,
+                help=_("Issue STARTTLS before authenticating to the SMTP "
+                       "server")),
+    cfg.IntOpt('smtp_timeout', default=30,
+               help=_("Timeout, in seconds, for SMTP socket operations")),
+    cfg.IntOpt('smtp_pool_size', default=4,
+               help=_("Maximum number of SMTP sessions kept open for "
+                      "sending notifications")),
+    cfg.IntOpt('smtp_pool_idle_timeout', default=60,
+               help=_("Seconds after which an idle SMTP session is "
+                      "closed")),
+    cfg.IntOpt('smtp_pool_check_interval', default=10,
+               help=_("Seconds of inactivity after which a pooled SMTP "
+                      "session is checked with NOOP before being reused")),
+    cfg.BoolOpt('async_notifications', default=False,
+                help=_("Send notifications to HDN operators from a pool of "
+                       "background workers rather than from the API request "
+                       "which generated them")),
+    cfg.IntOpt('notification_queue_size', default=1000,
+               help=_("Maximum number of notifications waiting to be sent "
+                      "when async_notifications is enabled")),
+    cfg.IntOpt('notification_workers', default=2,
+               help=_("Number of workers sending queued notifications")),
+    cfg.StrOpt('notification_queue_full_policy', default='block',
+               choices=['block', 'drop_oldest', 'fail'],
+               help=_("What to do with a new notification when the queue "
+                      "is full: wait for room in the queue, discard the "
+                      "oldest queued notification, or fail the request")),
+    cfg.IntOpt('notification_queue_block_timeout', default=10,
+               help=_("Seconds to wait for room in a full notification queue "
+                      "before failing the request, when the 'block' policy "
+                      "is in use")),
+    cfg.IntOpt('notification_shutdown_timeout', default=30,
+               help=_("Seconds to wait, when the server stops, for queued "
+                      "notifications to be delivered")),
+    cfg.BoolOpt('notification_outbox', default=False,
+                help=_("Store notifications in the database within the "
+                       "transaction which changes the resource, and send "
+                       "them from there")),
+    cfg.IntOpt('outbox_batch_size', default=50,
+               help=_("Maximum number of notifications taken from the "
+                      "outbox at once")),
+    cfg.IntOpt('outbox_poll_interval', default=5,
+               help=_("Seconds between checks for unsent notifications in "
+                      "the outbox")),
+    cfg.IntOpt('outbox_claim_timeout', default=60,
+               help=_("Seconds after which a notification taken from the "
+                      "outbox but not sent is sent again")),
+    cfg.IntOpt('outbox_retention', default=86400,
+               help=_("Seconds for which sent notifications are kept in "
+                      "the outbox")),
+    cfg.BoolOpt('notification_digest', default=False,
+                help=_("Collect notifications for digest_window seconds and "
+                       "send them to HDN operators in a single message")),
+    cfg.FloatOpt('digest_window', default=2.0,
+                 help=_("Seconds for which notifications are collected "
+                        "before sending a digest")),
+    cfg.IntOpt('digest_max_events', default=100,
+               help=_("Send a digest as soon as it contains this number of "
+                      "notifications")),
+    cfg.IntOpt('digest_max_size', default=262144,
+               help=_("Maximum size, in characters, of a digest message. "
+                      "Larger digests are split across several messages")),
+    cfg.BoolOpt('coalesce_notifications', default=True,
+                help=_("Merge notifications for the same resource while "
+                       "they are waiting for a digest to be sent, so that "
+                       "superseded requests are not sent to HDN operators")),
+    cfg.IntOpt('breaker_failure_threshold', default=5,
+               help=_("Number of consecutive delivery failures after which "
+                      "notifications are spooled locally without trying "
+                      "to deliver them. 0 disables the circuit breaker")),
+    cfg.IntOpt('breaker_reset_timeout', default=30,
+               help=_("Seconds between attempts to deliver notifications "
+                      "after the circuit breaker tripped")),
+    cfg.StrOpt('notification_spool_dir', default='$state_path/hdn/spool',
+               help=_("Directory where notifications are stored while they "
+                      "cannot be delivered")),
+    cfg.IntOpt('completion_max_items', default=10000,
+               help=_("Maximum number of resources HDN operators can "
+                      "report as completed in a single request")),
+    cfg.IntOpt('pending_max_limit', default=1000,
+               help=_("Maximum number of pending resources returned by a "
+                      "single listing request")),
+    cfg.IntOpt('reaper_interval', default=0,
+               help=_("Seconds between runs of the reaper removing "
+                      "resources left in PENDING_DELETE for longer than "
+                      "reaper_grace_period. 0 disables the reaper")),
+    cfg.IntOpt('reaper_grace_period', default=3600,
+               help=_("Seconds HDN operators have to complete a delete "
+                      "request before the reaper removes the resource")),
+    cfg.IntOpt('reaper_batch_size', default=100,
+               help=_("Number of resources removed by the reaper in a "
+                      "single transaction")),
+    cfg.FloatOpt('reaper_rate', default=50.0,
+                 help=_("Maximum number of resources removed by the reaper "
+                        "per second. 0 means no limit")),
+    cfg.IntOpt('reaper_lease_duration', default=300,
+               help=_("Seconds after which another server takes over the "
+                      "reaper if the one running it stops renewing its "
+                      "lease")),
+    cfg.IntOpt('task_claim_lease', default=300,
+               help=_("Seconds for which HDN operators hold the tasks they "
+                      "claim, unless they renew their claim")),
+    cfg.IntOpt('task_claim_max_count', default=100,
+               help=_("Maximum number of tasks HDN operators can claim "
+                      "in a single request")),
+    cfg.IntOpt('task_archive_interval', default=600,
+               help=_("Seconds between runs of the archiver moving tasks "
+                      "which ended a while ago out of the tasks table. "
+                      "0 disables the archiver")),
+    cfg.IntOpt('task_archive_age', default=604800,
+               help=_("Seconds after their last update completed and "
+                      "failed tasks are archived")),
+    cfg.IntOpt('task_archive_batch_size', default=500,
+               help=_("Number of tasks archived in a single transaction")),
+    cfg.FloatOpt('task_archive_batch_pause', default=0.1,
+                 help=_("Seconds the archiver waits between batches")),
+    cfg.IntOpt('task_archive_lease_duration', default=300,
+               help=_("Seconds after which another server takes over the "
+                      "task archiver if the one running it stops renewing "
+                      "its lease")),
+    cfg.IntOpt('task_deadline', default=86400,
+               help=_("Seconds HDN operators have to end a task before it "
+                      "is escalated. 0 means tasks have no deadline")),
+    cfg.IntOpt('task_escalation_interval', default=3600,
+               help=_("Seconds after which overdue tasks which are still "
+                      "open are escalated again")),
+    cfg.IntOpt('task_escalation_priority_step', default=1,
+               help=_("Amount by which the priority of a task is raised "
+                      "every time it is escalated")),
+    cfg.IntOpt('task_escalation_scan_interval', default=60,
+               help=_("Seconds between checks for overdue tasks. 0 "
+                      "disables escalations")),
+    cfg.IntOpt('task_escalation_batch_size', default=500,
+               help=_("Number of tasks escalated in a single transaction")),
+    cfg.IntOpt('task_escalation_lease_duration', default=300,
+               help=_("Seconds after which another server takes over the "
+                      "task escalator if the one running it stops renewing "
+                      "its lease")),
+    cfg.IntOpt('task_watch_max_timeout', default=120,
+               help=_("Maximum number of seconds a request watching tasks "
+                      "waits for changes")),
+    cfg.IntOpt('task_watch_max_tasks', default=1000,
+               help=_("Maximum number of changed tasks returned to a "
+                      "request watching tasks")),
+    cfg.FloatOpt('task_watch_poll_interval', default=1.0,
+                 help=_("Seconds between checks for changes made by other "
+                        "servers while requests watch tasks. 0 means "
+                        "watchers only learn about changes made by their "
+                        "own server")),
+    cfg.IntOpt('idempotency_key_ttl', default=86400,
+               help=_("Seconds during which a create request with an "
+                      "idempotency key returns the resource created by the "
+                      "first request with the same key")),
+    cfg.IntOpt('idempotency_cache_size', default=10000,
+               help=_("Maximum number of idempotency keys cached in memory "
+                      "by each server. 0 disables the cache")),
+    cfg.ListOpt('metrics_exporters', default=[],
+                help=_("Exporters for notification pipeline metrics, "
+                       "such as prometheus or statsd. No metrics are "
+                       "exported by default")),
+    cfg.IntOpt('metrics_export_interval', default=15,
+               help=_("Seconds between metrics exports")),
+    cfg.StrOpt('metrics_textfile_dir', default='$state_path/hdn/metrics',
+               help=_("Directory where the prometheus exporter writes "
+                      "a hdn-<pid>.prom file for each process, to be read "
+                      "by the node exporter textfile collector")),
+    cfg.StrOpt('metrics_statsd_host', default='127.0.0.1',
+               help=_("Address of the statsd daemon")),
+    cfg.IntOpt('metrics_statsd_port', default=8125,
+               help=_("UDP port of the statsd daemon")),
     cfg.ListOpt('recipients', help=_("Email address where network commands "
                                      "should be sent"))
 ]
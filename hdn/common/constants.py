@@ -15,6 +15,41 @@
 
 HDN_TASK = 'HDN_TASK'
 
+# Status of HDN tasks
+TASK_PENDING = 'PENDING'
+TASK_CLAIMED = 'CLAIMED'
+TASK_COMPLETED = 'COMPLETED'
+TASK_FAILED = 'FAILED'
+# Waiting for the tasks of the resources it depends on to end
+TASK_BLOCKED = 'BLOCKED'
+# Statuses operators can set. Tasks are claimed through task claims
+TASK_STATUSES = (TASK_PENDING, TASK_COMPLETED, TASK_FAILED)
+
+# Tasks with a lower priority value are claimed first
+TASK_PRIORITY_HIGHEST = 0
+TASK_PRIORITY_NORMAL = 2
+TASK_PRIORITY_LOWEST = 9
+
+STATUS_ACTIVE = 'ACTIVE'
+STATUS_ERROR = 'ERROR'
 STATUS_PENDING_CREATE = 'PENDING_CREATE'
 STATUS_PENDING_UPDATE = 'PENDING_UPDATE'
 STATUS_PENDING_DELETE = 'PENDING_DELETE'
+
+# Callback event triggered once for all the resources created by a bulk
+# request. Subscribers receive the list of their identifiers as resource_ids
+AFTER_BULK_CREATE = 'after_bulk_create'
+
+# Outcomes HDN operators can report for a resource they worked on
+OUTCOME_ACTIVE = 'active'
+OUTCOME_ERROR = 'error'
+OUTCOME_DELETED = 'deleted'
+OUTCOMES = (OUTCOME_ACTIVE, OUTCOME_ERROR, OUTCOME_DELETED)
+
+# Resources whose completion can be reported by HDN operators
+COMPLETION_RESOURCES = ('network', 'subnet', 'port', 'router',
+                        'floatingip')
+
+# Callback event triggered once HDN operators completed work on resources,
+# with the list of their identifiers as resource_ids
+AFTER_COMPLETE = 'after_hdn_complete'
@@ -0,0 +1,77 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compute what an update changed in a resource.
+
+Changes are dicts mapping attribute names to (old, new) tuples. Only the
+attributes listed in TRACKED_ATTRIBUTES for a resource require the work of
+HDN operators; changes to any other attribute, such as the name, are
+merely database operations.
+"""
+
+TRACKED_ATTRIBUTES = {
+    'port': ('admin_state_up', 'mac_address', 'fixed_ips', 'device_id',
+             'device_owner'),
+    'subnet': ('gateway_ip', 'enable_dhcp', 'dns_nameservers',
+               'allocation_pools', 'host_routes'),
+    'router': ('admin_state_up', 'external_gateway_info', 'routes'),
+}
+
+
+def _normalize(value):
+    # The order of items in lists, such as fixed IPs or routes, does not
+    # depend on the update and must not show up as a change
+    if isinstance(value, dict):
+        return dict((key, _normalize(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sorted((_normalize(item) for item in value), key=repr)
+    return value
+
+
+def compute_delta(resource, original, updated):
+    """Return the changes to tracked attributes between two resource dicts.
+
+    Attributes missing from either dict are ignored.
+    """
+    changes = {}
+    for attribute in TRACKED_ATTRIBUTES[resource]:
+        if attribute not in original or attribute not in updated:
+            continue
+        old, new = original[attribute], updated[attribute]
+        if _normalize(old) != _normalize(new):
+            changes[attribute] = (old, new)
+    return changes
+
+
+def merge_changes(earlier, later):
+    """Combine the changes of two consecutive updates.
+
+    Attributes which the later update restored to their value before the
+    earlier one are dropped, so the result might be empty.
+    """
+    changes = dict(earlier)
+    for attribute, (old, new) in later.items():
+        if attribute in changes:
+            old = changes[attribute][0]
+        if _normalize(old) == _normalize(new):
+            changes.pop(attribute, None)
+        else:
+            changes[attribute] = (old, new)
+    return changes
+
+
+def format_changes(changes):
+    return "".join("%s: %s -> %s\n" % (attribute, old, new)
+                   for attribute, (old, new) in sorted(changes.items()))
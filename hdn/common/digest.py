@@ -0,0 +1,219 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import threading
+import time
+
+from oslo_log import log
+
+from hdn.common import diff
+
+LOG = log.getLogger(__name__)
+
+# For updates, changes holds the attributes which changed, as returned by
+# diff.compute_delta, and text describes only those.
+Notification = collections.namedtuple(
+    'Notification',
+    ['resource', 'resource_id', 'action', 'subject', 'text', 'changes'])
+Notification.__new__.__defaults__ = (None,)
+
+SEPARATOR = "-" * 72 + "\n"
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+
+
+def _format_entry(index, notification):
+    text = notification.text
+    if text and not text.endswith("\n"):
+        text += "\n"
+    return "%d. %s\n%s" % (index, notification.subject, text)
+
+
+def format_digest(notifications, max_size):
+    """Build digest messages for a list of notifications.
+
+    Returns a list of (subject, body) tuples. Each body starts with a table
+    listing the requests it contains, followed by the detail of each
+    request. Notifications are split across several messages so that no
+    body exceeds max_size characters, unless a single notification is
+    larger than that.
+    """
+    chunks = []
+    current = []
+    size = 0
+    for index, notification in enumerate(notifications, 1):
+        entry = _format_entry(index, notification)
+        # Every entry appears once in the table and once in the details
+        entry_size = (len(notification.subject) + len(entry) +
+                      len(SEPARATOR) + 8)
+        if current and size + entry_size > max_size:
+            chunks.append(current)
+            current, size = [], 0
+        current.append((index, notification, entry))
+        size += entry_size
+    if current:
+        chunks.append(current)
+
+    digests = []
+    for part, chunk in enumerate(chunks, 1):
+        subject = "[HDN] %d requests" % len(chunk)
+        if len(chunks) > 1:
+            subject += " (part %d of %d)" % (part, len(chunks))
+        table = "".join("%4d  %s\n" % (index, notification.subject)
+                        for index, notification, _entry in chunk)
+        details = SEPARATOR.join(entry for _index, _n, entry in chunk)
+        digests.append((subject, table + "\n" + SEPARATOR + details))
+    return digests
+
+
+def coalesce(pending, notification):
+    """Merge notification with the pending one for the same resource.
+
+    Returns the notification which should replace pending:
+
+    - create followed by delete is replaced by the latter, as the
+      resource waits in PENDING_DELETE for an operator to complete it;
+    - create followed by update is a create with the updated state, or
+      with the changes made by the update when only those are known;
+    - update followed by update is a single update with the changes made
+      by both, possibly none if the second update reverted the first, as
+      the resource still waits in PENDING_UPDATE for an operator;
+    - update followed by delete is replaced by the latter.
+
+    Returns False if the two notifications cannot be merged.
+    """
+    if pending.action == CREATE:
+        if notification.action == DELETE:
+            return notification
+        if notification.action == UPDATE:
+            if notification.changes is None:
+                return pending._replace(text=notification.text)
+            return pending._replace(
+                text="%s\nChanged since the request:\n%s" % (
+                    pending.text.rstrip("\n"), notification.text))
+    elif pending.action == UPDATE:
+        if (notification.action == UPDATE and
+                pending.changes is not None and
+                notification.changes is not None):
+            changes = diff.merge_changes(pending.changes,
+                                         notification.changes)
+            text = (diff.format_changes(changes) or
+                    "No change since the previous request\n")
+            return notification._replace(text=text, changes=changes)
+        if notification.action in (UPDATE, DELETE):
+            return notification
+    return False
+
+
+class DigestBuffer(object):
+    """Collect notifications and hand them over in batches.
+
+    A batch is handed to flush_func, from a background thread, window
+    seconds after the first notification in it was added, or as soon as it
+    contains max_events notifications.
+
+    If coalescing is enabled, pending notifications are keyed by resource
+    type and identifier, and a notification superseding a pending one for
+    the same resource is merged with it (see coalesce).
+    """
+
+    def __init__(self, flush_func, window=2.0, max_events=100,
+                 coalescing=True):
+        self._flush = flush_func
+        self.window = window
+        self.max_events = max_events
+        self.coalescing = coalescing
+        # Notifications which are not coalesced get an unique key
+        self._pending = collections.OrderedDict()
+        self._sequence = 0
+        self._first_added = None
+        self._stats = collections.Counter()
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='hdn-digest')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _key(self, notification):
+        if (self.coalescing and notification.resource_id and
+                notification.action in (CREATE, UPDATE, DELETE)):
+            return notification.resource, notification.resource_id
+        self._sequence += 1
+        return self._sequence
+
+    def add(self, notification):
+        with self._cond:
+            self._stats['added'] += 1
+            key = self._key(notification)
+            pending = self._pending.get(key)
+            if pending is not None:
+                merged = coalesce(pending, notification)
+                if merged is not False:
+                    self._pending[key] = merged
+                    self._stats['elided'] += 1
+                    return
+                # Keep both, the new one under a key of its own
+                key = self._sequence = self._sequence + 1
+            if not self._pending:
+                self._first_added = time.time()
+            self._pending[key] = notification
+            self._cond.notify_all()
+
+    def _take_batch(self):
+        with self._cond:
+            while self._running:
+                if self._pending:
+                    remaining = self._first_added + self.window - time.time()
+                    if (remaining <= 0 or
+                            len(self._pending) >= self.max_events):
+                        break
+                    self._cond.wait(remaining)
+                else:
+                    self._cond.wait()
+            batch = []
+            while self._pending and len(batch) < self.max_events:
+                batch.append(self._pending.popitem(last=False)[1])
+            if self._pending:
+                self._first_added = time.time()
+            self._stats['flushed'] += len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                try:
+                    self._flush(batch)
+                except Exception:
+                    LOG.exception("Unable to send digest of %d "
+                                  "notifications", len(batch))
+            elif not self._running:
+                return
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+    def stop(self, timeout=None):
+        """Flush pending notifications and stop the background thread."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join(timeout)
@@ -0,0 +1,169 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import threading
+import time
+
+from oslo_log import log
+
+from hdn.common import exceptions
+
+LOG = log.getLogger(__name__)
+
+POLICY_BLOCK = 'block'
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_FAIL = 'fail'
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_FAIL)
+
+
+class NotificationDispatcher(object):
+    """Deliver notifications from a bounded queue with worker threads.
+
+    Notifications are put on the queue by API workers, and delivered by
+    a pool of worker threads (green threads when running in neutron-server)
+    which invoke deliver_func for each of them. When the queue is full the
+    backpressure policy decides what happens to a new notification:
+
+    - block: wait up to block_timeout seconds for room in the queue, then
+      fail the request.
+    - drop_oldest: discard the notification which has been waiting for
+      the longest time.
+    - fail: fail the request immediately.
+    """
+
+    def __init__(self, deliver_func, queue_size=1000, workers=2,
+                 policy=POLICY_BLOCK, block_timeout=10):
+        if policy not in POLICIES:
+            raise ValueError("Invalid backpressure policy: %s" % policy)
+        self._deliver = deliver_func
+        self.queue_size = queue_size
+        self.policy = policy
+        self.block_timeout = block_timeout
+        # Items are (enqueued_at, args) tuples
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._running = True
+        self._busy = 0
+        self._stats = collections.Counter()
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._run,
+                                      name='hdn-dispatcher-%d' % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def put(self, *args):
+        """Queue a notification for delivery.
+
+        Raises NotificationQueueFull if the backpressure policy rejects it.
+        """
+        with self._cond:
+            if len(self._queue) >= self.queue_size:
+                if self.policy == POLICY_DROP_OLDEST:
+                    self._queue.popleft()
+                    self._stats['dropped'] += 1
+                    LOG.warning("Notification queue full, dropped oldest "
+                                "notification")
+                elif self.policy == POLICY_BLOCK:
+                    deadline = time.time() + self.block_timeout
+                    while len(self._queue) >= self.queue_size:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                if len(self._queue) >= self.queue_size:
+                    self._stats['rejected'] += 1
+                    raise exceptions.NotificationQueueFull()
+            self._queue.append((time.time(), args))
+            self._stats['enqueued'] += 1
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                enqueued_at, args = self._queue.popleft()
+                self._busy += 1
+                self._cond.notify_all()
+            lag = time.time() - enqueued_at
+            outcome = 'failed'
+            try:
+                self._deliver(*args)
+                outcome = 'delivered'
+            except Exception:
+                LOG.exception("Unable to deliver notification")
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._stats[outcome] += 1
+                    self._last_lag = lag
+                    self._max_lag = max(self._max_lag, lag)
+                    self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until all queued notifications have been delivered."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._queue or self._busy:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=None):
+        """Stop the workers once the queue has been drained.
+
+        Waits up to timeout seconds in total for the workers to end.
+        Returns False if some of them are still delivering notifications.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for worker in self._workers:
+            if deadline is None:
+                worker.join()
+            else:
+                worker.join(max(deadline - time.time(), 0))
+        if any(worker.is_alive() for worker in self._workers):
+            with self._cond:
+                LOG.warning("Notification workers did not stop within "
+                            "%(timeout)s seconds, %(queued)d notifications "
+                            "not delivered",
+                            {'timeout': timeout,
+                             'queued': len(self._queue) + self._busy})
+            return False
+        return True
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['queue_depth'] = len(self._queue)
+            stats['in_flight'] = self._busy
+            stats['oldest_lag'] = (self._queue and
+                                   time.time() - self._queue[0][0] or 0.0)
+            stats['last_lag'] = self._last_lag
+            stats['max_lag'] = self._max_lag
+        return stats
@@ -0,0 +1,185 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+import heapq
+import time
+
+from oslo_config import cfg
+from oslo_log import log
+from oslo_utils import timeutils
+
+from hdn.common import hdnlib
+from hdn.common import metrics
+from hdn.common import utils
+from hdn.db import tasks_db
+
+LOG = log.getLogger(__name__)
+
+LEASE_NAME = 'hdn-task-escalator'
+
+# Runs between full reloads of the upcoming escalations, which pick up
+# tasks rescheduled earlier than the ones already loaded
+RESYNC_RUNS = 60
+
+
+class Escalator(utils.LeasedJob):
+    """Escalate the tasks which missed their deadline.
+
+    The escalations due within the next horizon seconds are kept in a
+    min-heap. Every run only reads from the database the escalations
+    which entered the horizon since the previous run, following the
+    escalate_at index from where the previous read stopped, so that the
+    cost of a run does not depend on the number of open tasks.
+
+    Tasks due are escalated in batches of batch_size: their priority is
+    raised by priority_step, HDN operators are notified, and they are
+    escalated again every interval seconds until they end. A lease stored
+    in the database ensures that a single server runs the escalator at any
+    time.
+    """
+
+    lease_name = LEASE_NAME
+
+    def __init__(self, interval=3600, priority_step=1, horizon=120,
+                 batch_size=500, lease_duration=300):
+        super(Escalator, self).__init__(lease_duration)
+        self.interval = interval
+        self.priority_step = priority_step
+        self.horizon = horizon
+        self.batch_size = batch_size
+        self._reset()
+
+    def _reset(self):
+        # (escalate_at, id) tuples, and the escalation time of each task
+        # in the heap, as entries are not removed when tasks are escalated
+        self._heap = []
+        self._scheduled = {}
+        # Every escalation up to this (escalate_at, id) tuple is loaded
+        self._loaded = None
+        self._runs = 0
+
+    def _push(self, escalate_at, task_id):
+        if self._scheduled.get(task_id) != escalate_at:
+            self._scheduled[task_id] = escalate_at
+            heapq.heappush(self._heap, (escalate_at, task_id))
+
+    def _load(self, session, until):
+        """Add the escalations due before until to the heap."""
+        loaded = 0
+        while True:
+            rows = tasks_db.get_escalations(session, until, self.batch_size,
+                                            after=self._loaded)
+            for escalate_at, task_id in rows:
+                self._push(escalate_at, task_id)
+            loaded += len(rows)
+            if len(rows) < self.batch_size:
+                # Escalations at until itself are read by the next run
+                self._loaded = (until, '')
+                return loaded
+            self._loaded = rows[-1]
+
+    def _pop_due(self, now):
+        task_ids = []
+        while (self._heap and self._heap[0][0] <= now and
+               len(task_ids) < self.batch_size):
+            escalate_at, task_id = heapq.heappop(self._heap)
+            # Skip entries superseded by a later push
+            if self._scheduled.get(task_id) == escalate_at:
+                del self._scheduled[task_id]
+                task_ids.append(task_id)
+        return task_ids
+
+    def _escalate(self, session, task_ids, now):
+        with session.begin(subtransactions=True):
+            tasks = tasks_db.escalate_tasks(session, task_ids, now,
+                                            self.interval,
+                                            self.priority_step)
+            if tasks:
+                hdnlib.notify_tasks_overdue(tasks, session=session)
+        escalate_at = now + datetime.timedelta(seconds=self.interval)
+        for task in tasks:
+            # Only escalations up to the loaded one are pushed, the others
+            # will be read from the database
+            if (escalate_at, task['id']) <= self._loaded:
+                self._push(escalate_at, task['id'])
+        return tasks
+
+    def lease_lost(self):
+        # The leader may change the tasks, the heap is reloaded once the
+        # lease is taken back
+        self._reset()
+
+    def run_leader(self, session):
+        start = time.time()
+        if self._runs >= RESYNC_RUNS:
+            self._reset()
+        self._runs += 1
+        now = timeutils.utcnow()
+        loaded = self._load(session,
+                            now + datetime.timedelta(seconds=self.horizon))
+        task_ids = self._pop_due(now)
+        escalated = self._escalate(session, task_ids, now)
+        metrics.REGISTRY.inc('tasks_escalated_total', len(escalated))
+        elapsed = time.time() - start
+        self._stats['escalated'] += len(escalated)
+        self._stats['runs'] += 1
+        self._last_run = {'leader': True,
+                          'loaded': loaded,
+                          'escalated': len(escalated),
+                          'scheduled': len(self._scheduled),
+                          'seconds': elapsed}
+        if escalated:
+            LOG.info("Escalated %(escalated)d overdue tasks in "
+                     "%(elapsed).1f seconds",
+                     {'escalated': len(escalated), 'elapsed': elapsed})
+        # A full batch means more tasks might be due already
+        return len(task_ids) == self.batch_size
+
+
+def _make_escalator():
+    conf = cfg.CONF.HDN
+    return Escalator(
+        interval=conf.task_escalation_interval,
+        priority_step=conf.task_escalation_priority_step,
+        # Escalations due before the next run are loaded ahead
+        horizon=2 * conf.task_escalation_scan_interval,
+        batch_size=conf.task_escalation_batch_size,
+        lease_duration=conf.task_escalation_lease_duration)
+
+
+_runner = utils.LeasedJobRunner(
+    'hdn-task-escalator', _make_escalator,
+    lambda: cfg.CONF.HDN.task_escalation_scan_interval,
+    gauges={'tasks_escalations_scheduled': 'last_run_scheduled'})
+
+
+def start_escalator():
+    """Start the task escalator in the current process, if enabled.
+
+    Every server runs its own worker, but only the one holding the lease
+    escalates tasks.
+    """
+    return _runner.start()
+
+
+def get_stats():
+    """Return counters of the task escalator."""
+    return _runner.get_stats()
+
+
+def stop_escalator():
+    """Stop the escalator and let another server take over right away."""
+    _runner.stop()
@@ -0,0 +1,30 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.common import exceptions as n_exc
+
+
+class NotificationQueueFull(n_exc.ServiceUnavailable):
+    message = _("Too many pending requests for HDN operators, please retry "
+                "later")
+
+
+class TaskNotFound(n_exc.NotFound):
+    message = _("HDN task %(task_id)s could not be found")
+
+
+class TaskBlocked(n_exc.Conflict):
+    message = _("HDN task %(task_id)s is waiting for %(blockers)d other "
+                "tasks to end")
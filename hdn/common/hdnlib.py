@@ -14,31 +14,504 @@
 #    License for the specific language governing permissions and limitations
 #    under the License
 
-from email.mime import multipart
-from email.mime import text as mimetext
+import atexit
 import itertools
-import smtplib
+import os
+import threading
 
+from neutron import context as n_context
 from oslo_config import cfg
-
-
-def send_mail(subject, text):
-    msg = multipart.MIMEMultipart()
-    msg['From'] = cfg.CONF.HDN.smtp_user
-    msg['To'] = ",".join(cfg.CONF.HDN.recipients)
-    msg['Subject'] = subject
-    msg.attach(mimetext.MIMEText(text))
-    mailServer = smtplib.SMTP(cfg.CONF.HDN.smtp_server,
-                              cfg.CONF.HDN.smtp_port)
-    mailServer.ehlo()
-    mailServer.starttls()
-    mailServer.ehlo()
-    mailServer.login(cfg.CONF.HDN.smtp_user,
-                     cfg.CONF.HDN.smtp_password)
-    mailServer.sendmail(cfg.CONF.HDN.smtp_user,
-                        cfg.CONF.HDN.recipients,
-                        msg.as_string())
-    mailServer.close()
+from oslo_log import log
+from stevedore import driver
+from stevedore import named
+
+from hdn.common import breaker
+from hdn.common import diff
+from hdn.common import digest
+from hdn.common import dispatcher
+from hdn.common import metrics
+from hdn.common import smtppool
+from hdn.common import utils
+from hdn.db import hooks
+from hdn.db import outbox_db
+
+LOG = log.getLogger(__name__)
+
+DRIVER_NAMESPACE = 'hdn.notification_drivers'
+METRICS_NAMESPACE = 'hdn.metrics_exporters'
+
+_driver = None
+_driver_lock = threading.Lock()
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+_outbox_drainer = None
+_outbox_drainer_pid = None
+_outbox_lock = threading.Lock()
+_digest = None
+_digest_lock = threading.Lock()
+_breaker = None
+_spool = None
+_prober = None
+_prober_pid = None
+_breaker_lock = threading.Lock()
+_metrics_exporters = None
+_metrics_worker = None
+_metrics_pid = None
+_metrics_lock = threading.Lock()
+# Functions starting the background jobs of the loaded plugins
+_job_starters = []
+
+
+def _get_driver():
+    global _driver
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                _driver = driver.DriverManager(
+                    DRIVER_NAMESPACE,
+                    cfg.CONF.HDN.notification_driver,
+                    invoke_on_load=True).driver
+                LOG.debug("Loaded notification driver %s",
+                          cfg.CONF.HDN.notification_driver)
+    return _driver
+
+
+def _get_breaker():
+    """Return the transport circuit breaker, or None if it is disabled.
+
+    The background probe which recovers the transport and drains the spool
+    is started along with the breaker, once per process.
+    """
+    global _breaker, _spool, _prober, _prober_pid
+    conf = cfg.CONF.HDN
+    if conf.breaker_failure_threshold <= 0:
+        return None
+    if _prober_pid != os.getpid():
+        with _breaker_lock:
+            if _prober_pid != os.getpid():
+                if _breaker is None:
+                    _breaker = breaker.CircuitBreaker(
+                        failure_threshold=conf.breaker_failure_threshold,
+                        reset_timeout=conf.breaker_reset_timeout)
+                    _spool = breaker.Spool(conf.notification_spool_dir)
+                _prober = utils.PeriodicWorker(
+                    probe_transport, conf.breaker_reset_timeout,
+                    name='hdn-transport-probe').start()
+                _prober_pid = os.getpid()
+    return _breaker
+
+
+def probe_transport():
+    """Test a tripped transport and send spooled notifications.
+
+    Spooled notifications are sent, oldest first, only while the breaker
+    is closed or probing. The first of them serves as the probe; if none is
+    spooled the driver is checked instead. Notifications rejected for good
+    are set aside, and the probe goes on with the next one.
+    """
+    if not _breaker.attempt_reset():
+        return False
+    names = _spool.names()
+    if not names and _breaker.state == breaker.STATE_HALF_OPEN:
+        try:
+            _get_driver().check()
+        except Exception:
+            _breaker.record_failure()
+            return False
+        _breaker.record_success()
+    for name in names:
+        try:
+            subject, text = _spool.get(name)
+        except (IOError, OSError):
+            # Already sent by another server
+            continue
+        try:
+            _get_driver().send(subject, text)
+        except Exception as e:
+            if not smtppool.is_permanent_failure(e):
+                LOG.debug("Unable to send spooled notification %s", name)
+                _breaker.record_failure()
+                return False
+            # The transport answered, only this message is at fault
+            _reject(subject, text, e)
+        _breaker.record_success()
+        _spool.remove(name)
+    return False
+
+
+def _get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                conf = cfg.CONF.HDN
+                _dispatcher = dispatcher.NotificationDispatcher(
+                    _deliver_mail,
+                    queue_size=conf.notification_queue_size,
+                    workers=conf.notification_workers,
+                    policy=conf.notification_queue_full_policy,
+                    block_timeout=conf.notification_queue_block_timeout)
+                atexit.register(shutdown)
+    return _dispatcher
+
+
+def _get_digest():
+    global _digest
+    if _digest is None:
+        with _digest_lock:
+            if _digest is None:
+                _digest = digest.DigestBuffer(
+                    _deliver_digest,
+                    window=cfg.CONF.HDN.digest_window,
+                    max_events=cfg.CONF.HDN.digest_max_events,
+                    coalescing=cfg.CONF.HDN.coalesce_notifications)
+                atexit.register(shutdown)
+    return _digest
+
+
+def _send_outbox_messages(messages):
+    """Send messages taken from the outbox, returning the ids of sent ones."""
+    if not messages:
+        return []
+    if cfg.CONF.HDN.notification_digest:
+        # The batch claimed from the outbox is sent as a digest
+        try:
+            _deliver_digest([digest.Notification(None, None, None,
+                                                 message.subject,
+                                                 message.body)
+                             for message in messages])
+        except Exception:
+            LOG.exception("Unable to send digest of %d notifications from "
+                          "outbox", len(messages))
+            return []
+        return [message.id for message in messages]
+    try:
+        results = send_mails([(message.subject, message.body)
+                              for message in messages])
+    except Exception:
+        LOG.exception("Unable to send %d notifications from outbox",
+                      len(messages))
+        return []
+    # The claim on the others will expire and they will be sent again
+    return [message.id for message, result in zip(messages, results)
+            if result is None]
+
+
+def drain_outbox():
+    """Send a batch of notifications from the outbox.
+
+    Returns True if a full batch was processed, meaning there might be more
+    messages waiting in the outbox.
+    """
+    conf = cfg.CONF.HDN
+    session = n_context.get_admin_context().session
+    messages = outbox_db.claim_messages(session, conf.outbox_batch_size,
+                                        conf.outbox_claim_timeout)
+    outbox_db.mark_sent(session, _send_outbox_messages(messages))
+    if len(messages) < conf.outbox_batch_size:
+        outbox_db.purge_sent(session, conf.outbox_retention)
+        return False
+    return True
+
+
+def start_outbox_drainer():
+    """Start sending notifications stored in the outbox, if enabled.
+
+    The drainer is bound to the process which started it, so that every
+    API worker forked by neutron-server runs its own.
+    """
+    global _outbox_drainer, _outbox_drainer_pid
+    if not cfg.CONF.HDN.notification_outbox:
+        return None
+    with _outbox_lock:
+        if _outbox_drainer_pid != os.getpid():
+            _outbox_drainer = utils.PeriodicWorker(
+                drain_outbox, cfg.CONF.HDN.outbox_poll_interval,
+                name='hdn-outbox').start()
+            _outbox_drainer_pid = os.getpid()
+    return _outbox_drainer
+
+
+def _load_exporters():
+    global _metrics_exporters
+    _metrics_exporters = named.NamedExtensionManager(
+        METRICS_NAMESPACE, names=cfg.CONF.HDN.metrics_exporters,
+        invoke_on_load=True, name_order=True)
+    for exporter in _metrics_exporters:
+        exporter.obj.start(metrics.REGISTRY)
+    registry = metrics.REGISTRY
+    registry.register_gauge(
+        'dispatch_queue_depth',
+        lambda: get_dispatch_stats().get('queue_depth', 0))
+    registry.register_gauge(
+        'dispatch_oldest_lag_seconds',
+        lambda: get_dispatch_stats().get('oldest_lag', 0.0))
+    registry.register_gauge(
+        'digest_pending', lambda: get_digest_stats().get('pending', 0))
+    registry.register_gauge(
+        'spool_size', lambda: len(_spool) if _spool is not None else 0)
+    registry.register_gauge(
+        'breaker_open', lambda: int(_breaker is not None and
+                                    _breaker.state != breaker.STATE_CLOSED))
+    LOG.debug("Loaded metrics exporters %s", _metrics_exporters.names())
+
+
+def _export_metrics():
+    for exporter in _metrics_exporters:
+        exporter.obj.export(metrics.REGISTRY)
+
+
+def start_metrics():
+    """Start exporting notification metrics, if exporters are configured.
+
+    Exporters are loaded once from the hdn.metrics_exporters namespace, and
+    invoked every metrics_export_interval seconds by a worker bound to the
+    current process.
+    """
+    global _metrics_worker, _metrics_pid
+    if _metrics_pid == os.getpid() or not cfg.CONF.HDN.metrics_exporters:
+        return _metrics_worker
+    with _metrics_lock:
+        if _metrics_pid != os.getpid():
+            if _metrics_exporters is None:
+                _load_exporters()
+            _metrics_worker = utils.PeriodicWorker(
+                _export_metrics, cfg.CONF.HDN.metrics_export_interval,
+                name='hdn-metrics').start()
+            _metrics_pid = os.getpid()
+    return _metrics_worker
+
+
+def register_job(start):
+    """Have start called by every process sending notifications.
+
+    start launches a background job bound to the current process, and
+    must return right away once the job runs in this process.
+    """
+    if start not in _job_starters:
+        _job_starters.append(start)
+
+
+def start_jobs():
+    """Start metrics and the registered jobs in the current process.
+
+    API workers forked by neutron-server after the plugins are loaded
+    start them when sending their first notification, as every request
+    changing resources does.
+    """
+    start_metrics()
+    for start in _job_starters:
+        start()
+
+
+def get_dispatch_stats():
+    """Return queue depth, dispatch lag and counters for async dispatch."""
+    if _dispatcher is None:
+        return {}
+    return _dispatcher.get_stats()
+
+
+def get_digest_stats():
+    """Return pending, flushed and elided notification counters."""
+    if _digest is None:
+        return {}
+    return _digest.get_stats()
+
+
+def get_transport_stats():
+    """Return transport statistics, breaker state and spooled messages."""
+    stats = _driver.get_stats() if _driver else {}
+    if _breaker is not None:
+        stats.update({'breaker_state': _breaker.state,
+                      'consecutive_failures': _breaker.failures,
+                      'spool_size': len(_spool)})
+    return stats
+
+
+def close_driver():
+    """Release resources, such as SMTP sessions, held by the driver."""
+    global _driver
+    with _driver_lock:
+        notification_driver, _driver = _driver, None
+    if notification_driver:
+        notification_driver.close()
+
+
+def shutdown():
+    """Deliver queued notifications and release SMTP sessions."""
+    global _digest, _dispatcher, _outbox_drainer, _outbox_drainer_pid
+    global _prober, _prober_pid, _metrics_worker, _metrics_pid
+    with _digest_lock:
+        digest_buffer, _digest = _digest, None
+    timeout = cfg.CONF.HDN.notification_shutdown_timeout
+    if digest_buffer:
+        digest_buffer.stop(timeout)
+    with _outbox_lock:
+        drainer, _outbox_drainer = _outbox_drainer, None
+        _outbox_drainer_pid = None
+    if drainer:
+        drainer.stop()
+    with _dispatcher_lock:
+        notification_dispatcher, _dispatcher = _dispatcher, None
+    if notification_dispatcher:
+        notification_dispatcher.stop(timeout)
+    with _breaker_lock:
+        prober, _prober = _prober, None
+        _prober_pid = None
+    if prober:
+        prober.stop()
+    close_driver()
+    with _metrics_lock:
+        metrics_worker, _metrics_worker = _metrics_worker, None
+        _metrics_pid = None
+    if metrics_worker:
+        metrics_worker.stop()
+        # Export what was recorded since the last run
+        _export_metrics()
+
+
+def _reject(subject, text, error):
+    LOG.error("Notification %(subject)s rejected, storing it in %(path)s: "
+              "%(err)s", {'subject': subject, 'path': _spool.rejected_path,
+                          'err': error})
+    _spool.put_rejected(subject, text, error)
+    metrics.REGISTRY.inc('notifications_rejected_total')
+
+
+def send_mails(messages):
+    """Deliver several notifications at once.
+
+    messages is a list of (subject, text) tuples. Drivers which support it,
+    such as the SMTP one, send all of them over a single session. Returns,
+    for each message, None if it was delivered, spooled because the
+    transport is failing, or set aside because it was rejected for good,
+    and otherwise the exception which prevented its delivery.
+
+    Only connection errors and transient (4xx) replies count as failures
+    of the transport and get the message spooled.
+    """
+    transport_breaker = _get_breaker()
+    if transport_breaker is None:
+        try:
+            results = _get_driver().send_batch(messages)
+        except Exception:
+            metrics.REGISTRY.inc('transport_failures_total', len(messages))
+            raise
+        failures = len([result for result in results if result is not None])
+        if failures:
+            metrics.REGISTRY.inc('transport_failures_total', failures)
+        return results
+    if not transport_breaker.allow():
+        # Do not wait for a transport which is known to be failing
+        for subject, text in messages:
+            _spool.put(subject, text)
+        metrics.REGISTRY.inc('notifications_spooled_total', len(messages))
+        return [None] * len(messages)
+    try:
+        results = _get_driver().send_batch(messages)
+    except Exception as e:
+        results = [e] * len(messages)
+    failed = []
+    for (subject, text), result in zip(messages, results):
+        if result is None:
+            continue
+        if smtppool.is_permanent_failure(result):
+            _reject(subject, text, result)
+        else:
+            failed.append(((subject, text), result))
+    if failed:
+        metrics.REGISTRY.inc('transport_failures_total', len(failed))
+        LOG.warning("Unable to send %(count)d notifications, spooling "
+                    "them: %(err)s",
+                    {'count': len(failed), 'err': failed[0][1]})
+        transport_breaker.record_failure()
+        for (subject, text), _result in failed:
+            _spool.put(subject, text)
+        metrics.REGISTRY.inc('notifications_spooled_total', len(failed))
+    else:
+        transport_breaker.record_success()
+    return [None] * len(messages)
+
+
+def _deliver_mail(subject, text, function=None):
+    try:
+        result = send_mails([(subject, text)])[0]
+        if result is not None:
+            raise result
+    except Exception:
+        if function:
+            # Delivered by a dispatcher worker, count it here
+            metrics.REGISTRY.inc('notification_failures_total',
+                                 function=function)
+        raise
+
+
+def _deliver_digest(notifications):
+    results = send_mails(digest.format_digest(
+        notifications, cfg.CONF.HDN.digest_max_size))
+    for result in results:
+        if result is not None:
+            raise result
+
+
+def _function_name(resource, action):
+    """Return the name of the notify_* function, used to label metrics."""
+    if resource is None:
+        return 'send_mail'
+    return 'notify_%s_%s' % (resource, action)
+
+
+def _dispatch(notification):
+    function = _function_name(notification.resource, notification.action)
+    try:
+        if cfg.CONF.HDN.notification_digest:
+            _get_digest().add(notification)
+        elif cfg.CONF.HDN.async_notifications:
+            _get_dispatcher().put(notification.subject, notification.text,
+                                  function)
+        else:
+            _deliver_mail(notification.subject, notification.text)
+    except Exception:
+        metrics.REGISTRY.inc('notification_failures_total',
+                             function=function)
+        raise
+
+
+def _notify(resource, action, resource_id, subject, text, session=None,
+            changes=None):
+    """Notify HDN operators.
+
+    When session is given the notification is bound to the transaction in
+    progress: with the outbox enabled it is stored within the transaction,
+    otherwise it is sent once the transaction commits. In both cases it is
+    discarded if the transaction is rolled back.
+    """
+    start_jobs()
+    function = _function_name(resource, action)
+    metrics.REGISTRY.inc('notifications_total', function=function)
+    metrics.REGISTRY.observe('notification_size_chars',
+                             len(subject) + len(text),
+                             buckets=metrics.SIZE_BUCKETS, function=function)
+    with metrics.REGISTRY.timer('notify_seconds', function=function):
+        if session is not None and cfg.CONF.HDN.notification_outbox:
+            try:
+                outbox_db.add_message(session, subject, text)
+            except Exception:
+                metrics.REGISTRY.inc('notification_failures_total',
+                                     function=function)
+                raise
+            hooks.call_after_commit(session, start_outbox_drainer().wake)
+            return
+        notification = digest.Notification(resource, resource_id, action,
+                                           subject, text, changes)
+        if session is None:
+            _dispatch(notification)
+        else:
+            hooks.call_after_commit(session, _dispatch, notification)
+
+
+def send_mail(subject, text, session=None):
+    _notify(None, None, None, subject, text, session=session)
 
 
 def _prepare_message(data):
@@ -52,90 +525,137 @@ def _prepare_message(data):
     return "".join(message_lines)
 
 
-def notify_network_create(network_data):
+def _notify_bulk_create(resource, items, session=None):
+    # A single notification for all the resources created by a bulk request
+    subject = "[HDN] Create %d %ss request" % (len(items), resource)
+    text = "\n".join(_prepare_message(item) for item in items)
+    _notify(resource, 'bulk_create', None, subject, text, session=session)
+
+
+def _notify_update(resource, data, changes, session=None):
+    # Only the attributes which changed are sent when they are known
+    subject = "[HDN] Update %s request:%s" % (resource, data['id'])
+    if changes is None:
+        text = _prepare_message(data)
+    else:
+        text = diff.format_changes(changes)
+    _notify(resource, 'update', data['id'], subject, text,
+            session=session, changes=changes)
+
+
+def notify_network_create(network_data, session=None):
     subject = "[HDN] Create network request:%s" % network_data['id']
-    send_mail(subject, _prepare_message(network_data))
+    _notify('network', 'create', network_data['id'], subject,
+            _prepare_message(network_data), session=session)
+
 
+def notify_network_bulk_create(networks_data, session=None):
+    _notify_bulk_create('network', networks_data, session=session)
 
-def notify_network_delete(network_data):
+
+def notify_network_delete(network_data, session=None):
     subject = "[HDN] Delete network request:%s" % network_data['id']
     message = "Request coming from tenant:%s" % network_data['tenant_id']
-    send_mail(subject, message)
+    _notify('network', 'delete', network_data['id'], subject,
+            message, session=session)
 
 
-def notify_port_create(port_data):
+def notify_port_create(port_data, session=None):
     subject = "[HDN] Create port request:%s" % port_data['id']
-    send_mail(subject, _prepare_message(port_data))
+    _notify('port', 'create', port_data['id'], subject,
+            _prepare_message(port_data), session=session)
+
 
+def notify_port_bulk_create(ports_data, session=None):
+    _notify_bulk_create('port', ports_data, session=session)
 
-def notify_port_update(port_data):
-    subject = "[HDN] Update port request:%s" % port_data['id']
-    send_mail(subject, _prepare_message(port_data))
 
+def notify_port_update(port_data, changes=None, session=None):
+    _notify_update('port', port_data, changes, session=session)
 
-def notify_port_delete(port_data):
+
+def notify_port_delete(port_data, session=None):
     subject = "[HDN] Delete port request:%s" % port_data['id']
     message = "Request coming from tenant:%s" % port_data['tenant_id']
-    send_mail(subject, message)
+    _notify('port', 'delete', port_data['id'], subject,
+            message, session=session)
 
 
-def notify_subnet_create(subnet_data):
+def notify_subnet_create(subnet_data, session=None):
     subject = "[HDN] Create subnet request:%s" % subnet_data['id']
-    send_mail(subject, _prepare_message(subnet_data))
+    _notify('subnet', 'create', subnet_data['id'], subject,
+            _prepare_message(subnet_data), session=session)
+
 
+def notify_subnet_bulk_create(subnets_data, session=None):
+    _notify_bulk_create('subnet', subnets_data, session=session)
 
-def notify_subnet_update(subnet_data):
-    subject = "[HDN] Update subnet request:%s" % subnet_data['id']
-    send_mail(subject, _prepare_message(subnet_data))
 
+def notify_subnet_update(subnet_data, changes=None, session=None):
+    _notify_update('subnet', subnet_data, changes, session=session)
 
-def notify_subnet_delete(subnet_data):
+
+def notify_subnet_delete(subnet_data, session=None):
     subject = "[HDN] Delete subnet request:%s" % subnet_data['id']
     message = "Request coming from tenant:%s" % subnet_data['tenant_id']
-    send_mail(subject, message)
+    _notify('subnet', 'delete', subnet_data['id'], subject,
+            message, session=session)
 
 
-def notify_router_create(router_data):
+def notify_router_create(router_data, session=None):
     subject = "[HDN] Create router request:%s" % router_data['id']
-    send_mail(subject, _prepare_message(router_data))
+    _notify('router', 'create', router_data['id'], subject,
+            _prepare_message(router_data), session=session)
 
 
-def notify_router_update(router_data):
-    subject = "[HDN] Update router request:%s" % router_data['id']
-    send_mail(subject, _prepare_message(router_data))
+def notify_router_update(router_data, changes=None, session=None):
+    _notify_update('router', router_data, changes, session=session)
 
 
-def notify_router_delete(router_data):
+def notify_router_delete(router_data, session=None):
     subject = "[HDN] Delete router request:%s" % router_data['id']
     message = "Request coming from tenant:%s" % router_data['tenant_id']
-    send_mail(subject, message)
+    _notify('router', 'delete', router_data['id'], subject,
+            message, session=session)
 
 
-def notify_router_interface_add(router_data):
+def notify_router_interface_add(router_data, session=None):
     subject = "[HDN] Add router interface request:%s" % router_data['id']
     message = "Request coming from tenant:%s" % router_data['tenant_id']
-    send_mail(subject, message)
+    _notify('router', 'interface_add', router_data['id'], subject,
+            message, session=session)
 
 
-def notify_router_interface_remove(router_data):
+def notify_router_interface_remove(router_data, session=None):
     subject = "[HDN] Remove router interface request:%s" % router_data['id']
     message = "Request coming from tenant:%s" % router_data['tenant_id']
-    send_mail(subject, message)
+    _notify('router', 'interface_remove', router_data['id'], subject,
+            message, session=session)
 
 
-def notify_floatingip_update_association(floatingip_data):
+def notify_floatingip_update_association(floatingip_data, session=None):
     subject = ("[HDN] Floating IP association updated for:%s" %
                floatingip_data['id'])
-    send_mail(subject, _prepare_message(floatingip_data))
+    _notify('floatingip', 'update_association', floatingip_data['id'], subject,
+            _prepare_message(floatingip_data), session=session)
 
 
-def notify_floatingip_disassociate(floatingip_data):
+def notify_floatingip_disassociate(floatingip_data, session=None):
     subject = ("[HDN] Floating IP disassociated:%s" %
                floatingip_data['id'])
-    send_mail(subject, _prepare_message(floatingip_data))
+    _notify('floatingip', 'disassociate', floatingip_data['id'], subject,
+            _prepare_message(floatingip_data), session=session)
 
 
-def notify_floatingip_delete(floatingip_data):
+def notify_floatingip_delete(floatingip_data, session=None):
     subject = "[HDN] Delete floating ip request:%s" % floatingip_data['id']
     message = "Request coming from tenant:%s" % floatingip_data['tenant_id']
-    send_mail(subject, message)
+    _notify('floatingip', 'delete', floatingip_data['id'], subject,
+            message, session=session)
+
+
+def notify_tasks_overdue(tasks, session=None):
+    # A single notification for all the tasks escalated together
+    subject = "[HDN] %d tasks overdue" % len(tasks)
+    text = "\n".join(_prepare_message(task) for task in tasks)
+    _notify('task', 'overdue', None, subject, text, session=session)
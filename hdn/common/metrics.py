@@ -0,0 +1,253 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-process metrics for the HDN notification pipeline.
+
+Counters and histograms are recorded in a registry, and periodically
+handed to exporters. Exporters may also be notified of every observation,
+as the statsd one is.
+"""
+
+import bisect
+import contextlib
+import errno
+import os
+import socket
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_log import log
+
+LOG = log.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        # The last slot counts observations above the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry(object):
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """Call listener(kind, name, value, labels) on every observation."""
+        self._listeners.append(listener)
+
+    def _notify(self, kind, name, value, labels):
+        for listener in self._listeners:
+            try:
+                listener(kind, name, value, labels)
+            except Exception:
+                LOG.debug("Metrics listener %s failed", listener)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._notify(COUNTER, name, value, labels)
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+        self._notify(HISTOGRAM, name, value, labels)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    def register_gauge(self, name, func):
+        """Register a gauge whose value is read from func when collected.
+
+        func returns either a number, or a list of (labels, value) tuples.
+        """
+        self._gauges[name] = func
+
+    def collect(self):
+        """Return a snapshot as a list of (kind, name, labels, value).
+
+        The value is a Histogram copy for histograms.
+        """
+        samples = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                samples.append((COUNTER, name, labels, value))
+            for (name, labels), histogram in sorted(
+                    self._histograms.items()):
+                snapshot = Histogram(histogram.buckets)
+                snapshot.counts = list(histogram.counts)
+                snapshot.sum = histogram.sum
+                snapshot.count = histogram.count
+                samples.append((HISTOGRAM, name, labels, snapshot))
+        for name, func in sorted(self._gauges.items()):
+            try:
+                value = func()
+            except Exception:
+                LOG.debug("Unable to read gauge %s", name)
+                continue
+            if isinstance(value, list):
+                samples.extend((GAUGE, name, _label_key(labels), item)
+                               for labels, item in value)
+            else:
+                samples.append((GAUGE, name, (), value))
+        return samples
+
+
+REGISTRY = Registry()
+
+
+class MetricsExporter(object):
+    """Base class for exporters loaded from 'hdn.metrics_exporters'."""
+
+    def start(self, registry):
+        """Called once, before the first export."""
+
+    def export(self, registry):
+        """Called every metrics_export_interval seconds."""
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('"', '\\"'))
+                             for key, value in items)
+
+
+def render_prometheus(samples, prefix='hdn_'):
+    """Render samples in the Prometheus text exposition format."""
+    lines = []
+    typed = set()
+    for kind, name, labels, value in samples:
+        metric = prefix + name
+        if metric not in typed:
+            lines.append('# TYPE %s %s' % (metric, kind))
+            typed.add(metric)
+        if kind != HISTOGRAM:
+            lines.append('%s%s %s' % (metric, _format_labels(labels), value))
+            continue
+        cumulative = 0
+        for bound, count in zip(value.buckets + ('+Inf',), value.counts):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (
+                metric, _format_labels(labels, [('le', bound)]), cumulative))
+        lines.append('%s_sum%s %s' % (metric, _format_labels(labels),
+                                      value.sum))
+        lines.append('%s_count%s %d' % (metric, _format_labels(labels),
+                                        value.count))
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusTextFileExporter(MetricsExporter):
+    """Write metrics to a file for the node exporter textfile collector.
+
+    Each process writes its own hdn-<pid>.prom file in
+    metrics_textfile_dir, which is created if needed.
+    """
+
+    def start(self, registry):
+        try:
+            os.makedirs(cfg.CONF.HDN.metrics_textfile_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def export(self, registry):
+        path = os.path.join(cfg.CONF.HDN.metrics_textfile_dir,
+                            'hdn-%d.prom' % os.getpid())
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as textfile:
+            textfile.write(render_prometheus(registry.collect()))
+        os.rename(tmp_path, path)
+
+
+class StatsdExporter(MetricsExporter):
+    """Send every observation to a statsd daemon over UDP.
+
+    Gauges are sent on every export. Label values are appended to the
+    metric name, so that smtp_phase_seconds{phase=connect} becomes
+    hdn.smtp_phase_seconds.connect.
+    """
+
+    def start(self, registry):
+        self._address = (cfg.CONF.HDN.metrics_statsd_host,
+                         cfg.CONF.HDN.metrics_statsd_port)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        registry.add_listener(self._send_observation)
+
+    def _metric_name(self, name, labels):
+        parts = ['hdn', name]
+        # Dots and colons are separators in the statsd protocol
+        parts.extend(str(value).replace('.', '_').replace(':', '_')
+                     for _key, value in _label_key(dict(labels)))
+        return '.'.join(parts)
+
+    def _send(self, line):
+        try:
+            self._socket.sendto(line.encode('utf-8'), self._address)
+        except socket.error:
+            # Metrics must never get in the way of notifications
+            pass
+
+    def _send_observation(self, kind, name, value, labels):
+        metric = self._metric_name(name, labels)
+        if kind == COUNTER:
+            self._send('%s:%s|c' % (metric, value))
+        elif name.endswith('_seconds'):
+            self._send('%s:%.3f|ms' % (metric, value * 1000))
+        else:
+            self._send('%s:%s|h' % (metric, value))
+
+    def export(self, registry):
+        for kind, name, labels, value in registry.collect():
+            if kind == GAUGE:
+                self._send('%s:%s|g' % (self._metric_name(name, labels),
+                                        value))
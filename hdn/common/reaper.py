@@ -0,0 +1,150 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import datetime
+import time
+
+from oslo_config import cfg
+from oslo_log import log
+from oslo_utils import timeutils
+
+from hdn.common import constants
+from hdn.common import metrics
+from hdn.common import utils
+from hdn.db import completion_db
+from hdn.db import pending_db
+
+LOG = log.getLogger(__name__)
+
+LEASE_NAME = 'hdn-reaper'
+
+
+class Reaper(utils.LeasedJob):
+    """Remove resources whose deletion has been pending for too long.
+
+    Resources which have been in PENDING_DELETE for more than grace_period
+    seconds are removed from the database, along with their IP allocations,
+    oldest first. They are processed in batches of batch_size, at no more
+    than rate resources per second. A lease stored in the database ensures
+    that a single server runs the reaper at any time.
+
+    Resources which are still in use, such as networks with ports, are
+    skipped until their dependencies are gone.
+    """
+
+    lease_name = LEASE_NAME
+
+    def __init__(self, batch_size=100, rate=50, grace_period=3600,
+                 lease_duration=300):
+        super(Reaper, self).__init__(lease_duration)
+        self.batch_size = batch_size
+        self.rate = rate
+        self.grace_period = grace_period
+
+    def _reap_batch(self, session, batch):
+        items = [(pending.resource, pending.resource_id,
+                  constants.OUTCOME_DELETED) for pending in batch]
+        with session.begin(subtransactions=True):
+            results, completed = completion_db.complete(session, items)
+            completion_db.notify_completed(session, self, completed)
+            # The resource was removed without completing its request
+            for resource, resource_id, _outcome in [
+                    item for item, result in zip(items, results)
+                    if result == completion_db.RESULT_NOT_FOUND]:
+                pending_db.clear(session, resource, [resource_id])
+        for (resource, _outcome), resource_ids in completed.items():
+            metrics.REGISTRY.inc('reaper_deleted_total', len(resource_ids),
+                                 resource=resource)
+        return results
+
+    def run_leader(self, session):
+        filters = {
+            'statuses': [constants.STATUS_PENDING_DELETE],
+            'resources': list(completion_db.RESOURCE_MODELS),
+            'created_before': timeutils.utcnow() - datetime.timedelta(
+                seconds=self.grace_period)}
+        start = time.time()
+        results = collections.Counter()
+        after = None
+        while True:
+            batch_start = time.time()
+            batch = pending_db.get_pending(session, self.batch_size,
+                                           after=after, **filters)
+            if not batch:
+                break
+            # Reaped resources are gone from the table, the position is
+            # kept rather than the id of the last one
+            after = (batch[-1].created_at, batch[-1].resource_id)
+            results.update(self._reap_batch(session, batch))
+            if len(batch) < self.batch_size:
+                break
+            # Renew the lease while working through a large backlog
+            if not self.renew_lease(session):
+                LOG.warning("Reaper lease lost, stopping")
+                break
+            if self.rate:
+                time.sleep(max(0, len(batch) / float(self.rate) -
+                               (time.time() - batch_start)))
+        elapsed = time.time() - start
+        deleted = results[completion_db.RESULT_COMPLETED]
+        self._stats.update(results)
+        self._stats['runs'] += 1
+        self._last_run = {
+            'leader': True,
+            'deleted': deleted,
+            'in_use': results[completion_db.RESULT_IN_USE],
+            'seconds': elapsed,
+            'throughput': deleted / elapsed if elapsed else 0.0,
+            'backlog': pending_db.count_pending(
+                session, statuses=[constants.STATUS_PENDING_DELETE])}
+        if deleted:
+            LOG.info("Reaper removed %(deleted)d resources in %(elapsed).1f "
+                     "seconds, %(backlog)d deletions pending",
+                     {'deleted': deleted, 'elapsed': elapsed,
+                      'backlog': self._last_run['backlog']})
+        return False
+
+
+def _make_reaper():
+    conf = cfg.CONF.HDN
+    return Reaper(batch_size=conf.reaper_batch_size,
+                  rate=conf.reaper_rate,
+                  grace_period=conf.reaper_grace_period,
+                  lease_duration=conf.reaper_lease_duration)
+
+
+_runner = utils.LeasedJobRunner(
+    'hdn-reaper', _make_reaper, lambda: cfg.CONF.HDN.reaper_interval,
+    gauges={'reaper_backlog': 'last_run_backlog'})
+
+
+def start_reaper():
+    """Start the reaper in the current process, if enabled.
+
+    Every server runs its own worker, but only the one holding the lease
+    removes resources.
+    """
+    return _runner.start()
+
+
+def get_stats():
+    """Return counters, throughput and backlog of the reaper."""
+    return _runner.get_stats()
+
+
+def stop_reaper():
+    """Stop the reaper and let another server take over right away."""
+    _runner.stop()
@@ -0,0 +1,519 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import contextlib
+import itertools
+import smtplib
+import socket
+import threading
+import time
+
+from oslo_log import log
+
+from hdn.common import metrics
+
+LOG = log.getLogger(__name__)
+
+# Reply code sent by a SMTP server which is about to close the channel
+SMTP_SERVICE_NOT_AVAILABLE = 421
+
+ROUND_ROBIN = 'round_robin'
+LEAST_OUTSTANDING = 'least_outstanding'
+
+# Outcome of a message which was not acknowledged by the server yet
+_UNSENT = object()
+
+
+def _is_disconnect(exc):
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code == SMTP_SERVICE_NOT_AVAILABLE
+    # On Python 3 SMTPException is a subclass of socket.error
+    return (isinstance(exc, socket.error) and
+            not isinstance(exc, smtplib.SMTPException))
+
+
+def _is_transient(exc):
+    # Failures for which another relay might succeed
+    if _is_disconnect(exc):
+        return True
+    return (isinstance(exc, smtplib.SMTPResponseException) and
+            400 <= exc.smtp_code < 500)
+
+
+def is_permanent_failure(exc):
+    """Return True if exc is a rejection which retrying will not overcome.
+
+    That is a 5xx reply, or the refusal of every recipient with one.
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _msg in exc.recipients.values())
+    return (isinstance(exc, smtplib.SMTPResponseException) and
+            exc.smtp_code >= 500)
+
+
+@contextlib.contextmanager
+def _timed(phase, relay):
+    """Record latency and failures of a phase of a SMTP session."""
+    start = time.time()
+    try:
+        yield
+    except Exception:
+        metrics.REGISTRY.inc('smtp_phase_failures_total',
+                             phase=phase, relay=relay)
+        raise
+    finally:
+        metrics.REGISTRY.observe('smtp_phase_seconds', time.time() - start,
+                                 phase=phase, relay=relay)
+
+
+class SMTPSessionPool(object):
+    """A bounded pool of authenticated SMTP sessions.
+
+    Establishing a SMTP session requires a TCP handshake, EHLO, STARTTLS,
+    another EHLO, and LOGIN. The pool keeps sessions open across messages
+    so that this cost is paid only once per session rather than once per
+    message.
+
+    At most max_size sessions are open at any time; callers block when
+    all of them are checked out. Sessions idle for more than idle_timeout
+    seconds are closed when they are checked out, or by reap(), which runs
+    on checkin at most every check_interval seconds. Sessions idle for
+    more than check_interval seconds are probed with NOOP before being
+    handed out. A session which gets disconnected, or receives a 421
+    reply, is discarded and the message is retried once on a fresh
+    session.
+
+    Sessions are opened with smtplib.SMTP, unless a connect callable
+    returning a connected session, such as smtplib.LMTP bound to a socket
+    path, is given.
+    """
+
+    def __init__(self, host, port, user=None, password=None,
+                 starttls=True, max_size=4, idle_timeout=60,
+                 check_interval=10, timeout=30, connect=None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.connect = connect
+        # Idle sessions, as (session, last_used) tuples. Most recently used
+        # sessions are at the right end.
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_reap = time.time()
+        # Label for the metrics of this pool
+        self.relay = '%s:%s' % (host, port)
+
+    def _connect(self):
+        with _timed('connect', self.relay):
+            if self.connect:
+                session = self.connect()
+            else:
+                session = smtplib.SMTP(self.host, self.port,
+                                       timeout=self.timeout)
+            try:
+                session.ehlo()
+            except Exception:
+                session.close()
+                raise
+        try:
+            if self.starttls:
+                with _timed('starttls', self.relay):
+                    session.starttls()
+                    session.ehlo()
+            if self.user and self.password:
+                with _timed('login', self.relay):
+                    session.login(self.user, self.password)
+        except Exception:
+            self._close(session)
+            raise
+        LOG.debug("Opened SMTP session to %(host)s:%(port)s",
+                  {'host': self.host, 'port': self.port})
+        return session
+
+    def _close(self, session):
+        with _timed('close', self.relay):
+            try:
+                session.quit()
+            except (smtplib.SMTPException, socket.error):
+                session.close()
+
+    @staticmethod
+    def _is_healthy(session):
+        try:
+            return session.noop()[0] == 250
+        except (smtplib.SMTPException, socket.error):
+            return False
+
+    def _checkout(self):
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    session, last_used = self._idle.pop()
+                idle_for = time.time() - last_used
+                if idle_for > self.idle_timeout:
+                    self._close(session)
+                elif (idle_for <= self.check_interval or
+                      self._is_healthy(session)):
+                    return session
+                else:
+                    LOG.debug("Discarding stale SMTP session to %s",
+                              self.host)
+                    session.close()
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, session):
+        now = time.time()
+        with self._lock:
+            self._idle.append((session, now))
+            reap = now - self._last_reap >= self.check_interval
+            if reap:
+                self._last_reap = now
+        self._slots.release()
+        if reap:
+            # Sessions at the left end of the deque are only taken when
+            # all the others are in use, and could otherwise stay open
+            # until the server drops them
+            self.reap()
+
+    def _discard(self, session):
+        session.close()
+        self._slots.release()
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        """Send a message on a pooled session.
+
+        The message is retried once on a new session if the server closed
+        the one taken from the pool.
+        """
+        for attempt in range(2):
+            session = self._checkout()
+            try:
+                with _timed('data', self.relay):
+                    result = session.sendmail(from_addr, to_addrs, msg)
+            except Exception as e:
+                if not _is_disconnect(e):
+                    # The session is still usable
+                    self._checkin(session)
+                    raise
+                self._discard(session)
+                if attempt:
+                    raise
+                LOG.debug("SMTP session to %(host)s lost (%(err)s), "
+                          "retrying on a new session",
+                          {'host': self.host, 'err': e})
+            else:
+                self._checkin(session)
+                return result
+
+    @staticmethod
+    def _data_result(session, count):
+        """Read count end-of-data replies, returning the first failure."""
+        result = None
+        for _reply in range(count):
+            reply = session.getreply()
+            if reply[0] != 250 and result is None:
+                result = smtplib.SMTPDataError(*reply)
+        return result
+
+    def _send_pipelined(self, session, from_addr, messages, results):
+        """Send messages on a session using the PIPELINING extension.
+
+        Envelope commands for a message are sent together with the content
+        of the previous one, so that every message costs a single round
+        trip to the server. LMTP servers send an end-of-data reply for
+        every accepted recipient, which are all read.
+        """
+        lmtp = isinstance(session, smtplib.LMTP)
+        # Data to send ahead of the next group of commands, index of the
+        # message whose end-of-data replies are pending, and their number
+        prefix = ''
+        pending = None
+        count = 0
+        for index, (to_addrs, msg) in enumerate(messages):
+            commands = ["MAIL FROM:%s\r\n" % smtplib.quoteaddr(from_addr)]
+            commands.extend("RCPT TO:%s\r\n" % smtplib.quoteaddr(addr)
+                            for addr in to_addrs)
+            commands.append("DATA\r\n")
+            session.send(prefix + "".join(commands))
+            if pending is not None:
+                results[pending] = self._data_result(session, count)
+            replies = [session.getreply() for _command in commands]
+            prefix, pending = '', None
+            if replies[0][0] == 250 and replies[-1][0] == 354:
+                data = smtplib.quotedata(msg)
+                if not data.endswith("\r\n"):
+                    data += "\r\n"
+                prefix, pending = data + ".\r\n", index
+                count = 1
+                if lmtp:
+                    count = len([reply for reply in replies[1:-1]
+                                 if reply[0] in (250, 251)])
+                continue
+            if replies[0][0] != 250:
+                results[index] = smtplib.SMTPSenderRefused(
+                    replies[0][0], replies[0][1], from_addr)
+            else:
+                results[index] = smtplib.SMTPDataError(*replies[-1])
+            if replies[-1][0] == 354:
+                # The server accepted DATA although MAIL failed, and would
+                # take RSET as message content: end the message first
+                session.send(".\r\n")
+                session.getreply()
+            # Make sure the next transaction starts from a clean state
+            session.rset()
+        if pending is not None:
+            session.send(prefix)
+            results[pending] = self._data_result(session, count)
+
+    def _send_sequential(self, session, from_addr, messages, results):
+        for index, (to_addrs, msg) in enumerate(messages):
+            try:
+                with _timed('data', self.relay):
+                    session.sendmail(from_addr, to_addrs, msg)
+            except smtplib.SMTPException as e:
+                if _is_disconnect(e):
+                    raise
+                results[index] = e
+            else:
+                results[index] = None
+
+    def sendmany(self, from_addr, messages, results=None):
+        """Send several messages on a single pooled session.
+
+        messages is a list of (to_addrs, msg) tuples. The ESMTP PIPELINING
+        extension is used if the server supports it. Returns a list with,
+        for each message, None if it was accepted or the exception which
+        prevented its delivery. If the session is lost, messages which were
+        not acknowledged yet are retried once on a new session.
+
+        A results list from a previous call can be given, in which case
+        only the messages without an outcome in it are sent. It is updated
+        as messages are acknowledged, even if an exception is raised.
+        """
+        if results is None:
+            results = [_UNSENT] * len(messages)
+        for attempt in range(2):
+            remaining = [index for index, result in enumerate(results)
+                         if result is _UNSENT]
+            batch_results = [_UNSENT] * len(remaining)
+            session = self._checkout()
+            try:
+                if session.has_extn('pipelining'):
+                    # The replies of a message cannot be told apart from
+                    # those of the next one: the whole batch is timed
+                    with _timed('pipelined_data', self.relay):
+                        self._send_pipelined(
+                            session, from_addr,
+                            [messages[index] for index in remaining],
+                            batch_results)
+                else:
+                    self._send_sequential(
+                        session, from_addr,
+                        [messages[index] for index in remaining],
+                        batch_results)
+            except Exception as e:
+                if not _is_disconnect(e):
+                    self._checkin(session)
+                    raise
+                self._discard(session)
+                if attempt:
+                    raise
+                LOG.debug("SMTP session to %(host)s lost (%(err)s), "
+                          "retrying unacknowledged messages on a new "
+                          "session", {'host': self.host, 'err': e})
+            else:
+                self._checkin(session)
+            finally:
+                for index, result in zip(remaining, batch_results):
+                    results[index] = result
+            if _UNSENT not in results:
+                return results
+
+    def check(self):
+        """Verify that a session can be established and answers NOOP."""
+        session = self._checkout()
+        if self._is_healthy(session):
+            self._checkin(session)
+        else:
+            self._discard(session)
+            raise smtplib.SMTPServerDisconnected(
+                "SMTP server %s did not answer NOOP" % self.host)
+
+    def reap(self):
+        """Close sessions which have been idle for too long."""
+        now = time.time()
+        with self._lock:
+            expired = [item for item in self._idle
+                       if now - item[1] > self.idle_timeout]
+            for item in expired:
+                self._idle.remove(item)
+        for session, _last_used in expired:
+            self._close(session)
+
+    def close(self):
+        """Close all idle sessions."""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for session, _last_used in idle:
+            self._close(session)
+
+
+class _Relay(object):
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.outstanding = 0
+        self.latency = None
+        self.sent = 0
+        self.failures = 0
+        self.down_until = 0
+
+
+class RelayGroup(object):
+    """Spread messages across several SMTP relays, each with its own pool.
+
+    With the round_robin policy relays are used in turn; with
+    least_outstanding the relay with fewer messages in flight, and then the
+    lower average latency, is preferred. The latency of each relay is
+    tracked as an exponentially weighted moving average.
+
+    A relay which fails with a connection error or a transient (4xx) reply
+    is skipped for down_interval seconds, and the message is sent through
+    the next relay. Relays marked as down are still tried, as a last
+    resort, when all the others failed.
+    """
+
+    def __init__(self, pools, policy=ROUND_ROBIN, down_interval=30,
+                 ewma_weight=0.2):
+        if not pools:
+            raise ValueError("At least one SMTP relay is required")
+        self.policy = policy
+        self.down_interval = down_interval
+        self.ewma_weight = ewma_weight
+        self._relays = [_Relay(pool) for pool in pools]
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def _candidates(self):
+        now = time.time()
+        with self._lock:
+            up = [relay for relay in self._relays if relay.down_until <= now]
+            down = sorted((relay for relay in self._relays
+                           if relay.down_until > now),
+                          key=lambda relay: relay.down_until)
+            if self.policy == LEAST_OUTSTANDING:
+                up.sort(key=lambda relay: (relay.outstanding,
+                                           relay.latency or 0))
+            elif up:
+                start = next(self._turn) % len(up)
+                up = up[start:] + up[:start]
+        return up + down
+
+    def _mark_down(self, relay, exc):
+        with self._lock:
+            relay.failures += 1
+            relay.down_until = time.time() + self.down_interval
+        LOG.warning("SMTP relay %(host)s:%(port)s failed (%(err)s), "
+                    "failing over",
+                    {'host': relay.pool.host, 'port': relay.pool.port,
+                     'err': exc})
+
+    def _mark_up(self, relay, elapsed):
+        with self._lock:
+            relay.sent += 1
+            relay.down_until = 0
+            if relay.latency is None:
+                relay.latency = elapsed
+            else:
+                relay.latency += self.ewma_weight * (elapsed - relay.latency)
+
+    def _call(self, func):
+        last_exc = None
+        for relay in self._candidates():
+            with self._lock:
+                relay.outstanding += 1
+            start = time.time()
+            try:
+                result = func(relay.pool)
+            except Exception as e:
+                if not _is_transient(e):
+                    raise
+                self._mark_down(relay, e)
+                last_exc = e
+            else:
+                self._mark_up(relay, time.time() - start)
+                return result
+            finally:
+                with self._lock:
+                    relay.outstanding -= 1
+        raise last_exc
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        return self._call(
+            lambda pool: pool.sendmail(from_addr, to_addrs, msg))
+
+    def sendmany(self, from_addr, messages):
+        """Send several messages through the first relay which works.
+
+        Messages acknowledged by a relay before it failed are not sent
+        again by the next one. If all relays fail after some messages were
+        acknowledged, the error is returned for the other ones instead of
+        being raised.
+        """
+        results = [_UNSENT] * len(messages)
+        try:
+            return self._call(
+                lambda pool: pool.sendmany(from_addr, messages, results))
+        except Exception as e:
+            if all(result is _UNSENT for result in results):
+                raise
+            return [e if result is _UNSENT else result
+                    for result in results]
+
+    def check(self):
+        """Verify that at least one relay is working."""
+        self._call(lambda pool: pool.check())
+
+    def get_stats(self):
+        now = time.time()
+        with self._lock:
+            return [{'relay': '%s:%s' % (relay.pool.host, relay.pool.port),
+                     'outstanding': relay.outstanding,
+                     'latency': relay.latency,
+                     'sent': relay.sent,
+                     'failures': relay.failures,
+                     'down': relay.down_until > now}
+                    for relay in self._relays]
+
+    def close(self):
+        for relay in self._relays:
+            relay.pool.close()
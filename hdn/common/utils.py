@@ -0,0 +1,256 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import abc
+import collections
+import os
+import socket
+import threading
+import time
+
+from neutron import context as n_context
+from oslo_log import log
+from oslo_utils import uuidutils
+import six
+
+from hdn.common import metrics
+from hdn.db import lease_db
+
+LOG = log.getLogger(__name__)
+
+
+class PeriodicWorker(object):
+    """Run a function every interval seconds in a background thread.
+
+    The function may return True to be invoked again right away, for
+    instance when it processed a full batch of work. wake() triggers an
+    immediate run.
+    """
+
+    def __init__(self, func, interval, name=None):
+        self._func = func
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                more = self._func()
+            except Exception:
+                LOG.exception("Periodic call to %s failed", self._func)
+                more = False
+            if not more:
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+
+class TTLCache(object):
+    """A thread safe mapping whose entries expire after ttl seconds.
+
+    At most max_size entries are kept; when the cache is full the least
+    recently used entry is evicted.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[1] < time.time():
+                return default
+            # Move the entry to the most recently used end
+            self._entries[key] = entry
+            return entry[0]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.max_size:
+                self._entries.popitem(last=False)
+            self._entries[key] = (value, time.time() + self.ttl)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ChangeNotifier(object):
+    """Let threads wait for changes.
+
+    notify() counts a change known to this process and wakes up the
+    waiting threads; waiting threads cost nothing until then.
+    """
+
+    def __init__(self):
+        self._count = 0
+        self._waiters = 0
+        self._condition = threading.Condition()
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def waiters(self):
+        return self._waiters
+
+    def notify(self):
+        with self._condition:
+            self._count += 1
+            self._condition.notify_all()
+
+    def wait(self, count, timeout):
+        """Wait up to timeout seconds for a change counted after count.
+
+        Returns the number of changes counted.
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            self._waiters += 1
+            try:
+                while self._count == count:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                return self._count
+            finally:
+                self._waiters -= 1
+
+
+@six.add_metaclass(abc.ABCMeta)
+class LeasedJob(object):
+    """A background job run by a single server at any time.
+
+    Every server runs the job, but only the one holding the lease called
+    lease_name, stored in the database, does the work, in run_leader.
+    Jobs working through a large backlog renew the lease between batches
+    with renew_lease. Subclasses count what they do in _stats, and
+    describe their last run in _last_run.
+    """
+
+    lease_name = None
+
+    def __init__(self, lease_duration=300):
+        self.lease_duration = lease_duration
+        self.holder = '%s:%d:%s' % (socket.gethostname(), os.getpid(),
+                                    uuidutils.generate_uuid()[:8])
+        self._stats = collections.Counter()
+        self._last_run = {}
+
+    def renew_lease(self, session):
+        return lease_db.acquire(session, self.lease_name, self.holder,
+                                self.lease_duration)
+
+    def release_lease(self):
+        lease_db.release(n_context.get_admin_context().session,
+                         self.lease_name, self.holder)
+
+    def run(self):
+        session = n_context.get_admin_context().session
+        if not self.renew_lease(session):
+            self.lease_lost()
+            self._last_run = {'leader': False}
+            return False
+        return self.run_leader(session)
+
+    @abc.abstractmethod
+    def run_leader(self, session):
+        """Do the work, returning True if there is more to do right away."""
+
+    def lease_lost(self):
+        """Called on every run while another server holds the lease."""
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats.update(('last_run_%s' % key, value)
+                     for key, value in self._last_run.items())
+        return stats
+
+
+class LeasedJobRunner(object):
+    """Run a leased job in a background worker of the current process.
+
+    factory returns the job, and interval the seconds between its runs,
+    0 disabling it; both are called when the worker starts, so that they
+    read the configuration at that time. The worker is bound to the
+    process which started it, so that every API worker forked by
+    neutron-server runs its own. gauges maps names of gauges to export to
+    the keys of the job statistics they report.
+    """
+
+    def __init__(self, name, factory, interval, gauges=None):
+        self.name = name
+        self.job = None
+        self._factory = factory
+        self._interval = interval
+        self._gauges = gauges or {}
+        self._worker = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the job in the current process, if enabled."""
+        interval = self._interval()
+        if interval <= 0 or self._pid == os.getpid():
+            return self._worker
+        with self._lock:
+            if self._pid != os.getpid():
+                self.job = self._factory()
+                self._worker = PeriodicWorker(self.job.run, interval,
+                                              name=self.name).start()
+                self._pid = os.getpid()
+                for gauge, key in self._gauges.items():
+                    metrics.REGISTRY.register_gauge(
+                        gauge, lambda key=key: self.get_stats().get(key, 0))
+        return self._worker
+
+    def get_stats(self):
+        if self.job is None:
+            return {}
+        return self.job.get_stats()
+
+    def stop(self):
+        """Stop the job and let another server take over right away."""
+        with self._lock:
+            worker, self._worker = self._worker, None
+            self._pid = None
+        if worker:
+            worker.stop()
+            self.job.release_lease()
@@ -0,0 +1,96 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Wait for changes of the tasks of HDN operators.
+
+Requests watching tasks wait on the in-process notifier of tasks_db, which
+is woken up when a transaction of this process changing tasks commits.
+While requests are waiting, a single poller per process reads from the
+change log the sequence number up to which changes are committed, to
+learn about the changes committed by other servers and about the numbers
+left over by rolled back transactions; it does not query the database
+otherwise.
+"""
+
+import os
+import threading
+import time
+
+from neutron import context as n_context
+from oslo_config import cfg
+from oslo_log import log
+
+from hdn.common import metrics
+from hdn.common import utils
+from hdn.db import tasks_db
+
+LOG = log.getLogger(__name__)
+
+_poller = None
+_poller_pid = None
+_lock = threading.Lock()
+# Sequence number up to which the poller found every change committed
+_visible = 0
+
+
+def poll_changes():
+    global _visible
+    if not tasks_db.CHANGES.waiters:
+        return False
+    session = n_context.get_admin_context().session
+    visible = tasks_db.get_visible_seq(session, _visible)
+    if visible != _visible:
+        _visible = visible
+        tasks_db.CHANGES.notify()
+    return False
+
+
+def start_poller():
+    """Start polling for changes made by other servers, if enabled."""
+    global _poller, _poller_pid
+    interval = cfg.CONF.HDN.task_watch_poll_interval
+    if interval <= 0 or _poller_pid == os.getpid():
+        return _poller
+    with _lock:
+        if _poller_pid != os.getpid():
+            _poller = utils.PeriodicWorker(poll_changes, interval,
+                                           name='hdn-task-watch').start()
+            _poller_pid = os.getpid()
+            metrics.REGISTRY.register_gauge(
+                'task_watchers', lambda: tasks_db.CHANGES.waiters)
+    return _poller
+
+
+def watch(session, since, timeout, limit, tenant_id=None, fields=None):
+    """Return the tasks changed after since, waiting for changes if none.
+
+    Waits up to timeout seconds for tasks to change. Returns the changed
+    tasks, possibly none, and the sequence number of the last change
+    returned, as done by tasks_db.get_changes.
+    """
+    start_poller()
+    deadline = time.time() + timeout
+    while True:
+        # Changes committed while reading wake up the watcher right away
+        count = tasks_db.CHANGES.count
+        tasks, since = tasks_db.get_changes(session, since, limit,
+                                            tenant_id=tenant_id,
+                                            fields=fields)
+        remaining = deadline - time.time()
+        if tasks or remaining <= 0:
+            return tasks, since
+        # Changes of other tenants, or not visible yet, wake up the
+        # watcher as well, it then waits again from the last change
+        tasks_db.CHANGES.wait(count, remaining)
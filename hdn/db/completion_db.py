@@ -0,0 +1,220 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Apply the outcome of the work done by HDN operators in bulk."""
+
+import collections
+
+from neutron.callbacks import resources
+from neutron.db import l3_db
+from neutron.db import models_v2
+
+from hdn.common import constants
+from hdn.db import hooks
+from hdn.db import pending_db
+
+# Resource names used for callback events
+# TODO(salv-orlando): do not use literal for network resource name
+CALLBACK_RESOURCES = {'network': 'NETWORK',
+                      'subnet': resources.SUBNET,
+                      'port': resources.PORT,
+                      'router': resources.ROUTER,
+                      'floatingip': 'FLOATING_IP'}
+
+# Per-item results
+RESULT_COMPLETED = 'completed'
+RESULT_NOT_FOUND = 'not_found'
+RESULT_INVALID_STATE = 'invalid_state'
+RESULT_IN_USE = 'in_use'
+RESULT_DUPLICATE = 'duplicate'
+
+# Resources are processed in this order, so that deleting a network or a
+# router in the same request as its floating IPs, ports and subnets succeeds
+RESOURCE_MODELS = collections.OrderedDict([
+    ('floatingip', l3_db.FloatingIP),
+    ('port', models_v2.Port),
+    ('subnet', models_v2.Subnet),
+    ('router', l3_db.Router),
+    ('network', models_v2.Network),
+])
+
+PENDING_STATES = (constants.STATUS_PENDING_CREATE,
+                  constants.STATUS_PENDING_UPDATE,
+                  constants.STATUS_PENDING_DELETE)
+
+# Status a resource must be in for each outcome, and the status it is moved
+# to. Deleted resources are removed from the database
+_TRANSITIONS = {
+    constants.OUTCOME_ACTIVE: ((constants.STATUS_PENDING_CREATE,
+                                constants.STATUS_PENDING_UPDATE),
+                               constants.STATUS_ACTIVE),
+    constants.OUTCOME_ERROR: (PENDING_STATES, constants.STATUS_ERROR),
+    constants.OUTCOME_DELETED: ((constants.STATUS_PENDING_DELETE,), None),
+}
+
+# Number of identifiers in the IN clause of a single statement
+CHUNK_SIZE = 500
+
+# Columns referencing resources which cannot be deleted while referenced
+_REFERENCES = {
+    'floatingip': (),
+    'port': (l3_db.FloatingIP.fixed_port_id, l3_db.Router.gw_port_id),
+    'subnet': (models_v2.IPAllocation.subnet_id,),
+    'router': (l3_db.RouterPort.router_id, l3_db.FloatingIP.router_id),
+    'network': (models_v2.Port.network_id, models_v2.Subnet.network_id),
+}
+
+
+# Resources removed along with the resources referencing them, as Neutron
+# does: the column referencing them, and their resource type
+_OWNED = {
+    'router': ((l3_db.Router.gw_port_id, 'port'),),
+}
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def _get_statuses(session, model, ids):
+    """Lock the resources and return their status by id."""
+    has_status = hasattr(model, 'status')
+    columns = (model.id, model.status) if has_status else (model.id,)
+    statuses = {}
+    for chunk in _chunks(ids):
+        query = session.query(*columns).filter(
+            model.id.in_(chunk)).with_for_update()
+        for row in query:
+            # Resources without a status, such as subnets, are always
+            # considered to be in the expected state
+            statuses[row[0]] = row[1] if has_status else None
+    return statuses
+
+
+def _get_referenced(session, resource, ids):
+    referenced = set()
+    for column in _REFERENCES[resource]:
+        for chunk in _chunks(ids):
+            referenced.update(
+                row[0] for row in session.query(column).filter(
+                    column.in_(chunk)).distinct())
+    return referenced
+
+
+def _delete(session, resource, model, ids):
+    """Delete resources, and the resources they own."""
+    owned = []
+    for column, owned_resource in _OWNED.get(resource, ()):
+        owned.append((owned_resource, [
+            row[0] for row in session.query(column).filter(
+                model.id.in_(ids), column.isnot(None))]))
+    session.query(model).filter(model.id.in_(ids)).delete(
+        synchronize_session=False)
+    # Owned resources may still be referenced by the deleted ones
+    for owned_resource, owned_ids in owned:
+        if owned_ids:
+            owned_model = RESOURCE_MODELS[owned_resource]
+            session.query(owned_model).filter(
+                owned_model.id.in_(owned_ids)).delete(
+                synchronize_session=False)
+            pending_db.clear(session, owned_resource, owned_ids)
+
+
+def complete(session, items):
+    """Apply the outcome reported by operators for a list of resources.
+
+    items is a list of (resource, resource_id, outcome) tuples. Status
+    changes and deletions are applied with a few statements per resource
+    type and outcome, in a single transaction.
+
+    Returns a list with a result for each item, in the same order, and a
+    dict mapping (resource, outcome) tuples to the ids of the resources
+    which were completed.
+    """
+    results = [None] * len(items)
+    completed = collections.defaultdict(list)
+    with session.begin(subtransactions=True):
+        for resource, model in RESOURCE_MODELS.items():
+            indexes = [index for index, item in enumerate(items)
+                       if item[0] == resource]
+            if not indexes:
+                continue
+            statuses = _get_statuses(
+                session, model, set(items[index][1] for index in indexes))
+            seen = set()
+            accepted = collections.defaultdict(list)
+            for index in indexes:
+                resource_id, outcome = items[index][1:]
+                expected, _new_status = _TRANSITIONS[outcome]
+                if resource_id in seen:
+                    results[index] = RESULT_DUPLICATE
+                elif resource_id not in statuses:
+                    results[index] = RESULT_NOT_FOUND
+                elif statuses[resource_id] not in expected + (None,):
+                    results[index] = RESULT_INVALID_STATE
+                else:
+                    accepted[outcome].append((index, resource_id))
+                seen.add(resource_id)
+
+            deleting = accepted.pop(constants.OUTCOME_DELETED, [])
+            if deleting:
+                in_use = _get_referenced(
+                    session, resource,
+                    [resource_id for _index, resource_id in deleting])
+                for index, resource_id in deleting:
+                    if resource_id in in_use:
+                        results[index] = RESULT_IN_USE
+                deleting = [item for item in deleting
+                            if item[1] not in in_use]
+                for chunk in _chunks(
+                        resource_id for _index, resource_id in deleting):
+                    _delete(session, resource, model, chunk)
+
+            for outcome, updating in accepted.items():
+                new_status = _TRANSITIONS[outcome][1]
+                if hasattr(model, 'status'):
+                    for chunk in _chunks(
+                            resource_id for _index, resource_id in updating):
+                        session.query(model).filter(
+                            model.id.in_(chunk)).update(
+                            {'status': new_status},
+                            synchronize_session=False)
+
+            accepted[constants.OUTCOME_DELETED] = deleting
+            for outcome, items_done in accepted.items():
+                for index, resource_id in items_done:
+                    results[index] = RESULT_COMPLETED
+                    completed[resource, outcome].append(resource_id)
+                for chunk in _chunks(
+                        resource_id for _index, resource_id in items_done):
+                    pending_db.clear(session, resource, chunk)
+    # The session might hold stale copies of the resources
+    session.expire_all()
+    return results, completed
+
+
+def notify_completed(session, trigger, completed, tenant_id=None):
+    """Trigger AFTER_COMPLETE events once the transaction commits.
+
+    completed is the dict returned by complete(). A single event is
+    triggered for each resource type and outcome.
+    """
+    for (resource, outcome), resource_ids in completed.items():
+        hooks.notify_after_commit(
+            session, CALLBACK_RESOURCES[resource], constants.AFTER_COMPLETE,
+            trigger, tenant_id=tenant_id, outcome=outcome,
+            resource_ids=resource_ids)
@@ -0,0 +1,75 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Find the resources the work on a resource depends on.
+
+Networks come before their subnets, which come before their ports, and
+routers before their interfaces. Floating IPs come after their router and
+the port they are associated to. As types only depend on types earlier in
+this order, dependencies never form cycles.
+"""
+
+import collections
+
+from neutron.db import l3_db
+from neutron.db import models_v2
+
+# Number of identifiers in the IN clause of a single statement
+CHUNK_SIZE = 500
+
+# For each resource type, the columns giving the resources it depends on:
+# the type of the resource referenced, the column matching the identifier
+# of the dependent resource and the column referencing the other resource
+_PARENTS = {
+    'subnet': [('network', models_v2.Subnet.id,
+                models_v2.Subnet.network_id)],
+    'port': [('network', models_v2.Port.id, models_v2.Port.network_id),
+             ('subnet', models_v2.IPAllocation.port_id,
+              models_v2.IPAllocation.subnet_id),
+             ('router', l3_db.RouterPort.port_id,
+              l3_db.RouterPort.router_id)],
+    'floatingip': [('router', l3_db.FloatingIP.id,
+                    l3_db.FloatingIP.router_id),
+                   ('port', l3_db.FloatingIP.id,
+                    l3_db.FloatingIP.fixed_port_id)],
+}
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def get_parents(session, resources):
+    """Return the resources each of resources depends on.
+
+    resources is a list of (type, id) tuples. Returns a dict mapping each
+    of them to the set of (type, id) tuples of the resources it depends
+    on, with a query per type of dependency.
+    """
+    ids = collections.defaultdict(set)
+    for resource, resource_id in resources:
+        if resource in _PARENTS:
+            ids[resource].add(resource_id)
+    parents = collections.defaultdict(set)
+    for resource, resource_ids in ids.items():
+        for parent, key, column in _PARENTS[resource]:
+            for chunk in _chunks(resource_ids):
+                for resource_id, parent_id in session.query(
+                        key, column).filter(key.in_(chunk),
+                                            column.isnot(None)):
+                    parents[resource, resource_id].add((parent, parent_id))
+    return parents
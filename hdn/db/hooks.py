@@ -0,0 +1,125 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import threading
+
+from neutron.callbacks import registry
+from oslo_log import log
+from sqlalchemy import event
+from sqlalchemy import orm
+
+LOG = log.getLogger(__name__)
+
+_PENDING_KEY = 'hdn_after_commit'
+
+# Batches collected while post-commit calls run, innermost last
+_local = threading.local()
+
+
+def _owner(transaction):
+    """Return the transaction whose outcome decides that of transaction.
+
+    That is the innermost enclosing savepoint, or the outermost
+    transaction: subtransactions commit along with their parent, and roll
+    it back as well.
+    """
+    while not transaction.nested and transaction._parent is not None:
+        transaction = transaction._parent
+    return transaction
+
+
+def call_after_commit(session, func, *args, **kwargs):
+    """Run func once the current transaction on session commits.
+
+    Calls made within a savepoint are handed over to the enclosing
+    transaction when the savepoint is released, so that func only runs
+    once the outermost transaction commits. The call is discarded if the
+    transaction, or the savepoint, is rolled back. If there is no
+    transaction in progress func is called immediately.
+    """
+    if session.transaction is None:
+        func(*args, **kwargs)
+        return
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    pending.setdefault(_owner(session.transaction), []).append(
+        (func, args, kwargs))
+
+
+def notify_after_commit(session, resource, event_type, trigger, **kwargs):
+    """Trigger a callback event once the current transaction commits.
+
+    Subscribers, which might open transactions of their own, then run once
+    the locks held by the transaction are released. Events raised by a
+    transaction which is rolled back are never triggered.
+    """
+    call_after_commit(session, registry.notify, resource, event_type,
+                      trigger, **kwargs)
+
+
+def add_to_batch(key, item, flush_func):
+    """Hand item to flush_func along with the other items of its batch.
+
+    While the calls queued by a transaction run after it commits, items
+    added with the same key are collected, and flush_func is called once
+    with the list of all of them after the last call. Subscribers can thus
+    process the events triggered by a transaction all at once. Outside of
+    post-commit calls, flush_func is called right away.
+    """
+    batches = getattr(_local, 'batches', None)
+    if not batches:
+        flush_func([item])
+        return
+    batches[-1].setdefault(key, (flush_func, []))[1].append(item)
+
+
+@event.listens_for(orm.Session, 'after_commit')
+def _run_pending(session):
+    # The committing transaction is still the current one
+    transaction = session.transaction
+    pending = session.info.get(_PENDING_KEY, {}).pop(transaction, [])
+    if not pending:
+        return
+    if transaction._parent is not None:
+        # A savepoint was released
+        session.info[_PENDING_KEY].setdefault(
+            _owner(transaction._parent), []).extend(pending)
+        return
+    # Flush functions might commit transactions with calls of their own
+    stack = _local.__dict__.setdefault('batches', [])
+    stack.append(collections.OrderedDict())
+    try:
+        for func, args, kwargs in pending:
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                LOG.exception("Post-commit call to %s failed", func)
+    finally:
+        batches = stack.pop()
+    for flush_func, items in batches.values():
+        try:
+            flush_func(items)
+        except Exception:
+            LOG.exception("Post-commit call to %(func)s for %(count)d "
+                          "items failed", {'func': flush_func,
+                                           'count': len(items)})
+
+
+@event.listens_for(orm.Session, 'after_transaction_end')
+def _discard_pending(session, transaction):
+    # Calls are still there only if the transaction was rolled back
+    pending = session.info.get(_PENDING_KEY)
+    if pending:
+        pending.pop(transaction, None)
@@ -0,0 +1,196 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Deduplication of retried create requests.
+
+Clients retrying a create request, for instance after a timeout, can pass
+the same idempotency_key attribute with every attempt. The first attempt
+records the key along with the identifier of the resource it created, in
+the same transaction; the following ones return that resource instead of
+creating another one and notifying HDN operators again.
+
+Keys are scoped by tenant and resource type, and expire after
+idempotency_key_ttl seconds. Recently used keys are also cached in memory,
+so that retries served by the same server do not query the database.
+"""
+
+import datetime
+import functools
+import threading
+import time
+
+from neutron.common import exceptions as n_exc
+from neutron.db import api as db_api
+from oslo_config import cfg
+from oslo_db import exception as db_exc
+from oslo_log import log
+from oslo_utils import timeutils
+
+from hdn.common import config  # noqa
+from hdn.common import metrics
+from hdn.common import utils
+from hdn.db.models import hdn_models
+
+LOG = log.getLogger(__name__)
+
+IdempotencyKey = hdn_models.HdnIdempotencyKey
+
+KEY_ATTRIBUTE = 'idempotency_key'
+
+# Seconds between removals of expired keys by a server
+PURGE_INTERVAL = 300
+
+_cache = None
+_last_purge = 0
+_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = utils.TTLCache(cfg.CONF.HDN.idempotency_key_ttl,
+                                        cfg.CONF.HDN.idempotency_cache_size)
+    return _cache
+
+
+def _cutoff(ttl):
+    return timeutils.utcnow() - datetime.timedelta(seconds=ttl)
+
+
+def lookup(session, tenant_id, resource, key, ttl):
+    """Return the id of the resource created with key, if it has not expired.
+    """
+    row = session.query(IdempotencyKey.resource_id).filter(
+        IdempotencyKey.tenant_id == tenant_id,
+        IdempotencyKey.resource == resource,
+        IdempotencyKey.key == key,
+        IdempotencyKey.created_at >= _cutoff(ttl)).first()
+    return row and row.resource_id
+
+
+def record(session, tenant_id, resource, key, resource_id, ttl,
+           replaced_id=None):
+    """Record the resource created by the request with key.
+
+    An expired key, or one whose resource replaced_id was deleted, is
+    reused. Raises DBDuplicateEntry if a concurrent request with the same
+    key recorded it first.
+    """
+    with session.begin(subtransactions=True):
+        query = session.query(IdempotencyKey).filter_by(
+            tenant_id=tenant_id, resource=resource, key=key)
+        if replaced_id:
+            query = query.filter(IdempotencyKey.resource_id == replaced_id)
+        else:
+            query = query.filter(IdempotencyKey.created_at < _cutoff(ttl))
+        query.delete(synchronize_session=False)
+        session.add(IdempotencyKey(tenant_id=tenant_id, resource=resource,
+                                   key=key, resource_id=resource_id,
+                                   created_at=timeutils.utcnow()))
+
+
+def purge_expired(session, ttl):
+    """Remove expired keys, returning how many were removed."""
+    with session.begin(subtransactions=True):
+        return session.query(IdempotencyKey).filter(
+            IdempotencyKey.created_at < _cutoff(ttl)).delete(
+            synchronize_session=False)
+
+
+def _maybe_purge(session, ttl):
+    global _last_purge
+    now = time.time()
+    with _lock:
+        if now - _last_purge < PURGE_INTERVAL:
+            return
+        _last_purge = now
+    try:
+        purged = purge_expired(session, ttl)
+    except db_exc.DBError:
+        LOG.exception("Unable to remove expired idempotency keys")
+        return
+    if purged:
+        LOG.debug("Removed %d expired idempotency keys", purged)
+
+
+def _get_original(context, get_func, cache_key, ttl):
+    """Return the id and the resource created with the key of cache_key.
+
+    The resource is None if it was deleted since.
+    """
+    cache = _get_cache()
+    resource_id = (cache.get(cache_key) or
+                   lookup(context.session, *cache_key, ttl=ttl))
+    if not resource_id:
+        return None, None
+    try:
+        return resource_id, get_func(context, resource_id)
+    except n_exc.NotFound:
+        cache.discard(cache_key)
+        return resource_id, None
+
+
+def idempotent(resource):
+    """Deduplicate create requests carrying an idempotency key.
+
+    Decorates the create_<resource> method of a plugin. When the request
+    body has a key which was already used by the tenant to create a
+    resource of the same type, that resource is returned, as read by the
+    plugin get_<resource> method, and the create method is not invoked.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(self, context, body, *args, **kwargs):
+            key = body[resource].pop(KEY_ATTRIBUTE, None)
+            if not key:
+                return f(self, context, body, *args, **kwargs)
+            ttl = cfg.CONF.HDN.idempotency_key_ttl
+            tenant_id = body[resource].get('tenant_id', context.tenant_id)
+            cache_key = (tenant_id, resource, key)
+            get_func = getattr(self, 'get_%s' % resource)
+
+            replaced_id, original = _get_original(context, get_func,
+                                                  cache_key, ttl)
+            if original is not None:
+                metrics.REGISTRY.inc('idempotent_replays_total',
+                                     resource=resource)
+                LOG.debug("Request with idempotency key %(key)s already "
+                          "created %(resource)s %(id)s",
+                          {'key': key, 'resource': resource,
+                           'id': original['id']})
+                return original
+            try:
+                with db_api.autonested_transaction(context.session):
+                    new_item = f(self, context, body, *args, **kwargs)
+                    record(context.session, tenant_id, resource, key,
+                           new_item['id'], ttl, replaced_id=replaced_id)
+            except db_exc.DBDuplicateEntry:
+                # A concurrent request with the same key won the race. Its
+                # resource is returned, while everything done by this one,
+                # notifications included, was rolled back
+                replaced_id, original = _get_original(context, get_func,
+                                                      cache_key, ttl)
+                if original is None:
+                    raise
+                metrics.REGISTRY.inc('idempotent_replays_total',
+                                     resource=resource)
+                return original
+            _get_cache().put(cache_key, new_item['id'])
+            _maybe_purge(context.session, ttl)
+            return new_item
+        return wrapper
+    return decorator
@@ -0,0 +1,61 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Leases ensuring that a background job runs on a single server."""
+
+import datetime
+
+from oslo_db import exception as db_exc
+from oslo_utils import timeutils
+import sqlalchemy as sa
+
+from hdn.db.models import hdn_models
+
+Lease = hdn_models.HdnLease
+
+
+def acquire(session, name, holder, duration):
+    """Acquire or renew the lease called name for duration seconds.
+
+    Returns True if holder now owns the lease. The lease can be taken over
+    only once its current holder failed to renew it in time.
+    """
+    now = timeutils.utcnow()
+    expires_at = now + datetime.timedelta(seconds=duration)
+    with session.begin(subtransactions=True):
+        # The conditional update is atomic, so that only one server can
+        # take over an expired lease
+        updated = session.query(Lease).filter(
+            Lease.name == name,
+            sa.or_(Lease.holder == holder,
+                   Lease.expires_at < now)).update(
+            {'holder': holder, 'expires_at': expires_at},
+            synchronize_session=False)
+    if updated:
+        return True
+    try:
+        with session.begin(subtransactions=True):
+            session.add(Lease(name=name, holder=holder,
+                              expires_at=expires_at))
+    except db_exc.DBDuplicateEntry:
+        # The lease exists and is held by another server
+        return False
+    return True
+
+
+def release(session, name, holder):
+    with session.begin(subtransactions=True):
+        session.query(Lease).filter_by(name=name, holder=holder).delete(
+            synchronize_session=False)
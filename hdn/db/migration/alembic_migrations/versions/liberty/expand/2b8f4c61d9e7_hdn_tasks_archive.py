@@ -0,0 +1,48 @@
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""hdn_tasks_archive
+
+Revision ID: 2b8f4c61d9e7
+Revises: 7e3b95d2a0c4
+Create Date: 2015-10-29
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2b8f4c61d9e7'
+down_revision = '7e3b95d2a0c4'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'hdntasks_archive',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('tenant_id', sa.String(length=255), index=True),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('status_description', sa.String(length=255)),
+        sa.Column('action', sa.String(length=64), nullable=False),
+        sa.Column('object_id', sa.String(length=36), nullable=False),
+        sa.Column('object_type', sa.String(length=36), nullable=False),
+        sa.Column('claimed_by', sa.String(length=255)),
+        sa.Column('claim_id', sa.String(length=36)),
+        sa.Column('claim_expires', sa.DateTime()),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('updated_at', sa.DateTime()),
+        sa.Column('priority', sa.Integer(), nullable=False,
+                  server_default='2'),
+        sa.Column('archived_at', sa.DateTime(), nullable=False))
@@ -0,0 +1,85 @@
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""hdn_pending_work
+
+Revision ID: 3f2b7c9d1e04
+Revises: ebca2f99339d
+Create Date: 2015-10-22
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f2b7c9d1e04'
+down_revision = 'ebca2f99339d'
+
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+# Tables whose rows HDN operators move out of PENDING_* statuses
+STATUS_TABLES = ('networks', 'ports', 'routers', 'floatingips')
+
+# Resource recorded for the rows of each of those tables
+RESOURCES = {'networks': 'network',
+             'ports': 'port',
+             'routers': 'router',
+             'floatingips': 'floatingip'}
+
+
+def upgrade():
+    op.create_table(
+        'hdn_pending_work',
+        sa.Column('resource', sa.String(length=16), primary_key=True),
+        sa.Column('resource_id', sa.String(length=36), primary_key=True),
+        sa.Column('tenant_id', sa.String(length=255)),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False))
+    op.create_index('ix_hdn_pending_work_created_at', 'hdn_pending_work',
+                    ['created_at', 'resource_id'])
+    op.create_index('ix_hdn_pending_work_tenant_id_created_at',
+                    'hdn_pending_work',
+                    ['tenant_id', 'created_at', 'resource_id'])
+    backfill()
+
+
+def backfill():
+    """Record the resources which are already waiting for HDN operators.
+
+    Their age is unknown, it is counted from the upgrade. Subnets have no
+    status column: those of networks still being created are recorded as
+    being created as well.
+    """
+    now = sa.literal(datetime.datetime.utcnow(), sa.DateTime())
+    pending_work = sa.table(
+        'hdn_pending_work', sa.column('resource'), sa.column('resource_id'),
+        sa.column('tenant_id'), sa.column('status'), sa.column('created_at'))
+    columns = ['resource', 'resource_id', 'tenant_id', 'status',
+               'created_at']
+    for table in STATUS_TABLES:
+        source = sa.table(table, sa.column('id'), sa.column('tenant_id'),
+                          sa.column('status'))
+        op.execute(pending_work.insert().from_select(columns, sa.select(
+            [sa.literal(RESOURCES[table]), source.c.id, source.c.tenant_id,
+             source.c.status, now]).where(
+            source.c.status.like('PENDING_%'))))
+    networks = sa.table('networks', sa.column('id'), sa.column('status'))
+    subnets = sa.table('subnets', sa.column('id'), sa.column('tenant_id'),
+                       sa.column('network_id'))
+    op.execute(pending_work.insert().from_select(columns, sa.select(
+        [sa.literal('subnet'), subnets.c.id, subnets.c.tenant_id,
+         sa.literal('PENDING_CREATE'), now]).select_from(
+        subnets.join(networks, subnets.c.network_id == networks.c.id)).where(
+        networks.c.status == 'PENDING_CREATE')))
@@ -0,0 +1,41 @@
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""hdn_task_changes
+
+Revision ID: 4d7c0b2e9a61
+Revises: 9f6a3d17c8e5
+Create Date: 2015-11-12
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4d7c0b2e9a61'
+down_revision = '9f6a3d17c8e5'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'hdn_task_changes',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'),
+                  primary_key=True, autoincrement=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False))
+    op.create_index('ix_hdn_task_changes_created_at', 'hdn_task_changes',
+                    ['created_at', 'id'])
+    for table in ('hdntasks', 'hdntasks_archive'):
+        op.add_column(table, sa.Column('seq', sa.BigInteger()))
+    op.create_index('ix_hdntasks_seq', 'hdntasks', ['seq', 'id'])
@@ -0,0 +1,41 @@
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""hdn_idempotency_keys
+
+Revision ID: 5a2c8e0f7b13
+Revises: 8d4e1a6b2c57
+Create Date: 2015-10-26
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5a2c8e0f7b13'
+down_revision = '8d4e1a6b2c57'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'hdn_idempotency_keys',
+        sa.Column('tenant_id', sa.String(length=255), nullable=False),
+        sa.Column('resource', sa.String(length=16), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('resource_id', sa.String(length=36), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('tenant_id', 'resource', 'key'))
+    op.create_index('ix_hdn_idempotency_keys_created_at',
+                    'hdn_idempotency_keys', ['created_at'])
@@ -0,0 +1,44 @@
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""hdn_tasks_indexes
+
+Revision ID: 7e3b95d2a0c4
+Revises: c61d0e9a4f28
+Create Date: 2015-10-28
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7e3b95d2a0c4'
+down_revision = 'c61d0e9a4f28'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('hdntasks', sa.Column('created_at', sa.DateTime()))
+    op.add_column('hdntasks', sa.Column('updated_at', sa.DateTime()))
+    op.add_column('hdntasks', sa.Column('priority', sa.Integer(),
+                                        nullable=False, server_default='2'))
+    op.create_index('ix_hdntasks_status_priority_created_at', 'hdntasks',
+                    ['status', 'priority', 'created_at', 'id'])
+    op.create_index('ix_hdntasks_status_claim_expires', 'hdntasks',
+                    ['status', 'claim_expires'])
+    op.create_index('ix_hdntasks_claim_id', 'hdntasks', ['claim_id'])
+    op.create_index('ix_hdntasks_tenant_id_status_created_at', 'hdntasks',
+                    ['tenant_id', 'status', 'created_at', 'id'])
+    op.create_index('ix_hdntasks_object_id_object_type', 'hdntasks',
+                    ['object_id', 'object_type'])
@@ -0,0 +1,36 @@
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""hdn_leases
+
+Revision ID: 8d4e1a6b2c57
+Revises: 3f2b7c9d1e04
+Create Date: 2015-10-23
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8d4e1a6b2c57'
+down_revision = '3f2b7c9d1e04'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'hdn_leases',
+        sa.Column('name', sa.String(length=64), primary_key=True),
+        sa.Column('holder', sa.String(length=255), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False))
@@ -0,0 +1,38 @@
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""hdn_task_deadlines
+
+Revision ID: 9f6a3d17c8e5
+Revises: 2b8f4c61d9e7
+Create Date: 2015-11-09
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9f6a3d17c8e5'
+down_revision = '2b8f4c61d9e7'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    for table in ('hdntasks', 'hdntasks_archive'):
+        op.add_column(table, sa.Column('deadline', sa.DateTime()))
+        op.add_column(table, sa.Column('escalate_at', sa.DateTime()))
+        op.add_column(table, sa.Column('escalations', sa.Integer(),
+                                       nullable=False, server_default='0'))
+    op.create_index('ix_hdntasks_escalate_at', 'hdntasks',
+                    ['escalate_at', 'id'])
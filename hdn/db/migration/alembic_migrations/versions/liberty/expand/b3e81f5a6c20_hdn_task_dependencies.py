@@ -0,0 +1,44 @@
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""hdn_task_dependencies
+
+Revision ID: b3e81f5a6c20
+Revises: 4d7c0b2e9a61
+Create Date: 2015-11-16
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b3e81f5a6c20'
+down_revision = '4d7c0b2e9a61'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    for table in ('hdntasks', 'hdntasks_archive'):
+        op.add_column(table, sa.Column('blockers', sa.Integer(),
+                                       nullable=False, server_default='0'))
+    op.create_table(
+        'hdntask_dependencies',
+        sa.Column('task_id', sa.String(length=36),
+                  sa.ForeignKey('hdntasks.id', ondelete='CASCADE'),
+                  primary_key=True),
+        sa.Column('depends_on_id', sa.String(length=36),
+                  sa.ForeignKey('hdntasks.id', ondelete='CASCADE'),
+                  primary_key=True))
+    op.create_index('ix_hdntask_dependencies_depends_on_id',
+                    'hdntask_dependencies', ['depends_on_id'])
@@ -0,0 +1,37 @@
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""hdn_task_claims
+
+Revision ID: c61d0e9a4f28
+Revises: 5a2c8e0f7b13
+Create Date: 2015-10-27
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c61d0e9a4f28'
+down_revision = '5a2c8e0f7b13'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('hdntasks',
+                  sa.Column('claimed_by', sa.String(length=255)))
+    op.add_column('hdntasks',
+                  sa.Column('claim_id', sa.String(length=36)))
+    op.add_column('hdntasks',
+                  sa.Column('claim_expires', sa.DateTime()))
@@ -0,0 +1,42 @@
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""hdn_outbox
+
+Revision ID: ebca2f99339d
+Revises: 45e666889777
+Create Date: 2015-10-20
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'ebca2f99339d'
+down_revision = '45e666889777'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'hdn_outbox',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('subject', sa.String(length=255), nullable=False),
+        sa.Column('body', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('claimed_by', sa.String(length=36)),
+        sa.Column('claim_expires', sa.DateTime()),
+        sa.Column('sent_at', sa.DateTime()))
+    op.create_index('ix_hdn_outbox_sent_at_created_at', 'hdn_outbox',
+                    ['sent_at', 'created_at'])
@@ -19,13 +19,162 @@ import sqlalchemy as sa
 
 from neutron.db import model_base
 
+from hdn.common import constants
 
-class HdnTask(model_base.BASEV2,
-              model_base.HasID,
-              model_base.HastTenant,
-              model_base.HasStatusDescription):
-    """Represents a HDN Task"""
+
+class HdnTaskMixin(model_base.HasId,
+                   model_base.HasTenant,
+                   model_base.HasStatusDescription):
+    """Attributes of HDN tasks, current and archived"""
 
     action = sa.Column(sa.String(64), nullable=False)
     object_id = sa.Column(sa.String(36), nullable=False)
     object_type = sa.Column(sa.String(36), nullable=False)
+    # Operator working on the task, until claim_expires
+    claimed_by = sa.Column(sa.String(255))
+    claim_id = sa.Column(sa.String(36))
+    claim_expires = sa.Column(sa.DateTime)
+    # Tasks created before these columns were added have no timestamps
+    created_at = sa.Column(sa.DateTime)
+    updated_at = sa.Column(sa.DateTime)
+    priority = sa.Column(sa.Integer, nullable=False,
+                         server_default=str(constants.TASK_PRIORITY_NORMAL))
+    # Time by which the task should end, and at which it is escalated
+    # next if it is still open
+    deadline = sa.Column(sa.DateTime)
+    escalate_at = sa.Column(sa.DateTime)
+    escalations = sa.Column(sa.Integer, nullable=False, server_default='0')
+    # Change sequence number of the last change, for watchers
+    seq = sa.Column(sa.BigInteger)
+    # Number of open tasks the task depends on
+    blockers = sa.Column(sa.Integer, nullable=False, server_default='0')
+
+
+class HdnTask(model_base.BASEV2, HdnTaskMixin):
+    """Represents a HDN Task"""
+
+    # Indexes for claims, which take pending tasks by priority and age and
+    # tasks whose claim expired, for listings by tenant and status, for
+    # finding the tasks of a resource, the overdue tasks, and the tasks
+    # changed since a given change
+    __table_args__ = (
+        sa.Index('ix_hdntasks_status_priority_created_at', 'status',
+                 'priority', 'created_at', 'id'),
+        sa.Index('ix_hdntasks_status_claim_expires', 'status',
+                 'claim_expires'),
+        sa.Index('ix_hdntasks_claim_id', 'claim_id'),
+        sa.Index('ix_hdntasks_tenant_id_status_created_at', 'tenant_id',
+                 'status', 'created_at', 'id'),
+        sa.Index('ix_hdntasks_object_id_object_type', 'object_id',
+                 'object_type'),
+        sa.Index('ix_hdntasks_escalate_at', 'escalate_at', 'id'),
+        sa.Index('ix_hdntasks_seq', 'seq', 'id'),
+        model_base.BASEV2.__table_args__
+    )
+
+
+class HdnTaskDependency(model_base.BASEV2):
+    """Represents a task waiting for the end of another task"""
+
+    __tablename__ = 'hdntask_dependencies'
+
+    task_id = sa.Column(sa.String(36),
+                        sa.ForeignKey('hdntasks.id', ondelete='CASCADE'),
+                        primary_key=True)
+    depends_on_id = sa.Column(sa.String(36),
+                              sa.ForeignKey('hdntasks.id',
+                                            ondelete='CASCADE'),
+                              primary_key=True)
+    # The tasks waiting for a task are found when it ends
+    __table_args__ = (
+        sa.Index('ix_hdntask_dependencies_depends_on_id', 'depends_on_id'),
+        model_base.BASEV2.__table_args__
+    )
+
+
+class HdnOutbox(model_base.BASEV2, model_base.HasId):
+    """Represents a notification for HDN operators waiting to be sent"""
+
+    __tablename__ = 'hdn_outbox'
+
+    subject = sa.Column(sa.String(255), nullable=False)
+    body = sa.Column(sa.Text, nullable=False)
+    created_at = sa.Column(sa.DateTime, nullable=False)
+    claimed_by = sa.Column(sa.String(36))
+    claim_expires = sa.Column(sa.DateTime)
+    sent_at = sa.Column(sa.DateTime)
+    __table_args__ = (
+        sa.Index('ix_hdn_outbox_sent_at_created_at', 'sent_at', 'created_at'),
+        model_base.BASEV2.__table_args__
+    )
+
+
+class HdnPendingWork(model_base.BASEV2):
+    """Represents a resource waiting for the work of HDN operators"""
+
+    __tablename__ = 'hdn_pending_work'
+
+    resource = sa.Column(sa.String(16), primary_key=True)
+    resource_id = sa.Column(sa.String(36), primary_key=True)
+    tenant_id = sa.Column(sa.String(255))
+    status = sa.Column(sa.String(16), nullable=False)
+    created_at = sa.Column(sa.DateTime, nullable=False)
+    # Listings are sorted by age, with the resource id as a tie breaker
+    __table_args__ = (
+        sa.Index('ix_hdn_pending_work_created_at', 'created_at',
+                 'resource_id'),
+        sa.Index('ix_hdn_pending_work_tenant_id_created_at', 'tenant_id',
+                 'created_at', 'resource_id'),
+        model_base.BASEV2.__table_args__
+    )
+
+
+class HdnLease(model_base.BASEV2):
+    """Represents the lease of a background job held by a server"""
+
+    __tablename__ = 'hdn_leases'
+
+    name = sa.Column(sa.String(64), primary_key=True)
+    holder = sa.Column(sa.String(255), nullable=False)
+    expires_at = sa.Column(sa.DateTime, nullable=False)
+
+
+class HdnTaskChange(model_base.BASEV2):
+    """Represents a change of tasks, numbered by its autoincrement key"""
+
+    __tablename__ = 'hdn_task_changes'
+
+    # SQLite only autoincrements INTEGER primary keys
+    id = sa.Column(sa.BigInteger().with_variant(sa.Integer(), 'sqlite'),
+                   primary_key=True, autoincrement=True)
+    created_at = sa.Column(sa.DateTime, nullable=False)
+    # The last change numbered before a given time is found when reading
+    # changes
+    __table_args__ = (
+        sa.Index('ix_hdn_task_changes_created_at', 'created_at', 'id'),
+        model_base.BASEV2.__table_args__
+    )
+
+
+class HdnIdempotencyKey(model_base.BASEV2):
+    """Represents the resource created by a request with an idempotency key"""
+
+    __tablename__ = 'hdn_idempotency_keys'
+
+    tenant_id = sa.Column(sa.String(255), primary_key=True)
+    resource = sa.Column(sa.String(16), primary_key=True)
+    key = sa.Column(sa.String(255), primary_key=True)
+    resource_id = sa.Column(sa.String(36), nullable=False)
+    created_at = sa.Column(sa.DateTime, nullable=False)
+    __table_args__ = (
+        sa.Index('ix_hdn_idempotency_keys_created_at', 'created_at'),
+        model_base.BASEV2.__table_args__
+    )
+
+
+class HdnTaskArchive(model_base.BASEV2, HdnTaskMixin):
+    """Represents a HDN task which was completed a while ago"""
+
+    __tablename__ = 'hdntasks_archive'
+
+    archived_at = sa.Column(sa.DateTime, nullable=False)
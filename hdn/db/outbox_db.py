@@ -0,0 +1,87 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+import sqlalchemy as sa
+
+from hdn.db.models import hdn_models
+
+
+def add_message(session, subject, body):
+    """Store a notification in the outbox.
+
+    The message is written within the transaction in progress on session,
+    if any, so that it is persisted together with the resource change which
+    generated it.
+    """
+    with session.begin(subtransactions=True):
+        session.add(hdn_models.HdnOutbox(id=uuidutils.generate_uuid(),
+                                         subject=subject,
+                                         body=body,
+                                         created_at=timeutils.utcnow()))
+
+
+def _unclaimed(now):
+    return sa.and_(hdn_models.HdnOutbox.sent_at.is_(None),
+                   sa.or_(hdn_models.HdnOutbox.claim_expires.is_(None),
+                          hdn_models.HdnOutbox.claim_expires < now))
+
+
+def claim_messages(session, limit, claim_timeout):
+    """Claim up to limit unsent messages, oldest first.
+
+    Claimed messages are not returned to other callers for claim_timeout
+    seconds; if they are not marked as sent by then, they will be claimed
+    again. This ensures at-least-once delivery when several servers drain
+    the outbox.
+    """
+    now = timeutils.utcnow()
+    token = uuidutils.generate_uuid()
+    with session.begin(subtransactions=True):
+        query = session.query(hdn_models.HdnOutbox.id).filter(
+            _unclaimed(now)).order_by(
+            hdn_models.HdnOutbox.created_at).limit(limit)
+        ids = [row.id for row in query]
+        if not ids:
+            return []
+        session.query(hdn_models.HdnOutbox).filter(
+            hdn_models.HdnOutbox.id.in_(ids), _unclaimed(now)).update(
+            {'claimed_by': token,
+             'claim_expires': now + datetime.timedelta(
+                 seconds=claim_timeout)},
+            synchronize_session=False)
+    return session.query(hdn_models.HdnOutbox).filter_by(
+        claimed_by=token).order_by(hdn_models.HdnOutbox.created_at).all()
+
+
+def mark_sent(session, message_ids):
+    if not message_ids:
+        return
+    with session.begin(subtransactions=True):
+        session.query(hdn_models.HdnOutbox).filter(
+            hdn_models.HdnOutbox.id.in_(message_ids)).update(
+            {'sent_at': timeutils.utcnow()}, synchronize_session=False)
+
+
+def purge_sent(session, older_than):
+    """Remove messages sent more than older_than seconds ago."""
+    threshold = timeutils.utcnow() - datetime.timedelta(seconds=older_than)
+    with session.begin(subtransactions=True):
+        return session.query(hdn_models.HdnOutbox).filter(
+            hdn_models.HdnOutbox.sent_at < threshold).delete(
+            synchronize_session=False)
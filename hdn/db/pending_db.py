@@ -0,0 +1,171 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Index of the resources waiting for the work of HDN operators.
+
+Neutron tables do not record when a resource was created or changed, so
+the plugins record here every resource they move to a PENDING_* status,
+and the time at which they did it. This allows listing outstanding work,
+oldest first, across all resource types with a single indexed query.
+"""
+
+from oslo_db import exception as db_exc
+from oslo_utils import timeutils
+import sqlalchemy as sa
+
+from hdn.common import constants
+from hdn.db.models import hdn_models
+
+PendingWork = hdn_models.HdnPendingWork
+
+
+def _update(session, resource, resource_ids, status, now):
+    query = session.query(PendingWork).filter(
+        PendingWork.resource == resource,
+        PendingWork.resource_id.in_(resource_ids))
+    if status == constants.STATUS_PENDING_DELETE:
+        query.filter(PendingWork.status != status).update(
+            {'status': status, 'created_at': now},
+            synchronize_session=False)
+        return
+    if status == constants.STATUS_PENDING_UPDATE:
+        # Resources still to be created are created as updated
+        query = query.filter(
+            PendingWork.status != constants.STATUS_PENDING_CREATE)
+    query.update({'status': status}, synchronize_session=False)
+
+
+def _insert(session, rows):
+    # Within a savepoint, so that a duplicate entry does not abort the
+    # transaction of the request
+    with session.begin_nested():
+        session.execute(PendingWork.__table__.insert(), rows)
+
+
+def record(session, resource, resource_ids, tenant_id, status):
+    """Record resources moved to a PENDING_* status.
+
+    Resources which were already pending keep their original age, as the
+    request is still outstanding, unless they are now being deleted: the
+    grace period of the reaper runs from the deletion request. Resources
+    still to be created stay PENDING_CREATE when they are updated.
+    Resources recorded by a concurrent request are updated instead.
+    """
+    if not resource_ids:
+        return
+    with session.begin(subtransactions=True):
+        existing = set(row.resource_id for row in session.query(
+            PendingWork.resource_id).filter(
+            PendingWork.resource == resource,
+            PendingWork.resource_id.in_(resource_ids)).with_for_update())
+        now = timeutils.utcnow()
+        if existing:
+            _update(session, resource, existing, status, now)
+        rows = [{'resource': resource,
+                 'resource_id': resource_id,
+                 'tenant_id': tenant_id,
+                 'status': status,
+                 'created_at': now}
+                for resource_id in resource_ids
+                if resource_id not in existing]
+        if not rows:
+            return
+        try:
+            # A single multi-row insert for bulk requests
+            _insert(session, rows)
+        except db_exc.DBDuplicateEntry:
+            for row in rows:
+                try:
+                    _insert(session, [row])
+                except db_exc.DBDuplicateEntry:
+                    _update(session, resource, [row['resource_id']],
+                            status, now)
+
+
+def clear(session, resource, resource_ids):
+    """Remove resources for which HDN operators completed their work."""
+    if not resource_ids:
+        return
+    with session.begin(subtransactions=True):
+        session.query(PendingWork).filter(
+            PendingWork.resource == resource,
+            PendingWork.resource_id.in_(resource_ids)).delete(
+            synchronize_session=False)
+
+
+def get(session, resource, resource_id):
+    return session.query(PendingWork).filter(
+        PendingWork.resource == resource,
+        PendingWork.resource_id == resource_id).first()
+
+
+def _filter(query, tenant_id=None, resources=None, statuses=None,
+            created_before=None):
+    if tenant_id is not None:
+        query = query.filter(PendingWork.tenant_id == tenant_id)
+    if resources:
+        query = query.filter(PendingWork.resource.in_(resources))
+    if statuses:
+        query = query.filter(PendingWork.status.in_(statuses))
+    if created_before is not None:
+        query = query.filter(PendingWork.created_at < created_before)
+    return query
+
+
+def count_pending(session, **filters):
+    """Count pending resources, filtered as in get_pending."""
+    return _filter(session.query(sa.func.count(PendingWork.resource_id)),
+                   **filters).scalar()
+
+
+def get_pending(session, limit, marker=None, newest_first=False,
+                after=None, **filters):
+    """Return up to limit pending resources, sorted by age.
+
+    Resources can be filtered by tenant_id, by resources and statuses, which
+    are lists, and by created_before, the time before which they became
+    pending.
+
+    The oldest are returned first, unless newest_first is set. Pagination
+    is keyset based: marker is the id of the last resource of the previous
+    page, so that every page is read from the index in bounded time no
+    matter how deep into the listing it is. Callers which might remove
+    that resource pass instead its (created_at, resource_id) tuple as
+    after.
+    """
+    query = _filter(session.query(PendingWork), **filters)
+    if marker:
+        after = session.query(PendingWork.created_at,
+                              PendingWork.resource_id).filter(
+            PendingWork.resource_id == marker).first()
+    if after:
+        created_at, resource_id = after
+        if newest_first:
+            query = query.filter(sa.or_(
+                PendingWork.created_at < created_at,
+                sa.and_(PendingWork.created_at == created_at,
+                        PendingWork.resource_id < resource_id)))
+        else:
+            query = query.filter(sa.or_(
+                PendingWork.created_at > created_at,
+                sa.and_(PendingWork.created_at == created_at,
+                        PendingWork.resource_id > resource_id)))
+    if newest_first:
+        query = query.order_by(PendingWork.created_at.desc(),
+                               PendingWork.resource_id.desc())
+    else:
+        query = query.order_by(PendingWork.created_at,
+                               PendingWork.resource_id)
+    return query.limit(limit).all()
@@ -0,0 +1,696 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Storage of the tasks for HDN operators.
+
+Filters, sorting, pagination and field selection are all done by the
+database: listings only read the rows of the requested page, and only the
+columns of the requested fields.
+
+Tasks which ended a while ago are moved to an archive table, so that the
+table of current tasks stays small. The archive is only read when asked.
+
+Open tasks with a deadline have an escalate_at time, indexed so that the
+tasks due for escalation are found with a range scan; it is cleared once
+they end, and only set on BLOCKED tasks once they can be claimed.
+
+Every operation changing tasks records a change in a change log, whose
+autoincrement key is the change sequence number stored in the tasks it
+changes. Numbers are taken without waiting for other transactions, and
+are therefore not committed in order: watchers read the tasks changed
+after the last change they saw with a range scan, up to the first number
+whose transaction may still be in progress.
+
+Tasks depending on open tasks are BLOCKED, and count those tasks. When a
+task ends, only the tasks waiting for it are updated, and those which are
+not waiting for any other task anymore become PENDING, and can be claimed.
+"""
+
+import collections
+import datetime
+
+from neutron.db import sqlalchemyutils
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+import sqlalchemy as sa
+
+from hdn.common import constants
+from hdn.common import exceptions
+from hdn.common import utils
+from hdn.db import hooks
+from hdn.db.models import hdn_models
+
+Task = hdn_models.HdnTask
+TaskArchive = hdn_models.HdnTaskArchive
+Change = hdn_models.HdnTaskChange
+Dependency = hdn_models.HdnTaskDependency
+
+# Notified of the changes committed by this process, and of those
+# committed by other servers found while requests wait for changes
+CHANGES = utils.ChangeNotifier()
+
+# Seconds after which a change sequence number missing from the change
+# log is taken as rolled back. Tasks changed by transactions lasting
+# longer than that can be missed by watchers.
+CHANGE_TIMEOUT = 60
+
+# Task attributes exposed by the API, and the columns storing them
+API_COLUMNS = collections.OrderedDict([
+    ('id', 'id'),
+    ('tenant_id', 'tenant_id'),
+    ('action', 'action'),
+    ('object', 'object_id'),
+    ('type', 'object_type'),
+    ('status', 'status'),
+    ('claimed_by', 'claimed_by'),
+    ('claim_expires', 'claim_expires'),
+    ('priority', 'priority'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+    ('deadline', 'deadline'),
+    ('escalations', 'escalations'),
+    ('seq', 'seq'),
+    ('blockers', 'blockers'),
+])
+
+# Tasks which can be archived
+ARCHIVED_STATUSES = (constants.TASK_COMPLETED, constants.TASK_FAILED)
+
+# Tasks which did not end, and which other tasks can depend on
+OPEN_STATUSES = (constants.TASK_PENDING, constants.TASK_CLAIMED,
+                 constants.TASK_BLOCKED)
+
+# Number of tasks written by a single INSERT statement
+INSERT_CHUNK_SIZE = 500
+
+# Rounds of the compare-and-swap claim, when other operators keep taking
+# the candidate tasks first
+CLAIM_ATTEMPTS = 3
+
+
+def _columns(fields=None, model=Task):
+    attributes = [attribute for attribute in API_COLUMNS
+                  if not fields or attribute in fields]
+    return attributes, [getattr(model, API_COLUMNS[attribute])
+                        for attribute in attributes]
+
+
+def _make_dict(attributes, row, archived=False, fields=None):
+    task = dict((attribute, value.isoformat()
+                 if isinstance(value, datetime.datetime) else value)
+                for attribute, value in zip(attributes, row))
+    if not fields or 'archived' in fields:
+        task['archived'] = archived
+    return task
+
+
+def _query(session, entities, tenant_id=None, filters=None, model=Task):
+    query = session.query(*entities)
+    if tenant_id is not None:
+        query = query.filter(model.tenant_id == tenant_id)
+    for attribute, values in (filters or {}).items():
+        if attribute in API_COLUMNS and values:
+            query = query.filter(
+                getattr(model, API_COLUMNS[attribute]).in_(values))
+    return query
+
+
+def get_tasks(session, tenant_id=None, filters=None, fields=None,
+              sorts=None, limit=None, marker=None, page_reverse=False,
+              archived=False):
+    """Return a page of tasks as dicts keyed by API attribute.
+
+    filters maps attributes to lists of accepted values, and sorts is a
+    list of (attribute, ascending) tuples. Only tasks of tenant_id are
+    returned, unless it is None. Archived tasks are returned instead of
+    current ones if archived is set.
+    """
+    model = TaskArchive if archived else Task
+    attributes, columns = _columns(fields, model)
+    query = _query(session, columns, tenant_id, filters, model)
+    sorts = [(API_COLUMNS[key], ascending)
+             for key, ascending in sorts or []]
+    # The id makes the order, and therefore the pages, deterministic
+    if not any(key == 'id' for key, _ascending in sorts):
+        sorts.append(('id', True))
+    if page_reverse:
+        sorts = [(key, not ascending) for key, ascending in sorts]
+    marker_obj = None
+    if marker:
+        marker_obj = _query(session, [model], tenant_id,
+                            model=model).filter(model.id == marker).first()
+        if marker_obj is None:
+            raise exceptions.TaskNotFound(task_id=marker)
+    query = sqlalchemyutils.paginate_query(query, model, limit, sorts,
+                                           marker_obj=marker_obj)
+    tasks = [_make_dict(attributes, row, archived, fields)
+             for row in query]
+    if page_reverse:
+        tasks.reverse()
+    return tasks
+
+
+def get_task(session, task_id, tenant_id=None, fields=None):
+    attributes, columns = _columns(fields)
+    row = _query(session, columns, tenant_id).filter(
+        Task.id == task_id).first()
+    if row is None:
+        raise exceptions.TaskNotFound(task_id=task_id)
+    return _make_dict(attributes, row, fields=fields)
+
+
+def _next_seq(session):
+    """Return a change sequence number for the changes being made.
+
+    The change is recorded in the change log, whose autoincrement key
+    gives the number: no lock is held until the transaction ends, so that
+    transactions changing tasks, claims in particular, do not wait for
+    each other.
+    """
+    with session.begin(subtransactions=True):
+        seq = session.execute(Change.__table__.insert().values(
+            created_at=timeutils.utcnow())).inserted_primary_key[0]
+    hooks.call_after_commit(session, CHANGES.notify)
+    return seq
+
+
+def _seq_step(session):
+    # Galera clusters make every node take autoincrement values
+    # auto_increment_increment apart
+    if session.get_bind().dialect.name == 'mysql':
+        return session.execute(
+            'SELECT @@auto_increment_increment').scalar() or 1
+    return 1
+
+
+def _settled_seq(session):
+    """Return the last change numbered more than CHANGE_TIMEOUT ago."""
+    cutoff = timeutils.utcnow() - datetime.timedelta(seconds=CHANGE_TIMEOUT)
+    return session.query(Change.id).filter(
+        Change.created_at < cutoff).order_by(
+        Change.created_at.desc(), Change.id.desc()).limit(1).scalar()
+
+
+def get_visible_seq(session, since=0):
+    """Return the sequence number up to which every change is committed.
+
+    Numbers are taken in order, but their transactions commit in any
+    order: a number missing from the change log belongs to a transaction
+    in progress, or rolled back. Changes are visible up to the first
+    missing number, unless it was taken more than CHANGE_TIMEOUT seconds
+    ago. Only the changes numbered since then, and after since, are read.
+    """
+    visible = max(since, _settled_seq(session) or 0)
+    step = _seq_step(session)
+    for row in session.query(Change.id).filter(
+            Change.id > visible).order_by(Change.id):
+        if row.id - visible > step:
+            break
+        visible = row.id
+    return visible
+
+
+def purge_changes(session, limit):
+    """Remove up to limit changes numbered more than CHANGE_TIMEOUT ago.
+
+    The last of them is kept, as get_visible_seq starts from it. Tasks
+    keep their sequence numbers. Returns the number of changes removed.
+    """
+    with session.begin(subtransactions=True):
+        settled = _settled_seq(session)
+        oldest = session.query(sa.func.min(Change.id)).scalar()
+        if settled is None or oldest >= settled:
+            return 0
+        return session.query(Change).filter(
+            Change.id < min(settled, oldest + limit)).delete(
+            synchronize_session=False)
+
+
+def _make_row(task, deadline=None):
+    row = dict((API_COLUMNS[attribute], value)
+               for attribute, value in task.items()
+               if attribute in API_COLUMNS)
+    row.setdefault('id', uuidutils.generate_uuid())
+    row.setdefault('status', constants.TASK_PENDING)
+    row.setdefault('priority', constants.TASK_PRIORITY_NORMAL)
+    row['created_at'] = row['updated_at'] = timeutils.utcnow()
+    row['escalations'] = 0
+    row['blockers'] = 0
+    if deadline:
+        row['deadline'] = row['created_at'] + datetime.timedelta(
+            seconds=deadline)
+    # Tasks are escalated for the first time when they miss their deadline
+    row['escalate_at'] = row.get('deadline')
+    return row
+
+
+def _chunks(items, size=INSERT_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _add_dependencies(session, rows, tasks):
+    """Make new tasks depend on the open tasks of the resources they need.
+
+    The depends_on key of each task lists the (type, id) tuples of those
+    resources. The rows of the tasks depending on open tasks are made
+    BLOCKED, with their number of blockers. Returns the dependencies, as
+    rows of the dependencies table.
+
+    The open tasks are locked, so that a task ending concurrently is
+    either seen as ended, or releases the new tasks once they are
+    committed.
+    """
+    needed = set()
+    for task in tasks:
+        needed.update(tuple(parent) for parent in task.get('depends_on', ()))
+    if not needed:
+        return []
+    # Tasks created together can depend on each other
+    open_tasks = collections.defaultdict(set)
+    for row in rows:
+        open_tasks[row['object_type'], row['object_id']].add(row['id'])
+    for chunk in _chunks(set(object_id for _type, object_id in needed)):
+        for row in session.query(
+                Task.id, Task.object_type, Task.object_id).filter(
+                Task.object_id.in_(chunk),
+                Task.status.in_(OPEN_STATUSES)).with_for_update():
+            open_tasks[row.object_type, row.object_id].add(row.id)
+    dependencies = []
+    for row, task in zip(rows, tasks):
+        depends_on = set()
+        for parent in task.get('depends_on', ()):
+            depends_on.update(open_tasks.get(tuple(parent), ()))
+        if depends_on:
+            row['blockers'] = len(depends_on)
+            row['status'] = constants.TASK_BLOCKED
+            # Operators cannot work on blocked tasks, they are escalated
+            # once they can be claimed
+            row['escalate_at'] = None
+            dependencies.extend(
+                {'task_id': row['id'], 'depends_on_id': task_id}
+                for task_id in depends_on)
+    return dependencies
+
+
+def _insert_dependencies(session, dependencies):
+    for chunk in _chunks(dependencies):
+        session.execute(Dependency.__table__.insert().values(chunk))
+
+
+def _release_dependents(session, task_ids, seq):
+    """Unblock the tasks waiting for task_ids, which ended.
+
+    Only the dependencies of task_ids are read and removed, and only the
+    tasks waiting for them are updated. Tasks which can be claimed again
+    are escalated from their deadline, if any.
+    """
+    with session.begin(subtransactions=True):
+        # Tasks which ended do not wait for others anymore
+        session.query(Dependency).filter(
+            Dependency.task_id.in_(task_ids)).delete(
+            synchronize_session=False)
+        # Locking reads see the dependencies committed since the
+        # transaction started
+        waiting = session.query(Dependency.task_id).filter(
+            Dependency.depends_on_id.in_(task_ids)).with_for_update()
+        dependents = collections.Counter(row.task_id for row in waiting)
+        if not dependents:
+            return
+        waiting.delete(synchronize_session=False)
+        by_count = collections.defaultdict(list)
+        for task_id, count in dependents.items():
+            by_count[count].append(task_id)
+        for count, ids in by_count.items():
+            for chunk in _chunks(ids):
+                session.query(Task).filter(Task.id.in_(chunk)).update(
+                    {'blockers': Task.blockers - count, 'seq': seq},
+                    synchronize_session=False)
+        for chunk in _chunks(dependents):
+            session.query(Task).filter(
+                Task.id.in_(chunk), Task.status == constants.TASK_BLOCKED,
+                Task.blockers <= 0).update(
+                {'status': constants.TASK_PENDING,
+                 'escalate_at': Task.deadline,
+                 'updated_at': timeutils.utcnow()},
+                synchronize_session=False)
+
+
+def create_task(session, task, deadline=None):
+    """Store a task, given as a dict keyed by API attribute.
+
+    Tasks are given deadline seconds to end, if set, and wait for the end
+    of the open tasks of the resources listed in their depends_on key.
+    """
+    row = _make_row(task, deadline)
+    with session.begin(subtransactions=True):
+        row['seq'] = _next_seq(session)
+        dependencies = _add_dependencies(session, [row], [task])
+        session.execute(Task.__table__.insert(), [row])
+        _insert_dependencies(session, dependencies)
+    return _make_dict(list(API_COLUMNS),
+                      [row.get(column) for column in API_COLUMNS.values()])
+
+
+def create_tasks(session, tasks, deadline=None):
+    """Store several tasks with multi-row INSERT statements."""
+    rows = [_make_row(task, deadline) for task in tasks]
+    # Every row must have the same columns for a multi-row insert
+    columns = set(['seq'])
+    for row in rows:
+        columns.update(row)
+    rows = [dict((column, row.get(column)) for column in columns)
+            for row in rows]
+    with session.begin(subtransactions=True):
+        seq = _next_seq(session)
+        for row in rows:
+            row['seq'] = seq
+        dependencies = _add_dependencies(session, rows, tasks)
+        for chunk in _chunks(rows):
+            session.execute(Task.__table__.insert().values(chunk))
+        _insert_dependencies(session, dependencies)
+    return len(rows)
+
+
+def update_task(session, task_id, values, tenant_id=None):
+    """Update a task, given the new values of its API attributes.
+
+    Tasks waiting for other tasks cannot be made PENDING, but they can be
+    ended. Ended tasks made PENDING again are escalated from their
+    deadline.
+    """
+    values = dict((API_COLUMNS[attribute], value)
+                  for attribute, value in values.items()
+                  if attribute in API_COLUMNS and attribute != 'id')
+    status = values.get('status')
+    if status in constants.TASK_STATUSES:
+        # Tasks are released once operators set their status
+        values.update(claimed_by=None, claim_id=None, claim_expires=None)
+    with session.begin(subtransactions=True):
+        task = _query(session, [Task.status, Task.blockers, Task.deadline],
+                      tenant_id).filter(
+            Task.id == task_id).with_for_update().first()
+        if task is None:
+            raise exceptions.TaskNotFound(task_id=task_id)
+        if status == constants.TASK_PENDING:
+            if task.blockers > 0:
+                raise exceptions.TaskBlocked(task_id=task_id,
+                                             blockers=task.blockers)
+            if task.status in ARCHIVED_STATUSES:
+                values['escalate_at'] = task.deadline
+        elif status in ARCHIVED_STATUSES:
+            # Tasks which ended are not escalated, and do not wait for
+            # other tasks anymore
+            values.update(escalate_at=None, blockers=0)
+        if values:
+            values['updated_at'] = timeutils.utcnow()
+            values['seq'] = _next_seq(session)
+            session.query(Task).filter(Task.id == task_id).update(
+                values, synchronize_session=False)
+        if status in ARCHIVED_STATUSES:
+            _release_dependents(session, [task_id], values['seq'])
+        return get_task(session, task_id)
+
+
+def delete_task(session, task_id, tenant_id=None):
+    with session.begin(subtransactions=True):
+        # The task is locked first, as when it ends, so that tasks made to
+        # depend on it concurrently are released as well
+        if _query(session, [Task.id], tenant_id).filter(
+                Task.id == task_id).with_for_update().first() is None:
+            raise exceptions.TaskNotFound(task_id=task_id)
+        _release_dependents(session, [task_id], _next_seq(session))
+        session.query(Task).filter(Task.id == task_id).delete(
+            synchronize_session=False)
+
+
+def end_tasks(session, object_type, object_ids, status):
+    """End the open tasks of resources HDN operators completed.
+
+    The tasks of the object_type resources in object_ids are given status
+    and released, and so are the tasks waiting for them. Returns the ids
+    of the tasks ended.
+    """
+    with session.begin(subtransactions=True):
+        task_ids = []
+        for chunk in _chunks(object_ids):
+            task_ids.extend(row.id for row in session.query(Task.id).filter(
+                Task.object_id.in_(chunk), Task.object_type == object_type,
+                Task.status.in_(OPEN_STATUSES)).with_for_update())
+        if not task_ids:
+            return []
+        seq = _next_seq(session)
+        for chunk in _chunks(task_ids):
+            session.query(Task).filter(Task.id.in_(chunk)).update(
+                {'status': status, 'claimed_by': None, 'claim_id': None,
+                 'claim_expires': None, 'escalate_at': None, 'blockers': 0,
+                 'updated_at': timeutils.utcnow(), 'seq': seq},
+                synchronize_session=False)
+        _release_dependents(session, task_ids, seq)
+    return task_ids
+
+
+def _claimable(now):
+    # Claims which were not renewed in time return tasks to the queue
+    return sa.or_(Task.status == constants.TASK_PENDING,
+                  sa.and_(Task.status == constants.TASK_CLAIMED,
+                          Task.claim_expires < now))
+
+
+def _supports_skip_locked(dialect):
+    version = dialect.server_version_info or ()
+    if dialect.name == 'postgresql':
+        return version >= (9, 5)
+    if dialect.name == 'mysql':
+        if 'MariaDB' in version:
+            return version >= (10, 6)
+        return version >= (8, 0, 1)
+    return False
+
+
+def _select_skip_locked(session, query):
+    """Run query as SELECT ... FOR UPDATE SKIP LOCKED.
+
+    SQLAlchemy does not render SKIP LOCKED before version 1.1, so the
+    clause is appended to the compiled statement.
+    """
+    connection = session.connection()
+    compiled = query.with_for_update().statement.compile(
+        dialect=connection.dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = [params[name] for name in compiled.positiontup]
+    return [row[0] for row in connection.execute(
+        "%s SKIP LOCKED" % compiled, params)]
+
+
+def _assign(session, ids, values, now):
+    return session.query(Task).filter(
+        Task.id.in_(ids), _claimable(now)).update(
+        values, synchronize_session=False)
+
+
+def _candidates(session, now):
+    """Return the queries selecting the tasks to claim, in claim order.
+
+    Tasks whose claim expired were claimed before any pending task, and
+    come first. Pending tasks are taken by priority, then oldest first.
+    Each query is answered by an index range scan.
+    """
+    return [session.query(Task.id).filter(
+                Task.status == constants.TASK_CLAIMED,
+                Task.claim_expires < now).order_by(Task.claim_expires),
+            session.query(Task.id).filter(
+                Task.status == constants.TASK_PENDING).order_by(
+                Task.priority, Task.created_at, Task.id)]
+
+
+def claim_tasks(session, count, claimer, lease):
+    """Assign up to count tasks waiting for an operator to claimer.
+
+    The tasks are held by claimer for lease seconds; if the claim is not
+    renewed by then, they return to the queue and can be claimed by other
+    operators. Returns the claimed tasks as dicts.
+
+    Where the database supports it, candidate tasks are locked with
+    SELECT ... FOR UPDATE SKIP LOCKED, so that concurrent claimers get
+    disjoint sets of tasks without waiting for each other. Elsewhere, the
+    candidates are assigned with an update conditional on their status,
+    and tasks taken by another claimer in the meanwhile are skipped.
+    """
+    now = timeutils.utcnow()
+    claim_id = uuidutils.generate_uuid()
+    values = {'status': constants.TASK_CLAIMED,
+              'claimed_by': claimer,
+              'claim_id': claim_id,
+              'claim_expires': now + datetime.timedelta(seconds=lease),
+              'updated_at': now}
+    skip_locked = _supports_skip_locked(session.get_bind().dialect)
+    claimed = 0
+    with session.begin(subtransactions=True):
+        for candidates in _candidates(session, now):
+            for _attempt in range(CLAIM_ATTEMPTS):
+                if claimed >= count:
+                    break
+                query = candidates.limit(count - claimed)
+                if skip_locked:
+                    ids = _select_skip_locked(session, query)
+                else:
+                    ids = [row.id for row in query]
+                if not ids:
+                    break
+                # Claims finding nothing do not record a change
+                if 'seq' not in values:
+                    values['seq'] = _next_seq(session)
+                claimed += _assign(session, ids, values, now)
+                # Locked tasks cannot be taken by anyone else
+                if skip_locked:
+                    break
+    attributes, columns = _columns()
+    return [_make_dict(attributes, row) for row in session.query(
+        *columns).filter(Task.claim_id == claim_id).order_by(
+        Task.priority, Task.created_at, Task.id)]
+
+
+def renew_claims(session, task_ids, claimer, lease):
+    """Extend the claims of claimer on task_ids by lease seconds.
+
+    Returns the ids of the tasks still held by claimer. Tasks whose claim
+    expired and were claimed by another operator are not renewed.
+    """
+    if not task_ids:
+        return []
+    expires = timeutils.utcnow() + datetime.timedelta(seconds=lease)
+    held = sa.and_(Task.id.in_(task_ids),
+                   Task.status == constants.TASK_CLAIMED,
+                   Task.claimed_by == claimer)
+    with session.begin(subtransactions=True):
+        session.query(Task).filter(held).update(
+            {'claim_expires': expires, 'seq': _next_seq(session)},
+            synchronize_session=False)
+        return [row.id for row in session.query(Task.id).filter(held)]
+
+
+def archive_tasks(session, older_than, limit, marker=None):
+    """Move up to limit tasks which ended a while ago to the archive.
+
+    Completed and failed tasks not updated for older_than seconds are
+    copied to the archive and removed, with an INSERT ... SELECT and a
+    DELETE for the whole batch. Tasks are taken in primary key order,
+    after marker if given, so that successive batches do not read again
+    the tasks which could not be archived yet.
+
+    Returns the ids of the archived tasks.
+    """
+    now = timeutils.utcnow()
+    cutoff = now - datetime.timedelta(seconds=older_than)
+    query = session.query(Task.id).filter(
+        Task.status.in_(ARCHIVED_STATUSES),
+        # Tasks created before timestamps were added are old enough
+        sa.or_(Task.updated_at < cutoff, Task.updated_at.is_(None)))
+    if marker:
+        query = query.filter(Task.id > marker)
+    with session.begin(subtransactions=True):
+        ids = [row.id for row in query.order_by(Task.id).limit(
+            limit).with_for_update()]
+        if not ids:
+            return []
+        archivable = sa.and_(Task.id.in_(ids),
+                             Task.status.in_(ARCHIVED_STATUSES))
+        columns = [column.name for column in Task.__table__.columns]
+        session.execute(TaskArchive.__table__.insert().from_select(
+            columns + ['archived_at'],
+            sa.select([Task.__table__.c[column] for column in columns] +
+                      [sa.literal(now, sa.DateTime)]).where(archivable)))
+        session.query(Task).filter(archivable).delete(
+            synchronize_session=False)
+    return ids
+
+
+def get_escalations(session, until, limit, after=None):
+    """Return open tasks to escalate before until, in escalation order.
+
+    Returns up to limit (escalate_at, id) tuples, following after, an
+    (escalate_at, id) tuple, if given. The tasks are read with a range
+    scan of the escalate_at index, which only holds open tasks.
+    """
+    query = session.query(Task.escalate_at, Task.id).filter(
+        Task.escalate_at < until)
+    if after:
+        query = query.filter(sa.or_(
+            Task.escalate_at > after[0],
+            sa.and_(Task.escalate_at == after[0], Task.id > after[1])))
+    return [tuple(row) for row in query.order_by(
+        Task.escalate_at, Task.id).limit(limit)]
+
+
+def escalate_tasks(session, task_ids, now, interval, priority_step):
+    """Escalate the tasks in task_ids which are still due at now.
+
+    The priority of the tasks is raised by priority_step, up to the
+    highest, and they are escalated again after interval seconds if they
+    are still open by then. Tasks which ended or were rescheduled since
+    task_ids was read are skipped. Returns the escalated tasks as dicts.
+    """
+    if not task_ids:
+        return []
+    highest = constants.TASK_PRIORITY_HIGHEST
+    with session.begin(subtransactions=True):
+        ids = [row.id for row in session.query(Task.id).filter(
+            Task.id.in_(task_ids), Task.escalate_at <= now).with_for_update()]
+        if not ids:
+            return []
+        session.query(Task).filter(Task.id.in_(ids)).update(
+            {'seq': _next_seq(session),
+             'escalate_at': now + datetime.timedelta(seconds=interval),
+             'escalations': Task.escalations + 1,
+             # Lower values are claimed first
+             'priority': sa.case(
+                 [(Task.priority - priority_step < highest, highest)],
+                 else_=Task.priority - priority_step),
+             'updated_at': now},
+            synchronize_session=False)
+        attributes, columns = _columns()
+        return [_make_dict(attributes, row) for row in session.query(
+            *columns).filter(Task.id.in_(ids)).order_by(Task.deadline,
+                                                        Task.id)]
+
+
+def get_changes(session, since, limit, tenant_id=None, fields=None):
+    """Return the tasks changed after the change numbered since.
+
+    Returns up to limit tasks, as dicts, in change order, and the sequence
+    number to pass as since to get the following changes. Tasks changed
+    by the same operation are always returned together, even if there are
+    more than limit of them. Deleted and archived tasks are not
+    returned.
+    """
+    # Changes numbered after visible may not be committed yet
+    visible = get_visible_seq(session, since)
+    attributes, columns = _columns(fields)
+    # Columns past the requested fields are not returned
+    columns.extend([Task.seq, Task.id])
+    query = _query(session, columns, tenant_id).filter(
+        Task.seq > since, Task.seq <= visible).order_by(Task.seq, Task.id)
+    rows = query.limit(limit).all()
+    if len(rows) < limit:
+        return [_make_dict(attributes, row, fields=fields)
+                for row in rows], visible
+    # The remaining tasks changed by the last operation returned
+    seq, last_id = rows[-1][-2:]
+    rows.extend(_query(session, columns, tenant_id).filter(
+        Task.seq == seq, Task.id > last_id).order_by(Task.id))
+    return [_make_dict(attributes, row, fields=fields) for row in rows], seq
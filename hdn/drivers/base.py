@@ -0,0 +1,75 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import abc
+from email.mime import multipart
+from email.mime import text as mimetext
+
+from oslo_config import cfg
+import six
+
+
+def build_message(subject, text):
+    msg = multipart.MIMEMultipart()
+    msg['From'] = cfg.CONF.HDN.smtp_user
+    msg['To'] = ",".join(cfg.CONF.HDN.recipients)
+    msg['Subject'] = subject
+    msg.attach(mimetext.MIMEText(text))
+    return msg
+
+
+@six.add_metaclass(abc.ABCMeta)
+class NotificationDriver(object):
+    """Deliver notifications to HDN operators.
+
+    Drivers are loaded from the 'hdn.notification_drivers' entry point
+    namespace, according to the value of [HDN] notification_driver, and
+    are instantiated without arguments.
+    """
+
+    @abc.abstractmethod
+    def send(self, subject, text):
+        """Deliver a single notification."""
+
+    def send_batch(self, messages):
+        """Deliver several notifications.
+
+        messages is a list of (subject, text) tuples. Returns a list with,
+        for each message, None if it was delivered or the exception which
+        prevented its delivery.
+        """
+        results = []
+        for subject, text in messages:
+            try:
+                self.send(subject, text)
+            except Exception as e:
+                results.append(e)
+            else:
+                results.append(None)
+        return results
+
+    def check(self):
+        """Verify that notifications can be delivered.
+
+        Raises an exception if they cannot. Used for probing the transport
+        after it failed.
+        """
+
+    def get_stats(self):
+        """Return driver specific statistics."""
+        return {}
+
+    def close(self):
+        """Release any resource held by the driver."""
@@ -0,0 +1,75 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mailbox
+import threading
+
+from oslo_config import cfg
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+
+from hdn.drivers import base
+
+
+class MaildirDriver(base.NotificationDriver):
+    """Store each notification as a file in a maildir directory."""
+
+    def __init__(self):
+        self.maildir = mailbox.Maildir(cfg.CONF.HDN.notification_path,
+                                       factory=None, create=True)
+
+    def send(self, subject, text):
+        self.maildir.add(base.build_message(subject, text))
+
+
+class MboxDriver(base.NotificationDriver):
+    """Append notifications to a mbox file."""
+
+    def __init__(self):
+        self.mbox = mailbox.mbox(cfg.CONF.HDN.notification_path)
+        self._lock = threading.Lock()
+
+    def send(self, subject, text):
+        with self._lock:
+            self.mbox.lock()
+            try:
+                self.mbox.add(base.build_message(subject, text))
+                self.mbox.flush()
+            finally:
+                self.mbox.unlock()
+
+    def close(self):
+        self.mbox.close()
+
+
+class JSONFileDriver(base.NotificationDriver):
+    """Append notifications to a file as JSON documents, one per line."""
+
+    def __init__(self):
+        self._file = open(cfg.CONF.HDN.notification_path, 'a')
+        self._lock = threading.Lock()
+
+    def send(self, subject, text):
+        line = jsonutils.dumps({'timestamp': timeutils.utcnow().isoformat(),
+                                'recipients': cfg.CONF.HDN.recipients,
+                                'subject': subject,
+                                'text': text})
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,40 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+
+from hdn.drivers import base
+
+MAX_MESSAGES = 1000
+
+
+class NullDriver(base.NotificationDriver):
+    """Discard notifications.
+
+    Useful to measure the cost of the plugin without notifications.
+    """
+
+    def send(self, subject, text):
+        pass
+
+
+class MemoryDriver(base.NotificationDriver):
+    """Keep the most recent notifications in memory."""
+
+    def __init__(self):
+        self.messages = collections.deque(maxlen=MAX_MESSAGES)
+
+    def send(self, subject, text):
+        self.messages.append((subject, text))
@@ -0,0 +1,91 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import functools
+import smtplib
+
+from oslo_config import cfg
+
+from hdn.common import smtppool
+from hdn.drivers import base
+
+
+def _parse_relay(relay):
+    # relay is either 'host' or 'host:port'
+    host, sep, port = relay.rpartition(':')
+    if sep and port.isdigit():
+        return host, int(port)
+    return relay, cfg.CONF.HDN.smtp_port
+
+
+class SMTPDriver(base.NotificationDriver):
+    """Send notifications through pools of SMTP sessions.
+
+    Notifications are spread across the relays listed in smtp_servers, or
+    sent to smtp_server if that list is empty.
+    """
+
+    def __init__(self):
+        conf = cfg.CONF.HDN
+        relays = ([_parse_relay(relay) for relay in conf.smtp_servers] or
+                  [(conf.smtp_server, conf.smtp_port)])
+        self.relays = smtppool.RelayGroup(
+            [smtppool.SMTPSessionPool(
+                host, port,
+                user=conf.smtp_user,
+                password=conf.smtp_password,
+                starttls=conf.smtp_starttls,
+                max_size=conf.smtp_pool_size,
+                idle_timeout=conf.smtp_pool_idle_timeout,
+                check_interval=conf.smtp_pool_check_interval,
+                timeout=conf.smtp_timeout) for host, port in relays],
+            policy=conf.smtp_balancing,
+            down_interval=conf.smtp_relay_down_interval)
+
+    def send(self, subject, text):
+        self.relays.sendmail(cfg.CONF.HDN.smtp_user,
+                             cfg.CONF.HDN.recipients,
+                             base.build_message(subject, text).as_string())
+
+    def send_batch(self, messages):
+        # All the messages go through a single, possibly pipelined, session
+        return self.relays.sendmany(
+            cfg.CONF.HDN.smtp_user,
+            [(cfg.CONF.HDN.recipients,
+              base.build_message(subject, text).as_string())
+             for subject, text in messages])
+
+    def check(self):
+        self.relays.check()
+
+    def get_stats(self):
+        return {'relays': self.relays.get_stats()}
+
+    def close(self):
+        self.relays.close()
+
+
+class LMTPDriver(SMTPDriver):
+    """Deliver notifications to a local LMTP server over a Unix socket."""
+
+    def __init__(self):
+        conf = cfg.CONF.HDN
+        self.relays = smtppool.RelayGroup([smtppool.SMTPSessionPool(
+            conf.lmtp_socket, None,
+            starttls=False,
+            max_size=conf.smtp_pool_size,
+            idle_timeout=conf.smtp_pool_idle_timeout,
+            check_interval=conf.smtp_pool_check_interval,
+            connect=functools.partial(smtplib.LMTP, conf.lmtp_socket))])
@@ -0,0 +1,62 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.api import extensions
+
+from hdn.db import idempotency_db
+
+# The key is only accepted on create, and never returned
+_KEY_ATTRIBUTE = {
+    idempotency_db.KEY_ATTRIBUTE: {
+        'allow_post': True, 'allow_put': False,
+        'validate': {'type:string_or_none': 255},
+        'default': None, 'is_visible': False}
+}
+
+EXTENDED_ATTRIBUTES_2_0 = {
+    'networks': _KEY_ATTRIBUTE,
+    'ports': _KEY_ATTRIBUTE,
+    'subnets': _KEY_ATTRIBUTE,
+    'routers': _KEY_ATTRIBUTE,
+    'floatingips': _KEY_ATTRIBUTE,
+}
+
+
+class Hdnidempotency(extensions.ExtensionDescriptor):
+
+    """API extension for deduplicating retried create requests."""
+
+    @classmethod
+    def get_name(cls):
+        return "HDN idempotency keys"
+
+    @classmethod
+    def get_alias(cls):
+        return "hdn-idempotency"
+
+    @classmethod
+    def get_description(cls):
+        return ("Allows retrying a create request with the same "
+                "idempotency_key without creating another resource.")
+
+    @classmethod
+    def get_updated(cls):
+        return "2015-10-26T00:00:00-00:00"
+
+    def get_extended_resources(self, version):
+        if version == "2.0":
+            return EXTENDED_ATTRIBUTES_2_0
+        else:
+            return {}
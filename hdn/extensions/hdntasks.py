@@ -17,7 +17,9 @@ import abc
 from neutron.api import extensions
 from neutron.api.v2 import attributes
 from neutron.api.v2 import resource_helper
+from oslo_config import cfg
 
+from hdn.common import config  # noqa
 from hdn.common import constants
 from hdn import extensions as hdn_extensions
 
@@ -25,6 +27,31 @@ from hdn import extensions as hdn_extensions
 extensions.append_api_extensions_path(hdn_extensions.__path__)
 
 
+def _validate_completion_items(data, valid_values=None):
+    if not isinstance(data, list):
+        return _("'%s' is not a list") % data
+    if len(data) > cfg.CONF.HDN.completion_max_items:
+        return (_("At most %d items can be completed at once") %
+                cfg.CONF.HDN.completion_max_items)
+    for item in data:
+        if not isinstance(item, dict):
+            return _("'%s' is not a dictionary") % item
+        if set(item) != set(['resource', 'id', 'outcome']):
+            return (_("Item %s must have resource, id and outcome keys "
+                      "only") % item)
+        msg = (attributes._validate_values(
+            item['resource'], constants.COMPLETION_RESOURCES) or
+            attributes._validate_uuid(item['id']) or
+            attributes._validate_values(item['outcome'],
+                                        constants.OUTCOMES))
+        if msg:
+            return msg
+
+
+attributes.validators['type:hdn_completion_items'] = (
+    _validate_completion_items)
+
+
 RESOURCE_ATTRIBUTE_MAP = {
     'tasks': {
         'id': {'allow_post': False, 'allow_put': False,
@@ -40,10 +67,123 @@ RESOURCE_ATTRIBUTE_MAP = {
                       'validate': {'type:string': None},
                       'required_by_policy': True,
                       'is_visible': True},
-        'status': {'allow_post': False, 'allow_put': False,
-                   'validate': {'type:string': None},
+        'status': {'allow_post': False, 'allow_put': True,
+                   'validate': {'type:values': constants.TASK_STATUSES},
                    'required_by_policy': True,
-                   'is_visible': True}
+                   'is_visible': True},
+        'claimed_by': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
+        'claim_expires': {'allow_post': False, 'allow_put': False,
+                          'is_visible': True},
+        'priority': {'allow_post': False, 'allow_put': True,
+                     'validate': {'type:range': [
+                         constants.TASK_PRIORITY_HIGHEST,
+                         constants.TASK_PRIORITY_LOWEST]},
+                     'convert_to': attributes.convert_to_int,
+                     'is_visible': True},
+        'created_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
+        'updated_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
+        'deadline': {'allow_post': False, 'allow_put': False,
+                     'is_visible': True},
+        'escalations': {'allow_post': False, 'allow_put': False,
+                        'is_visible': True},
+        'seq': {'allow_post': False, 'allow_put': False,
+                'is_visible': True},
+        # Number of tasks which must end before the task can be claimed
+        'blockers': {'allow_post': False, 'allow_put': False,
+                     'is_visible': True},
+        # Archived tasks are only listed when filtering on archived=True
+        'archived': {'allow_post': False, 'allow_put': False,
+                     'convert_to': attributes.convert_to_boolean,
+                     'is_visible': True}
+    },
+    # Completions report the outcome of the work done by HDN operators for
+    # many resources at once. They are not stored: the response to the
+    # create request carries a result for each item.
+    'completions': {
+        'id': {'allow_post': False, 'allow_put': False,
+               'is_visible': True},
+        'tenant_id': {'allow_post': True, 'allow_put': False,
+                      'validate': {'type:string': None},
+                      'required_by_policy': True,
+                      'is_visible': True},
+        'items': {'allow_post': True, 'allow_put': False,
+                  'validate': {'type:hdn_completion_items': None},
+                  'is_visible': False},
+        'results': {'allow_post': False, 'allow_put': False,
+                    'is_visible': True}
+    },
+    # Task claims assign tasks waiting in the queue to an operator, who
+    # holds them for lease seconds, and renew the claims on tasks the
+    # operator is still working on. Like completions, they are not stored.
+    'task_claims': {
+        'id': {'allow_post': False, 'allow_put': False,
+               'is_visible': True},
+        'tenant_id': {'allow_post': True, 'allow_put': False,
+                      'validate': {'type:string': None},
+                      'required_by_policy': True,
+                      'is_visible': True},
+        'claimer': {'allow_post': True, 'allow_put': False,
+                    'validate': {'type:string': 255},
+                    'default': '', 'is_visible': True},
+        'count': {'allow_post': True, 'allow_put': False,
+                  'validate': {'type:non_negative': None},
+                  'convert_to': attributes.convert_to_int,
+                  'default': 1, 'is_visible': True},
+        'lease': {'allow_post': True, 'allow_put': False,
+                  'validate': {'type:non_negative': None},
+                  'convert_to': attributes.convert_to_int,
+                  'default': 0, 'is_visible': True},
+        'renew': {'allow_post': True, 'allow_put': False,
+                  'validate': {'type:uuid_list': None},
+                  'default': [], 'is_visible': False},
+        'renewed': {'allow_post': False, 'allow_put': False,
+                    'is_visible': True},
+        'tasks': {'allow_post': False, 'allow_put': False,
+                  'is_visible': True}
+    },
+    # Task watches return the tasks changed after the change numbered
+    # since, waiting up to timeout seconds for a change if there is none.
+    # The seq of the response is the since of the next watch.
+    'task_watches': {
+        'id': {'allow_post': False, 'allow_put': False,
+               'is_visible': True},
+        'tenant_id': {'allow_post': True, 'allow_put': False,
+                      'validate': {'type:string': None},
+                      'required_by_policy': True,
+                      'is_visible': True},
+        'since': {'allow_post': True, 'allow_put': False,
+                  'validate': {'type:non_negative': None},
+                  'convert_to': attributes.convert_to_int,
+                  'default': 0, 'is_visible': True},
+        'timeout': {'allow_post': True, 'allow_put': False,
+                    'validate': {'type:non_negative': None},
+                    'convert_to': attributes.convert_to_int,
+                    'default': 30, 'is_visible': True},
+        'limit': {'allow_post': True, 'allow_put': False,
+                  'validate': {'type:non_negative': None},
+                  'convert_to': attributes.convert_to_int,
+                  'default': 0, 'is_visible': True},
+        'seq': {'allow_post': False, 'allow_put': False,
+                'is_visible': True},
+        'tasks': {'allow_post': False, 'allow_put': False,
+                  'is_visible': True}
+    },
+    # Resources waiting for HDN operators, across all resource types
+    'pending_resources': {
+        'id': {'allow_post': False, 'allow_put': False,
+               'is_visible': True},
+        'resource': {'allow_post': False, 'allow_put': False,
+                     'is_visible': True},
+        'tenant_id': {'allow_post': False, 'allow_put': False,
+                      'required_by_policy': True,
+                      'is_visible': True},
+        'status': {'allow_post': False, 'allow_put': False,
+                   'is_visible': True},
+        'created_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True}
     }
 }
 
@@ -109,3 +249,49 @@ class HdnTaskPluginBase(object):
     @abc.abstractmethod
     def update_task(self, context, task_id, task_info):
         pass
+
+    @abc.abstractmethod
+    def create_completion(self, context, completion):
+        pass
+
+    @abc.abstractmethod
+    def get_completions(self, context, filters=None, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def get_completion(self, context, completion_id, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def create_task_claim(self, context, task_claim):
+        pass
+
+    @abc.abstractmethod
+    def get_task_claims(self, context, filters=None, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def get_task_claim(self, context, task_claim_id, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def create_task_watch(self, context, task_watch):
+        pass
+
+    @abc.abstractmethod
+    def get_task_watches(self, context, filters=None, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def get_task_watch(self, context, task_watch_id, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def get_pending_resources(self, context, filters=None, fields=None,
+                              sorts=None, limit=None, marker=None,
+                              page_reverse=False):
+        pass
+
+    @abc.abstractmethod
+    def get_pending_resource(self, context, resource_id, fields=None):
+        pass
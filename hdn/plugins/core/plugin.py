@@ -14,18 +14,23 @@
 #    under the License.
 
 from neutron.callbacks import events
-from neutron.callbacks import registry
 from neutron.callbacks import resources
 from neutron.db import api as db_api
 from neutron.db import db_base_plugin_v2
 from neutron.db import external_net_db
+from neutron.db import models_v2
 from neutron.db import quota_db  # noqa
 
 from oslo_log import log
 
 from hdn.common import config  # noqa
 from hdn.common import constants
+from hdn.common import diff
 from hdn.common import hdnlib
+from hdn.common import reaper
+from hdn.db import hooks
+from hdn.db import idempotency_db
+from hdn.db import pending_db
 
 LOG = log.getLogger(__name__)
 
@@ -68,8 +73,51 @@ class HdnNeutronPlugin(db_base_plugin_v2.NeutronDbPluginV2,
     # 1 - Add the corresponding mixin to the plugin's base class list
     # 2 - Add the extension alias to the plugin's support_extension_aliases
     #     attribute
-    supported_extension_aliases = ["external-net"]
+    supported_extension_aliases = ["external-net", "hdn-idempotency"]
+
+    def __init__(self):
+        super(HdnNeutronPlugin, self).__init__()
+        # Send notifications left in the outbox by a previous run
+        hdnlib.start_outbox_drainer()
+        # API workers are forked after the plugin is loaded, they start the
+        # reaper when notifying operators
+        hdnlib.register_job(reaper.start_reaper)
+
+    def _hdn_create_bulk(self, context, resource, items, create_func,
+                         notify_func):
+        """Create several resources in a single transaction.
+
+        HDN operators receive a single notification for all the resources,
+        and a single AFTER_BULK_CREATE callback event is triggered.
+        """
+        with db_api.autonested_transaction(context.session):
+            # Idempotency keys are honoured for single create requests only
+            for item in items:
+                item[resource.lower()].pop(idempotency_db.KEY_ATTRIBUTE, None)
+            new_items = [create_func(context, item) for item in items]
+            # Callback resource names are upper case for networks only
+            for tenant_id in set(item['tenant_id'] for item in new_items):
+                pending_db.record(
+                    context.session, resource.lower(),
+                    [item['id'] for item in new_items
+                     if item['tenant_id'] == tenant_id],
+                    tenant_id, constants.STATUS_PENDING_CREATE)
+            notify_func(new_items, session=context.session)
+            hooks.notify_after_commit(
+                context.session, resource, constants.AFTER_BULK_CREATE,
+                self, tenant_id=context.tenant_id,
+                resource_ids=[item['id'] for item in new_items])
+        return new_items
+
+    def _create_network_db(self, context, network):
+        # Set the status of the network as 'PENDING CREATE'
+        network['network']['status'] = constants.STATUS_PENDING_CREATE
+        new_net = super(HdnNeutronPlugin, self).create_network(
+            context, network)
+        self._process_l3_create(context, new_net, network['network'])
+        return new_net
 
+    @idempotency_db.idempotent('network')
     def create_network(self, context, network):
         """Instruct HDN operators to create a network
 
@@ -85,32 +133,50 @@ class HdnNeutronPlugin(db_base_plugin_v2.NeutronDbPluginV2,
 
         """
 
-        # Set the status of the network as 'PENDING CREATE'
-        network['network']['status'] = constants.STATUS_PENDING_CREATE
         with db_api.autonested_transaction(context.session):
-            new_net = super(HdnNeutronPlugin, self).create_network(
-                context, network)
-            self._process_l3_create(context, new_net, network['network'])
+            new_net = self._create_network_db(context, network)
+            pending_db.record(context.session, 'network', [new_net['id']],
+                              new_net['tenant_id'],
+                              constants.STATUS_PENDING_CREATE)
+            # Use the HDN library to notify operators about the new network
+            hdnlib.notify_network_create(new_net, session=context.session)
+            # Network is not present in neutron.callbacks.resources
+            # TODO(salv-orlando): do not use literal for resource name
+            hooks.notify_after_commit(context.session, 'NETWORK',
+                                      events.AFTER_CREATE, self,
+                                      tenant_id=context.tenant_id,
+                                      resource_id=new_net['id'])
 
-        # Use the HDN library to notify operators about the new network
         LOG.debug("Queued request to create network: %s", new_net['id'])
-        hdnlib.notify_network_create(new_net)
-        # Network is not present in neutron.callbacks.resources
-        # TODO(salv-orlando): do not use literal for resource name
-        registry.notify('NETWORK', events.AFTER_CREATE, self,
-                        tenant_id=context.tenant_id,
-                        resource_id=new_net['id'])
         return new_net
 
+    def create_network_bulk(self, context, networks):
+        return self._hdn_create_bulk(context, 'NETWORK',
+                                     networks['networks'],
+                                     self._create_network_db,
+                                     hdnlib.notify_network_bulk_create)
+
     # the update network operation is merely a db operation.
     # The HDN plugin therefore does not override it.
 
     def delete_network(self, context, network_id, hdn_operator_call=False):
         with db_api.autonested_transaction(context.session):
             if hdn_operator_call:
+                # Subnets and network owned ports are removed along with
+                # the network, so is the work pending on them
+                removed = {}
+                for resource, model in (('subnet', models_v2.Subnet),
+                                        ('port', models_v2.Port)):
+                    removed[resource] = [
+                        row.id for row in context.session.query(
+                            model.id).filter_by(network_id=network_id)]
                 # the network must be removed from the DB
                 super(HdnNeutronPlugin, self).delete_network(context,
                                                              network_id)
+                pending_db.clear(context.session, 'network', [network_id])
+                for resource, resource_ids in removed.items():
+                    pending_db.clear(context.session, resource,
+                                     resource_ids)
                 LOG.debug("Network delete operation for %s completed",
                           network_id)
                 return
@@ -118,53 +184,77 @@ class HdnNeutronPlugin(db_base_plugin_v2.NeutronDbPluginV2,
             network = self._get_network(context, network_id)
             # Set the status of the network as 'PENDING DELETE'
             network.status = constants.STATUS_PENDING_DELETE
-        if not hdn_operator_call:
+            pending_db.record(context.session, 'network', [network_id],
+                              network.tenant_id,
+                              constants.STATUS_PENDING_DELETE)
+            hdnlib.notify_network_delete({'id': network_id,
+                                          'tenant_id': context.tenant_id},
+                                         session=context.session)
             # This is not really 'after delete', but the meaning here is that
             # AFTER_DELETE is the event to trigger at completion of the delete
             # operation
-            registry.notify('NETWORK', events.AFTER_DELETE, self,
-                            tenant_id=context.tenant_id,
-                            resource_id=network_id)
-            hdnlib.notify_network_delete({'id': network_id,
-                                          'tenant_id': context.tenant_id})
-            LOG.debug("Queued request to delete network: %s", network_id)
+            hooks.notify_after_commit(context.session, 'NETWORK',
+                                      events.AFTER_DELETE, self,
+                                      tenant_id=context.tenant_id,
+                                      resource_id=network_id)
+        LOG.debug("Queued request to delete network: %s", network_id)
 
     # GET operations for networks are not redefined. The operation defined
     # in NeutronDBPluginV2 is enough for the HDN plugin
 
-    def create_port(self, context, port):
+    def _create_port_db(self, context, port):
         # Set port status as PENDING_CREATE
         port['port']['status'] = constants.STATUS_PENDING_CREATE
+        return super(HdnNeutronPlugin, self).create_port(context, port)
+
+    @idempotency_db.idempotent('port')
+    def create_port(self, context, port):
         with db_api.autonested_transaction(context.session):
-            new_port = super(HdnNeutronPlugin, self).create_port(
-                context, port)
-        registry.notify(resources.PORT, events.AFTER_CREATE, self,
-                        tenant_id=context.tenant_id,
-                        resource_id=new_port['id'])
-        # Notify HDN operators
-        hdnlib.notify_port_create(new_port)
+            new_port = self._create_port_db(context, port)
+            pending_db.record(context.session, 'port', [new_port['id']],
+                              new_port['tenant_id'],
+                              constants.STATUS_PENDING_CREATE)
+            # Notify HDN operators
+            hdnlib.notify_port_create(new_port, session=context.session)
+            hooks.notify_after_commit(context.session, resources.PORT,
+                                      events.AFTER_CREATE, self,
+                                      tenant_id=context.tenant_id,
+                                      resource_id=new_port['id'])
         LOG.debug("Queued request to create port: %s", new_port['id'])
         return new_port
 
+    def create_port_bulk(self, context, ports):
+        return self._hdn_create_bulk(context, resources.PORT,
+                                     ports['ports'],
+                                     self._create_port_db,
+                                     hdnlib.notify_port_bulk_create)
+
     def update_port(self, context, port_id, port):
         with db_api.autonested_transaction(context.session):
-            original_port = super(HdnNeutronPlugin, self).get_port(
-                context, port_id)
+            # The model is kept in the session, and updated in place
+            db_port = self._get_port(context, port_id)
+            original_port = self._make_port_dict(db_port,
+                                                 process_extensions=False)
             updated_port = super(HdnNeutronPlugin, self).update_port(
                 context, port_id, port)
-
-        # TODO(salv-orlando): check for more attribute changes
-        if original_port['admin_state_up'] != updated_port['admin_state_up']:
-            # Put the port in PENDING_UPDATE status
-            with context.session.begin(subtransactions=True):
-                db_port = self._get_port(context, port_id)
-                db_port.status = constants.STATUS_PENDING_UPDATE
-                registry.notify(resources.PORT, events.AFTER_UPDATE, self,
-                                tenant_id=context.tenant_id,
-                                resource_id=port_id)
-            # Notify HDN operators
-            hdnlib.notify_port_update(self._make_port_dict(db_port))
-            LOG.debug("Queued request to update port: %s", port['id'])
+            changes = diff.compute_delta('port', original_port, updated_port)
+            if changes:
+                # Put the port in PENDING_UPDATE status, unless operators
+                # still have to create it: they create it as updated
+                if db_port.status != constants.STATUS_PENDING_CREATE:
+                    db_port.status = constants.STATUS_PENDING_UPDATE
+                pending_db.record(context.session, 'port', [port_id],
+                                  db_port.tenant_id,
+                                  constants.STATUS_PENDING_UPDATE)
+                updated_port['status'] = db_port.status
+                hooks.notify_after_commit(context.session, resources.PORT,
+                                          events.AFTER_UPDATE, self,
+                                          tenant_id=context.tenant_id,
+                                          resource_id=port_id)
+                # Notify HDN operators
+                hdnlib.notify_port_update(updated_port, changes,
+                                          session=context.session)
+                LOG.debug("Queued request to update port: %s", port_id)
         return updated_port
 
     def delete_port(self, context, port_id, hdn_operator_call=False,
@@ -178,50 +268,78 @@ class HdnNeutronPlugin(db_base_plugin_v2.NeutronDbPluginV2,
             if hdn_operator_call:
                 # the port must be removed from the DB
                 super(HdnNeutronPlugin, self).delete_port(context, port_id)
+                pending_db.clear(context.session, 'port', [port_id])
                 LOG.debug("Port delete operation for %s completed",
                           port_id)
                 return
             # Put the port in PENDING_DELETE constants.STATUS
             port.status = constants.STATUS_PENDING_DELETE
+            pending_db.record(context.session, 'port', [port_id],
+                              port.tenant_id, constants.STATUS_PENDING_DELETE)
             # TODO(salv-orlando): Notify callback to disassociate floating IPs
             # on l3 service plugin
-        if not hdn_operator_call:
-            registry.notify(resources.PORT, events.AFTER_DELETE, self,
-                            tenant_id=context.tenant_id,
-                            resource_id=port_id)
             # Notify HDN operators
             hdnlib.notify_port_delete({'id': port_id,
-                                       'tenant_id': context.tenant_id})
-            LOG.debug(_("Queued request to delete port: %s"), port_id)
-        else:
-            LOG.debug(_("Port %s destroyed"), port_id)
+                                       'tenant_id': context.tenant_id},
+                                      session=context.session)
+            hooks.notify_after_commit(context.session, resources.PORT,
+                                      events.AFTER_DELETE, self,
+                                      tenant_id=context.tenant_id,
+                                      resource_id=port_id)
+        LOG.debug(_("Queued request to delete port: %s"), port_id)
 
     # GET operations for ports are not redefined. The operation defined
     # in NeutronDBPluginV2 is enough for the HDN plugin
 
-    def create_subnet(self, context, subnet):
+    def _create_subnet_db(self, context, subnet):
         subnet['subnet']['status'] = constants.STATUS_PENDING_CREATE
-        new_subnet = super(HdnNeutronPlugin, self).create_subnet(
-            context, subnet)
-        registry.notify(resources.SUBNET, events.AFTER_CREATE, self,
-                        tenant_id=context.tenant_id,
-                        resource_id=new_subnet['id'])
-        # Notify HDN operators
-        hdnlib.notify_subnet_create(new_subnet)
+        return super(HdnNeutronPlugin, self).create_subnet(context, subnet)
+
+    @idempotency_db.idempotent('subnet')
+    def create_subnet(self, context, subnet):
+        with db_api.autonested_transaction(context.session):
+            new_subnet = self._create_subnet_db(context, subnet)
+            pending_db.record(context.session, 'subnet', [new_subnet['id']],
+                              new_subnet['tenant_id'],
+                              constants.STATUS_PENDING_CREATE)
+            # Notify HDN operators
+            hdnlib.notify_subnet_create(new_subnet, session=context.session)
+            hooks.notify_after_commit(context.session, resources.SUBNET,
+                                      events.AFTER_CREATE, self,
+                                      tenant_id=context.tenant_id,
+                                      resource_id=new_subnet['id'])
         LOG.debug("Queued request to create subnet: %s", new_subnet['id'])
         return new_subnet
 
+    def create_subnet_bulk(self, context, subnets):
+        return self._hdn_create_bulk(context, resources.SUBNET,
+                                     subnets['subnets'],
+                                     self._create_subnet_db,
+                                     hdnlib.notify_subnet_bulk_create)
+
     def update_subnet(self, context, subnet_id, subnet):
-        # Put the subnet in PENDING UPDATE status
-        subnet['subnet']['status'] = constants.STATUS_PENDING_UPDATE
-        upd_subnet = super(HdnNeutronPlugin, self).update_subnet(
-            context, subnet_id, subnet)
-        LOG.debug("Queued request to update subnet: %s", subnet['id'])
-        registry.notify(resources.SUBNET, events.AFTER_UPDATE, self,
-                        tenant_id=context.tenant_id,
-                        resource_id=subnet_id)
-        # Notify HDN operators
-        hdnlib.notify_subnet_update(upd_subnet)
+        with db_api.autonested_transaction(context.session):
+            db_subnet = self._get_subnet(context, subnet_id)
+            original_subnet = self._make_subnet_dict(db_subnet)
+            upd_subnet = super(HdnNeutronPlugin, self).update_subnet(
+                context, subnet_id, subnet)
+            changes = diff.compute_delta('subnet', original_subnet,
+                                         upd_subnet)
+            if changes:
+                # Put the subnet in PENDING UPDATE status
+                db_subnet.status = constants.STATUS_PENDING_UPDATE
+                pending_db.record(context.session, 'subnet', [subnet_id],
+                                  db_subnet.tenant_id,
+                                  constants.STATUS_PENDING_UPDATE)
+                upd_subnet['status'] = constants.STATUS_PENDING_UPDATE
+                # Notify HDN operators
+                hdnlib.notify_subnet_update(upd_subnet, changes,
+                                            session=context.session)
+                hooks.notify_after_commit(context.session, resources.SUBNET,
+                                          events.AFTER_UPDATE, self,
+                                          tenant_id=context.tenant_id,
+                                          resource_id=subnet_id)
+                LOG.debug("Queued request to update subnet: %s", subnet_id)
         return upd_subnet
 
     def delete_subnet(self, context, subnet_id, hdn_operator_call=False):
@@ -233,13 +351,18 @@ class HdnNeutronPlugin(db_base_plugin_v2.NeutronDbPluginV2,
                 # the subnet must be removed from the DB
                 super(HdnNeutronPlugin, self).delete_subnet(context,
                                                             subnet_id)
+                pending_db.clear(context.session, 'subnet', [subnet_id])
                 return
             subnet.status = constants.STATUS_PENDING_DELETE
-        if not hdn_operator_call:
-            registry.notify(resources.SUBNET, events.AFTER_DELETE, self,
-                            tenant_id=context.tenant_id,
-                            resource_id=subnet_id)
+            pending_db.record(context.session, 'subnet', [subnet_id],
+                              subnet.tenant_id,
+                              constants.STATUS_PENDING_DELETE)
             # Notify HDN operators
             hdnlib.notify_subnet_delete({'id': subnet_id,
-                                         'tenant_id': context.tenant_id})
-            LOG.debug("Queued request to delete subnet: %s", subnet_id)
+                                         'tenant_id': context.tenant_id},
+                                        session=context.session)
+            hooks.notify_after_commit(context.session, resources.SUBNET,
+                                      events.AFTER_DELETE, self,
+                                      tenant_id=context.tenant_id,
+                                      resource_id=subnet_id)
+        LOG.debug("Queued request to delete subnet: %s", subnet_id)
@@ -14,8 +14,9 @@
 #    under the License.
 
 from neutron.callbacks import events
-from neutron.callbacks import registry
 from neutron.callbacks import resources
+from neutron.common import constants as l3_constants
+from neutron.db import api as db_api
 from neutron.db import common_db_mixin
 from neutron.db import extraroute_db
 from neutron.db import l3_db
@@ -26,7 +27,11 @@ from oslo_log import log
 from sqlalchemy.orm import exc as sa_exc
 
 from hdn.common import constants
+from hdn.common import diff
 from hdn.common import hdnlib
+from hdn.db import hooks
+from hdn.db import idempotency_db
+from hdn.db import pending_db
 
 LOG = log.getLogger(__name__)
 
@@ -35,7 +40,8 @@ class HdnL3Plugin(service_base.ServicePluginBase,
                   common_db_mixin.CommonDbMixin,
                   extraroute_db.ExtraRoute_dbonly_mixin):
 
-    supported_extension_aliases = ["router", "ext-gw-mode", "extraroute"]
+    supported_extension_aliases = ["router", "ext-gw-mode", "extraroute",
+                                   "hdn-idempotency"]
 
     def get_plugin_type(self):
         # Tell Neutron this is a L3 service plugin
@@ -44,30 +50,50 @@ class HdnL3Plugin(service_base.ServicePluginBase,
     def get_plugin_description(self):
         return "HDN - the ultimate solution for L3 networking in your cloud"
 
+    @idempotency_db.idempotent('router')
     def create_router(self, context, router):
         # Put the router in PENDING CREATE
         router['router']['status'] = constants.STATUS_PENDING_CREATE
-        new_router = super(HdnL3Plugin, self).create_router(
-            context, router)
-        registry.notify(resources.ROUTER, events.AFTER_CREATE, self,
-                        tenant_id=context.tenant_id,
-                        resource_id=new_router['id'])
-        # Notify HDN operators
-        hdnlib.notify_router_create(new_router)
+        with db_api.autonested_transaction(context.session):
+            new_router = super(HdnL3Plugin, self).create_router(
+                context, router)
+            pending_db.record(context.session, 'router', [new_router['id']],
+                              new_router['tenant_id'],
+                              constants.STATUS_PENDING_CREATE)
+            # Notify HDN operators
+            hdnlib.notify_router_create(new_router, session=context.session)
+            hooks.notify_after_commit(context.session, resources.ROUTER,
+                                      events.AFTER_CREATE, self,
+                                      tenant_id=context.tenant_id,
+                                      resource_id=new_router['id'])
         LOG.debug("Queued request to create router: %s", new_router['id'])
         return new_router
 
     def update_router(self, context, router_id, router):
-        # Put the router in PENDING_UPDATE
-        router['router']['status'] = constants.STATUS_PENDING_UPDATE
-        upd_router = super(HdnL3Plugin, self).update_router(
-            context, router_id, router)
-        registry.notify(resources.ROUTER, events.AFTER_UPDATE, self,
-                        tenant_id=context.tenant_id,
-                        resource_id=router_id)
-        # Notify HDN operators
-        hdnlib.notify_router_update(upd_router)
-        LOG.debug("Queued request to update router: %s", router_id)
+        with db_api.autonested_transaction(context.session):
+            router_db = self._get_router(context, router_id)
+            original_router = self._make_router_dict(router_db)
+            upd_router = super(HdnL3Plugin, self).update_router(
+                context, router_id, router)
+            changes = diff.compute_delta('router', original_router,
+                                         upd_router)
+            if changes:
+                # Put the router in PENDING_UPDATE, unless operators still
+                # have to create it: they create it as updated
+                if router_db.status != constants.STATUS_PENDING_CREATE:
+                    router_db.status = constants.STATUS_PENDING_UPDATE
+                pending_db.record(context.session, 'router', [router_id],
+                                  router_db.tenant_id,
+                                  constants.STATUS_PENDING_UPDATE)
+                upd_router['status'] = router_db.status
+                # Notify HDN operators
+                hdnlib.notify_router_update(upd_router, changes,
+                                            session=context.session)
+                hooks.notify_after_commit(context.session, resources.ROUTER,
+                                          events.AFTER_UPDATE, self,
+                                          tenant_id=context.tenant_id,
+                                          resource_id=router_id)
+                LOG.debug("Queued request to update router: %s", router_id)
         return upd_router
 
     def delete_router(self, context, router_id, router,
@@ -76,30 +102,45 @@ class HdnL3Plugin(service_base.ServicePluginBase,
         with context.session.begin(subtransactions=True):
             router = self._ensure_router_not_in_use(context, router_id)
             router.status = constants.STATUS_PENDING_DELETE
-        if not hdn_operator_call:
-            registry.notify(resources.ROUTER, events.AFTER_DELETE, self,
-                            tenant_id=context.tenant_id,
-                            resource_id=router_id)
-            # Notify HDN operators
-            hdnlib.notify_router_delete({'id': router_id,
-                                        'tenant_id': context.tenant_id})
+            pending_db.record(context.session, 'router', [router_id],
+                              router.tenant_id,
+                              constants.STATUS_PENDING_DELETE)
+            if not hdn_operator_call:
+                # Notify HDN operators
+                hdnlib.notify_router_delete({'id': router_id,
+                                            'tenant_id': context.tenant_id},
+                                            session=context.session)
+                hooks.notify_after_commit(context.session, resources.ROUTER,
+                                          events.AFTER_DELETE, self,
+                                          tenant_id=context.tenant_id,
+                                          resource_id=router_id)
         LOG.debug(_("Queued request to delete router: %s"), router_id)
 
     def add_router_interface(self, context, router_id, interface_info):
-        super(HdnL3Plugin, self).add_router_interface(
-            context, router_id, interface_info)
-        hdnlib.notify_router_interface_add(
-            {'id': router_id, 'tenant_id': context.tenant_id})
+        with db_api.autonested_transaction(context.session):
+            super(HdnL3Plugin, self).add_router_interface(
+                context, router_id, interface_info)
+            hdnlib.notify_router_interface_add(
+                {'id': router_id, 'tenant_id': context.tenant_id},
+                session=context.session)
 
     def remove_router_interface(self, context, router_id, interface_info):
-        super(HdnL3Plugin, self).remove_router_interface(
-            context, router_id, interface_info)
-        hdnlib.notify_router_interface_remove(
-            {'id': router_id, 'tenant_id': context.tenant_id})
+        with db_api.autonested_transaction(context.session):
+            super(HdnL3Plugin, self).remove_router_interface(
+                context, router_id, interface_info)
+            hdnlib.notify_router_interface_remove(
+                {'id': router_id, 'tenant_id': context.tenant_id},
+                session=context.session)
 
     # GET operations for routers are not redefined. The operation defined
     # in NeutronDBPluginV2 is enough for the HDN plugin
 
+    @idempotency_db.idempotent('floatingip')
+    def create_floatingip(self, context, floatingip,
+            initial_status=l3_constants.FLOATINGIP_STATUS_ACTIVE):
+        return super(HdnL3Plugin, self).create_floatingip(
+            context, floatingip, initial_status=initial_status)
+
     def _update_fip_assoc(self, context, fip, floatingip_db, external_port):
         """Performs association of a floating IP with a port.
 
@@ -109,21 +150,38 @@ class HdnL3Plugin(service_base.ServicePluginBase,
             context, fip, floatingip_db, external_port)
         self.update_floatingip_status(
             context, fip['id'], constants.STATUS_PENDING_UPDATE)
+        pending_db.record(context.session, 'floatingip', [fip['id']],
+                          floatingip_db['tenant_id'],
+                          constants.STATUS_PENDING_UPDATE)
         # Notify HDN operators
-        hdnlib.notify_floatingip_update_association(floatingip_db)
+        hdnlib.notify_floatingip_update_association(floatingip_db,
+                                                    session=context.session)
+        hooks.notify_after_commit(context.session, 'FLOATING_IP',
+                                  events.AFTER_UPDATE, self,
+                                  tenant_id=context.tenant_id,
+                                  resource_id=fip['id'])
 
     def delete_floatingip(self, context, floatingip_id,
                           hdn_operator_call=False):
         # TODO(salv): Add operational status for floating IPs
-        if not hdn_operator_call:
-            registry.notify('FLOATING_IP', events.AFTER_DELETE, self,
-                            tenant_id=context.tenant_id,
-                            resource_id=floatingip_id)
-            # Notify HDN operators
-            hdnlib.notify_floatingip_delete({'id': floatingip_id,
-                                            'tenant_id': context.tenant_id})
-        self.update_floatingip_status(
-            context, floatingip_id, constants.STATUS_PENDING_DELETE)
+        with context.session.begin(subtransactions=True):
+            # Admins may delete the floating IPs of other tenants
+            tenant_id = self._get_floatingip(context,
+                                             floatingip_id).tenant_id
+            self.update_floatingip_status(
+                context, floatingip_id, constants.STATUS_PENDING_DELETE)
+            pending_db.record(context.session, 'floatingip',
+                              [floatingip_id], tenant_id,
+                              constants.STATUS_PENDING_DELETE)
+            if not hdn_operator_call:
+                # Notify HDN operators
+                hdnlib.notify_floatingip_delete(
+                    {'id': floatingip_id, 'tenant_id': tenant_id},
+                    session=context.session)
+                hooks.notify_after_commit(context.session, 'FLOATING_IP',
+                                          events.AFTER_DELETE, self,
+                                          tenant_id=context.tenant_id,
+                                          resource_id=floatingip_id)
         LOG.debug(_("Queued request to delete floating ip: %s"),
                   floatingip_id)
 
@@ -140,8 +198,17 @@ class HdnL3Plugin(service_base.ServicePluginBase,
                 self.update_floatingip_status(context,
                                               floating_ip['id'],
                                               constants.STATUS_PENDING_UPDATE)
+                pending_db.record(context.session, 'floatingip',
+                                  [floating_ip['id']],
+                                  floating_ip['tenant_id'],
+                                  constants.STATUS_PENDING_UPDATE)
                 # Notify HDN operators for each floating IP
-                hdnlib.notify_floatingip_disassociate(floating_ip)
+                hdnlib.notify_floatingip_disassociate(floating_ip,
+                                                      session=context.session)
+                hooks.notify_after_commit(context.session, 'FLOATING_IP',
+                                          events.AFTER_UPDATE, self,
+                                          tenant_id=context.tenant_id,
+                                          resource_id=floating_ip['id'])
             except sa_exc.NoResultFound:
                 return
             except sa_exc.MultipleResultsFound:
@@ -16,17 +16,44 @@
 from neutron.callbacks import events
 from neutron.callbacks import registry
 from neutron.callbacks import resources
+from neutron.common import exceptions as n_exc
 from neutron import context
+from neutron.db import api as db_api
 from neutron.db import common_db_mixin
 from neutron.services import service_base
 
+from oslo_config import cfg
 from oslo_log import log
+from oslo_utils import uuidutils
 
+from hdn.common import archiver
 from hdn.common import constants
+from hdn.common import escalator
+from hdn.common import hdnlib
+from hdn.common import watcher
+from hdn.db import completion_db
+from hdn.db import dependency_db
+from hdn.db import hooks
+from hdn.db import pending_db
+from hdn.db import tasks_db
 from hdn.extensions import hdntasks
 
 LOG = log.getLogger(__name__)
 
+# Callback resources for which tasks are created, and the task type
+# TODO(salv-orlando): do not use literals for network and floating IP
+TASK_TYPES = {'NETWORK': 'network',
+              resources.SUBNET: 'subnet',
+              resources.PORT: 'port',
+              resources.ROUTER: 'router',
+              'FLOATING_IP': 'floatingip'}
+
+# Callback events for which tasks are created, and the task action
+TASK_ACTIONS = {events.AFTER_CREATE: 'create',
+                constants.AFTER_BULK_CREATE: 'create',
+                events.AFTER_UPDATE: 'update',
+                events.AFTER_DELETE: 'delete'}
+
 
 class HdnTasksPlugin(service_base.ServicePluginBase,
                      hdntasks.HdnTaskPluginBase,
@@ -34,43 +61,71 @@ class HdnTasksPlugin(service_base.ServicePluginBase,
 
     supported_extension_aliases = ["hdn-tasks"]
 
-    def _build_task_info(self, tenant_id, resource_id,
-                         object_type, action):
-        return {'tenant_id': tenant_id,
-                'resource_id': resource_id,
-                'object_type': object_type,
-                'action': action}
-
-    def _add_network_create_task(self, tenant_id, resource_id):
-        task_info = self._build_task_info(
-            tenant_id, resource_id,
-            'network', 'create')
-        self.create_task(
-            context.get_admin_context(), task_info)
-
-    def _add_port_create_task(self, tenant_id, resource_id):
-        task_info = self._build_task_info(
-            tenant_id, resource_id,
-            'network', 'create')
-        self.create_task(
-            context.get_admin_context(), task_info)
-
-    def _add_router_create_task(self, tenant_id, resource_id):
-        task_info = self._build_task_info(
-            tenant_id, resource_id,
-            'network', 'create')
-        self.create_task(
-            context.get_admin_context(), task_info)
-
-    registry.subscribe(_add_network_create_task,
-                       'NETWORK',
-                       events.AFTER_CREATE)
-    registry.subscribe(_add_port_create_task,
-                       resources.PORT,
-                       events.AFTER_CREATE)
-    registry.subscribe(_add_router_create_task,
-                       resources.ROUTER,
-                       events.AFTER_CREATE)
+    # Tasks and pending resources are paginated and sorted by the plugin
+    __native_pagination_support = True
+    __native_sorting_support = True
+
+    def __init__(self):
+        super(HdnTasksPlugin, self).__init__()
+        # API workers are forked after the plugin is loaded, they start
+        # the jobs when notifying operators
+        hdnlib.register_job(archiver.start_archiver)
+        hdnlib.register_job(escalator.start_escalator)
+        for resource in TASK_TYPES:
+            for event in TASK_ACTIONS:
+                registry.subscribe(self._add_tasks, resource, event)
+            registry.subscribe(self._end_tasks, resource,
+                               constants.AFTER_COMPLETE)
+
+    def _add_tasks(self, resource, event, trigger, **kwargs):
+        """Record tasks for the resources changed by a request.
+
+        Events are triggered once the transaction which changed the
+        resources commits. The tasks for all the events triggered by the
+        transaction are written together, with a single admin context.
+        """
+        resource_ids = kwargs.get('resource_ids')
+        if resource_ids is None:
+            resource_ids = [kwargs['resource_id']]
+        for resource_id in resource_ids:
+            hooks.add_to_batch(
+                'hdn-tasks',
+                {'tenant_id': kwargs.get('tenant_id') or '',
+                 'object': resource_id,
+                 'type': TASK_TYPES[resource],
+                 'action': TASK_ACTIONS[event]},
+                self._create_tasks)
+
+    def _create_tasks(self, tasks):
+        session = context.get_admin_context().session
+        # Work on a resource waits for the work on the resources it uses,
+        # unless it is being deleted
+        parents = dependency_db.get_parents(
+            session, [(task['type'], task['object']) for task in tasks
+                      if task['action'] != 'delete'])
+        for task in tasks:
+            if task['action'] != 'delete':
+                task['depends_on'] = parents.get(
+                    (task['type'], task['object']), ())
+        tasks_db.create_tasks(session, tasks,
+                              deadline=cfg.CONF.HDN.task_deadline)
+        LOG.debug("Created %d tasks", len(tasks))
+
+    def _end_tasks(self, resource, event, trigger, **kwargs):
+        """End the tasks of the resources HDN operators completed.
+
+        Completions, reported by operators or by the reaper, name
+        resources rather than tasks. Ending their tasks releases the tasks
+        waiting for them.
+        """
+        status = (constants.TASK_FAILED
+                  if kwargs['outcome'] == constants.OUTCOME_ERROR
+                  else constants.TASK_COMPLETED)
+        session = context.get_admin_context().session
+        ended = tasks_db.end_tasks(session, TASK_TYPES[resource],
+                                   kwargs['resource_ids'], status)
+        LOG.debug("Ended %(ended)d tasks of completed %(type)s resources",
+                  {'ended': len(ended), 'type': TASK_TYPES[resource]})
 
     def get_plugin_type(self):
         # Tell Neutron this is a L3 service plugin
@@ -79,21 +134,211 @@ class HdnTasksPlugin(service_base.ServicePluginBase,
     def get_plugin_description(self):
         return "HDN - support for task management"
 
+    def _tenant_scope(self, context):
+        # Tenants only see their own tasks
+        return None if context.is_admin else context.tenant_id
+
     def get_tasks(self, context, filters=None, fields=None,
                   sorts=None, limit=None, marker=None,
                   page_reverse=False):
-        LOG.debug("List tasks stub")
-        return []
+        """List tasks.
+
+        Archived tasks are listed, instead of current ones, only when the
+        archived filter is true.
+        """
+        archived = any((filters or {}).get('archived') or [])
+        return tasks_db.get_tasks(context.session,
+                                  tenant_id=self._tenant_scope(context),
+                                  filters=filters, fields=fields,
+                                  sorts=sorts, limit=limit, marker=marker,
+                                  page_reverse=page_reverse,
+                                  archived=archived)
 
     def get_task(self, context, task_id, fields=None):
-        LOG.debug("Get task stub")
-        return {}
+        return tasks_db.get_task(context.session, task_id,
+                                 tenant_id=self._tenant_scope(context),
+                                 fields=fields)
 
     def create_task(self, context, task_info):
-        LOG.debug("Create task stub")
+        task = tasks_db.create_task(context.session, task_info['task'],
+                                    deadline=cfg.CONF.HDN.task_deadline)
+        LOG.debug("Created task %(id)s to %(action)s %(type)s %(object)s",
+                  task)
+        return task
 
     def delete_task(self, context, task_id):
-        LOG.debug("Delete task stub")
+        if not context.is_admin:
+            raise n_exc.AdminRequired(
+                reason=_("only HDN operators can delete tasks"))
+        tasks_db.delete_task(context.session, task_id)
 
     def update_task(self, context, task_id, task_info):
-        LOG.debug("Update task stub")
+        if not context.is_admin:
+            raise n_exc.AdminRequired(
+                reason=_("only HDN operators can update tasks"))
+        return tasks_db.update_task(context.session, task_id,
+                                    task_info['task'])
+
+    def create_completion(self, context, completion):
+        """Apply the outcome of the work done by HDN operators.
+
+        Every item is a resource, its identifier, and the outcome of the
+        work: 'active' or 'error' move it out of its PENDING_* status, and
+        'deleted' removes it. All items are processed in one transaction;
+        the response has the result for each of them.
+        """
+        if not context.is_admin:
+            raise n_exc.AdminRequired(
+                reason=_("only HDN operators can complete requests"))
+        items = completion['completion']['items']
+        with db_api.autonested_transaction(context.session):
+            results, completed = completion_db.complete(
+                context.session,
+                [(item['resource'], item['id'], item['outcome'])
+                 for item in items])
+            completion_db.notify_completed(context.session, self, completed,
+                                           tenant_id=context.tenant_id)
+        LOG.debug("HDN operators completed %(done)d out of %(total)d "
+                  "requests",
+                  {'done': results.count(completion_db.RESULT_COMPLETED),
+                   'total': len(items)})
+        return {'id': uuidutils.generate_uuid(),
+                'tenant_id': context.tenant_id,
+                'results': [dict(item, result=result)
+                            for item, result in zip(items, results)]}
+
+    def get_completions(self, context, filters=None, fields=None):
+        # Completions are not stored
+        return []
+
+    def get_completion(self, context, completion_id, fields=None):
+        raise n_exc.NotFound()
+
+    def create_task_claim(self, context, task_claim):
+        """Assign tasks waiting in the queue to an HDN operator.
+
+        Up to count tasks are claimed, and the claims on the tasks listed
+        in renew are extended, for lease seconds. Operators release tasks
+        by updating their status; tasks whose claim expires go back to
+        the queue. Tasks BLOCKED by other tasks are not claimed until
+        those end.
+        """
+        if not context.is_admin:
+            raise n_exc.AdminRequired(
+                reason=_("only HDN operators can claim tasks"))
+        claim = task_claim['task_claim']
+        conf = cfg.CONF.HDN
+        claimer = claim['claimer'] or context.user_id
+        lease = claim['lease'] or conf.task_claim_lease
+        count = min(claim['count'], conf.task_claim_max_count)
+        with db_api.autonested_transaction(context.session):
+            renewed = tasks_db.renew_claims(context.session, claim['renew'],
+                                            claimer, lease)
+            tasks = []
+            if count:
+                tasks = tasks_db.claim_tasks(context.session, count,
+                                             claimer, lease)
+        LOG.debug("%(claimer)s claimed %(claimed)d tasks and renewed "
+                  "%(renewed)d claims",
+                  {'claimer': claimer, 'claimed': len(tasks),
+                   'renewed': len(renewed)})
+        return {'id': uuidutils.generate_uuid(),
+                'tenant_id': context.tenant_id,
+                'claimer': claimer,
+                'count': count,
+                'lease': lease,
+                'renewed': renewed,
+                'tasks': tasks}
+
+    def get_task_claims(self, context, filters=None, fields=None):
+        # Task claims are not stored
+        return []
+
+    def get_task_claim(self, context, task_claim_id, fields=None):
+        raise n_exc.NotFound()
+
+    def create_task_watch(self, context, task_watch):
+        """Return the tasks changed after a change, waiting for one if none.
+
+        The request is held until tasks change, or for timeout seconds,
+        without querying the database. Tenants only see their own tasks.
+        """
+        watch = task_watch['task_watch']
+        conf = cfg.CONF.HDN
+        timeout = min(watch['timeout'], conf.task_watch_max_timeout)
+        limit = min(watch['limit'] or conf.task_watch_max_tasks,
+                    conf.task_watch_max_tasks)
+        tasks, seq = watcher.watch(context.session, watch['since'], timeout,
+                                   limit,
+                                   tenant_id=self._tenant_scope(context))
+        return {'id': uuidutils.generate_uuid(),
+                'tenant_id': context.tenant_id,
+                'since': watch['since'],
+                'timeout': timeout,
+                'limit': limit,
+                'seq': seq,
+                'tasks': tasks}
+
+    def get_task_watches(self, context, filters=None, fields=None):
+        # Task watches are not stored
+        return []
+
+    def get_task_watch(self, context, task_watch_id, fields=None):
+        raise n_exc.NotFound()
+
+    def _make_pending_resource_dict(self, pending, fields=None):
+        res = {'id': pending.resource_id,
+               'resource': pending.resource,
+               'tenant_id': pending.tenant_id,
+               'status': pending.status,
+               'created_at': pending.created_at.isoformat()}
+        return self._fields(res, fields)
+
+    def get_pending_resources(self, context, filters=None, fields=None,
+                              sorts=None, limit=None, marker=None,
+                              page_reverse=False):
+        """List resources waiting for HDN operators, oldest first.
+
+        Results can be filtered by tenant_id, resource and status, and
+        sorted by created_at only. Tenants only see their own resources.
+        """
+        filters = filters or {}
+        max_limit = cfg.CONF.HDN.pending_max_limit
+        # The pagination helper asks for an extra item to detect whether
+        # there is a next page
+        limit = min(limit or max_limit, max_limit + 1)
+        tenant_ids = filters.get('tenant_id')
+        if not context.is_admin:
+            tenant_ids = [context.tenant_id]
+        newest_first = any(key == 'created_at' and not ascending
+                           for key, ascending in sorts or [])
+        if page_reverse:
+            newest_first = not newest_first
+        pending = []
+        # Each tenant is read from its own index range
+        for tenant_id in tenant_ids or [None]:
+            pending.extend(pending_db.get_pending(
+                context.session, limit, tenant_id=tenant_id,
+                resources=filters.get('resource'),
+                statuses=filters.get('status'),
+                marker=marker, newest_first=newest_first))
+        if tenant_ids and len(tenant_ids) > 1:
+            pending.sort(key=lambda item: (item.created_at,
+                                           item.resource_id),
+                         reverse=newest_first)
+            pending = pending[:limit]
+        if page_reverse:
+            pending.reverse()
+        return [self._make_pending_resource_dict(item, fields)
+                for item in pending]
+
+    def get_pending_resource(self, context, resource_id, fields=None):
+        # The API identifies pending resources by id only
+        for resource in constants.COMPLETION_RESOURCES:
+            pending = pending_db.get(context.session, resource, resource_id)
+            if pending is not None:
+                break
+        if pending is None or (not context.is_admin and
+                               pending.tenant_id != context.tenant_id):
+            raise n_exc.NotFound()
+        return self._make_pending_resource_dict(pending, fields)
@@ -0,0 +1,59 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import fixtures
+import sqlalchemy as sa
+from sqlalchemy import orm
+import testtools
+
+from hdn.db.models import hdn_models
+
+
+class TestCase(testtools.TestCase):
+    """Base class for HDN unit tests."""
+
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.useFixture(fixtures.NestedTempfile())
+
+
+class SqlTestCase(TestCase):
+    """Run tests against the HDN tables of a SQLite database.
+
+    The database is a file, so that sessions in different threads see
+    each other's changes like sessions of different servers would.
+    """
+
+    TABLES = (hdn_models.HdnTask, hdn_models.HdnTaskChange,
+              hdn_models.HdnTaskDependency)
+
+    def setUp(self):
+        super(SqlTestCase, self).setUp()
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'hdn.db')
+        self.engine = sa.create_engine('sqlite:///%s' % path,
+                                       connect_args={'timeout': 30})
+        self.addCleanup(self.engine.dispose)
+        hdn_models.HdnTask.metadata.create_all(
+            self.engine, tables=[model.__table__ for model in self.TABLES])
+        self.session_maker = orm.sessionmaker(bind=self.engine,
+                                              autocommit=True,
+                                              expire_on_commit=False)
+        self.session = self.get_session()
+
+    def get_session(self):
+        return self.session_maker()
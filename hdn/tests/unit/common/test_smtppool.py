@@ -0,0 +1,155 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import smtplib
+
+from hdn.common import smtppool
+from hdn.tests import base
+
+SENDER = 'hdn@example.com'
+
+
+class FakeSessionMixin(object):
+    """A SMTP session answering with scripted replies."""
+
+    def __init__(self, replies, extensions=('pipelining',)):
+        self.replies = list(replies)
+        self.extensions = extensions
+        self.sent = []
+        self.mails = []
+
+    def ehlo(self):
+        pass
+
+    def has_extn(self, name):
+        return name in self.extensions
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def getreply(self):
+        return self.replies.pop(0)
+
+    def rset(self):
+        self.send('RSET\r\n')
+        return self.getreply()
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        self.mails.append((from_addr, to_addrs, msg))
+        return {}
+
+    def noop(self):
+        return (250, 'OK')
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeSMTP(FakeSessionMixin, smtplib.SMTP):
+    pass
+
+
+class FakeLMTP(FakeSessionMixin, smtplib.LMTP):
+    pass
+
+
+class TestSendMany(base.TestCase):
+
+    def _sendmany(self, session, messages):
+        pool = smtppool.SMTPSessionPool('relay', 25, starttls=False,
+                                        connect=lambda: session)
+        return pool.sendmany(SENDER, messages)
+
+    def test_pipelined(self):
+        session = FakeSMTP([(250, 'sender'), (250, 'rcpt'), (354, 'go'),
+                            (250, 'queued'),
+                            (250, 'sender'), (250, 'rcpt'), (354, 'go'),
+                            (250, 'queued')])
+        results = self._sendmany(session, [(['a@example.com'], 'first'),
+                                           (['b@example.com'], 'second')])
+        self.assertEqual([None, None], results)
+        self.assertEqual([], session.replies)
+        # The content of a message goes with the commands of the next one
+        self.assertEqual(
+            ['MAIL FROM:<hdn@example.com>\r\nRCPT TO:<a@example.com>\r\n'
+             'DATA\r\n',
+             'first\r\n.\r\nMAIL FROM:<hdn@example.com>\r\n'
+             'RCPT TO:<b@example.com>\r\nDATA\r\n',
+             'second\r\n.\r\n'],
+            session.sent)
+
+    def test_pipelined_data_refused(self):
+        session = FakeSMTP([(250, 'sender'), (250, 'rcpt'), (354, 'go'),
+                            (554, 'rejected'),
+                            (250, 'sender'), (250, 'rcpt'), (354, 'go'),
+                            (250, 'queued')])
+        results = self._sendmany(session, [(['a@example.com'], 'first'),
+                                           (['b@example.com'], 'second')])
+        self.assertIsInstance(results[0], smtplib.SMTPDataError)
+        self.assertEqual(554, results[0].smtp_code)
+        self.assertIsNone(results[1])
+        self.assertEqual([], session.replies)
+
+    def test_pipelined_sender_refused(self):
+        session = FakeSMTP([(550, 'no'), (250, 'rcpt'), (354, 'go'),
+                            (503, 'bad'), (250, 'reset'),
+                            (250, 'sender'), (250, 'rcpt'), (354, 'go'),
+                            (250, 'queued')])
+        results = self._sendmany(session, [(['a@example.com'], 'first'),
+                                           (['b@example.com'], 'second')])
+        self.assertIsInstance(results[0], smtplib.SMTPSenderRefused)
+        self.assertIsNone(results[1])
+        self.assertEqual([], session.replies)
+        # The message is ended before the transaction is reset
+        self.assertEqual(['.\r\n', 'RSET\r\n'], session.sent[1:3])
+
+    def test_lmtp_reply_per_recipient(self):
+        session = FakeLMTP([(250, 'sender'), (250, 'rcpt'), (250, 'rcpt'),
+                            (354, 'go'),
+                            (250, 'delivered'), (452, 'mailbox full'),
+                            (250, 'sender'), (250, 'rcpt'), (354, 'go'),
+                            (250, 'delivered')])
+        results = self._sendmany(
+            session, [(['a@example.com', 'b@example.com'], 'first'),
+                      (['c@example.com'], 'second')])
+        self.assertIsInstance(results[0], smtplib.SMTPDataError)
+        self.assertEqual(452, results[0].smtp_code)
+        self.assertIsNone(results[1])
+        self.assertEqual([], session.replies)
+
+    def test_lmtp_no_reply_for_refused_recipient(self):
+        session = FakeLMTP([(250, 'sender'), (250, 'rcpt'), (550, 'unknown'),
+                            (354, 'go'),
+                            (250, 'delivered'),
+                            (250, 'sender'), (250, 'rcpt'), (354, 'go'),
+                            (250, 'delivered')])
+        results = self._sendmany(
+            session, [(['a@example.com', 'b@example.com'], 'first'),
+                      (['c@example.com'], 'second')])
+        self.assertEqual([None, None], results)
+        self.assertEqual([], session.replies)
+
+    def test_not_pipelined(self):
+        session = FakeSMTP([], extensions=())
+        results = self._sendmany(session, [(['a@example.com'], 'first'),
+                                           (['b@example.com'], 'second')])
+        self.assertEqual([None, None], results)
+        self.assertEqual([(SENDER, ['a@example.com'], 'first'),
+                          (SENDER, ['b@example.com'], 'second')],
+                         session.mails)
+        self.assertEqual([], session.sent)
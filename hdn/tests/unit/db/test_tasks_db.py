@@ -0,0 +1,343 @@
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+import threading
+
+import mock
+from oslo_utils import timeutils
+from sqlalchemy.dialects import postgresql
+
+from hdn.common import constants
+from hdn.common import exceptions
+from hdn.db.models import hdn_models
+from hdn.db import tasks_db
+from hdn.tests import base
+
+Task = hdn_models.HdnTask
+
+
+def _task(object_id, object_type='port', action='create', **kwargs):
+    task = {'tenant_id': 'tenant', 'object': object_id,
+            'type': object_type, 'action': action}
+    task.update(kwargs)
+    return task
+
+
+class TestClaimTasks(base.SqlTestCase):
+
+    def setUp(self):
+        super(TestClaimTasks, self).setUp()
+        tasks_db.create_tasks(self.session,
+                              [_task('port-%02d' % i) for i in range(20)])
+        self.task_ids = set(task['id'] for task in
+                            tasks_db.get_tasks(self.session))
+
+    def _take(self, ids, claimer='rival'):
+        # Claim tasks as another operator would, between the reads and
+        # the writes of the claim under test
+        self.session.query(Task).filter(Task.id.in_(ids)).update(
+            {'status': constants.TASK_CLAIMED, 'claimed_by': claimer,
+             'claim_expires': timeutils.utcnow() + datetime.timedelta(
+                 seconds=60)},
+            synchronize_session=False)
+
+    def _claimed_by(self, claimer):
+        return set(row.id for row in self.session.query(Task.id).filter(
+            Task.claimed_by == claimer))
+
+    def test_claim_tasks(self):
+        tasks = tasks_db.claim_tasks(self.session, 5, 'operator', 60)
+        self.assertEqual(5, len(tasks))
+        for task in tasks:
+            self.assertEqual(constants.TASK_CLAIMED, task['status'])
+            self.assertEqual('operator', task['claimed_by'])
+            self.assertIsNotNone(task['claim_expires'])
+
+    def test_claim_skips_tasks_taken_concurrently(self):
+        assign = tasks_db._assign
+        taken = set()
+
+        def _assign(session, ids, values, now):
+            if not taken:
+                taken.update(ids)
+                self._take(ids)
+            return assign(session, ids, values, now)
+
+        with mock.patch.object(tasks_db, '_assign', side_effect=_assign):
+            tasks = tasks_db.claim_tasks(self.session, 5, 'operator', 60)
+        claimed = set(task['id'] for task in tasks)
+        self.assertEqual(5, len(claimed))
+        self.assertFalse(claimed & taken)
+        self.assertEqual(taken, self._claimed_by('rival'))
+        self.assertEqual(claimed, self._claimed_by('operator'))
+
+    def test_claim_gives_up_when_tasks_keep_being_taken(self):
+        assign = tasks_db._assign
+
+        def _assign(session, ids, values, now):
+            self._take(ids)
+            return assign(session, ids, values, now)
+
+        with mock.patch.object(tasks_db, '_assign',
+                               side_effect=_assign) as assign_mock:
+            tasks = tasks_db.claim_tasks(self.session, 5, 'operator', 60)
+        self.assertEqual([], tasks)
+        self.assertEqual(tasks_db.CLAIM_ATTEMPTS, assign_mock.call_count)
+
+    def test_concurrent_claimers_get_disjoint_tasks(self):
+        claims = {}
+
+        def claim(claimer):
+            session = self.get_session()
+            claims[claimer] = []
+            while True:
+                tasks = tasks_db.claim_tasks(session, 3, claimer, 60)
+                if not tasks:
+                    break
+                claims[claimer].extend(task['id'] for task in tasks)
+
+        threads = [threading.Thread(target=claim, args=('operator-%d' % i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        claimed = [task_id for ids in claims.values() for task_id in ids]
+        self.assertEqual(len(self.task_ids), len(claimed))
+        self.assertEqual(self.task_ids, set(claimed))
+        for claimer, ids in claims.items():
+            self.assertEqual(set(ids), self._claimed_by(claimer))
+
+    def test_claim_skip_locked(self):
+        locked = set(sorted(self.task_ids)[:5])
+        self._take(locked)
+
+        def select(session, query):
+            # Rows locked by other transactions are skipped before the
+            # limit applies
+            return [row.id for row in query.limit(None)
+                    if row.id not in locked][:5]
+
+        with mock.patch.object(tasks_db, '_supports_skip_locked',
+                               return_value=True), \
+                mock.patch.object(tasks_db, '_select_skip_locked',
+                                  side_effect=select) as select_mock, \
+                mock.patch.object(tasks_db, '_assign',
+                                  wraps=tasks_db._assign) as assign_mock:
+            tasks = tasks_db.claim_tasks(self.session, 5, 'operator', 60)
+        claimed = set(task['id'] for task in tasks)
+        self.assertEqual(5, len(claimed))
+        self.assertFalse(claimed & locked)
+        # Locked candidates are assigned in a single round
+        self.assertEqual(1, assign_mock.call_count)
+        # Claims expired first, then pending tasks
+        self.assertEqual(2, select_mock.call_count)
+
+    def test_select_skip_locked(self):
+        connection = mock.Mock(dialect=postgresql.dialect())
+        connection.execute.return_value = [('task-id',)]
+        session = mock.Mock()
+        session.connection.return_value = connection
+        query = self.session.query(Task.id).filter(
+            Task.status == constants.TASK_PENDING).limit(5)
+        self.assertEqual(['task-id'],
+                         tasks_db._select_skip_locked(session, query))
+        statement, params = connection.execute.call_args[0]
+        self.assertTrue(statement.endswith('FOR UPDATE SKIP LOCKED'))
+        self.assertIn(constants.TASK_PENDING, params.values())
+
+    def test_supports_skip_locked(self):
+        for name, version, expected in (
+                ('postgresql', (9, 4), False),
+                ('postgresql', (9, 5), True),
+                ('mysql', (5, 7, 20), False),
+                ('mysql', (8, 0, 1), True),
+                ('mysql', (10, 5, 8, 'MariaDB'), False),
+                ('mysql', (10, 6, 4, 'MariaDB'), True),
+                ('sqlite', (3, 8), False)):
+            dialect = mock.Mock(server_version_info=version)
+            dialect.name = name
+            self.assertEqual(expected,
+                             tasks_db._supports_skip_locked(dialect),
+                             '%s %s' % (name, version))
+
+    def test_claim_expired_claims_first(self):
+        expired = sorted(self.task_ids)[-1]
+        self._take([expired])
+        self.session.query(Task).filter(Task.id == expired).update(
+            {'claim_expires': timeutils.utcnow() - datetime.timedelta(
+                seconds=1)}, synchronize_session=False)
+        tasks = tasks_db.claim_tasks(self.session, 1, 'operator', 60)
+        self.assertEqual([expired], [task['id'] for task in tasks])
+
+
+class TestGetChanges(base.SqlTestCase):
+
+    def _ids(self, tasks):
+        return set(task['id'] for task in tasks)
+
+    def test_get_changes(self):
+        tasks_db.create_tasks(self.session,
+                              [_task('port-%d' % i) for i in range(3)])
+        changes, since = tasks_db.get_changes(self.session, 0, 10)
+        self.assertEqual(3, len(changes))
+        task_id = changes[0]['id']
+        tasks_db.update_task(self.session, task_id,
+                             {'status': constants.TASK_COMPLETED})
+        changes, since = tasks_db.get_changes(self.session, since, 10)
+        self.assertEqual([(task_id, constants.TASK_COMPLETED)],
+                         [(task['id'], task['status']) for task in changes])
+        self.assertEqual([], tasks_db.get_changes(self.session, since, 10)[0])
+        self.assertEqual(since,
+                         tasks_db.get_changes(self.session, since, 10)[1])
+
+    def test_get_changes_returns_operations_whole(self):
+        tasks_db.create_tasks(self.session,
+                              [_task('port-%d' % i) for i in range(3)])
+        last = tasks_db.create_task(self.session, _task('port-3'))
+        changes, since = tasks_db.get_changes(self.session, 0, 2)
+        self.assertEqual(3, len(changes))
+        self.assertNotIn(last['id'], self._ids(changes))
+        changes, since = tasks_db.get_changes(self.session, since, 2)
+        self.assertEqual([last['id']], [task['id'] for task in changes])
+        self.assertEqual(last['seq'], since)
+
+    def test_get_changes_waits_for_missing_changes(self):
+        first = tasks_db.create_task(self.session, _task('port-1'))
+        second = tasks_db.create_task(self.session, _task('port-2'))
+        third = tasks_db.create_task(self.session, _task('port-3'))
+        # The change of the second task looks in progress
+        self.session.query(hdn_models.HdnTaskChange).filter(
+            hdn_models.HdnTaskChange.id == second['seq']).delete(
+            synchronize_session=False)
+        changes, since = tasks_db.get_changes(self.session, 0, 10)
+        self.assertEqual([first['id']], [task['id'] for task in changes])
+        self.assertEqual(first['seq'], since)
+        # Until it is taken as rolled back
+        self.session.query(hdn_models.HdnTaskChange).update(
+            {'created_at': timeutils.utcnow() - datetime.timedelta(
+                seconds=tasks_db.CHANGE_TIMEOUT + 1)},
+            synchronize_session=False)
+        changes, since = tasks_db.get_changes(self.session, since, 10)
+        self.assertEqual(set([second['id'], third['id']]),
+                         self._ids(changes))
+        self.assertEqual(third['seq'], since)
+
+    def test_get_changes_of_tenant(self):
+        tasks_db.create_task(self.session, _task('port-1'))
+        other = tasks_db.create_task(self.session,
+                                     _task('port-2', tenant_id='other'))
+        changes, _since = tasks_db.get_changes(self.session, 0, 10,
+                                               tenant_id='other')
+        self.assertEqual([other['id']], [task['id'] for task in changes])
+
+
+class TestDependencies(base.SqlTestCase):
+
+    def setUp(self):
+        super(TestDependencies, self).setUp()
+        self.network = tasks_db.create_task(
+            self.session, _task('net', object_type='network'))
+
+    def _create_port(self, depends_on=(('network', 'net'),)):
+        return tasks_db.create_task(
+            self.session, _task('port', depends_on=depends_on), deadline=60)
+
+    def _get(self, task_id):
+        return self.session.query(Task).populate_existing().filter(
+            Task.id == task_id).one()
+
+    def _end(self, task_id, status=constants.TASK_COMPLETED):
+        return tasks_db.update_task(self.session, task_id,
+                                    {'status': status})
+
+    def test_task_waiting_for_open_task_is_blocked(self):
+        port = self._create_port()
+        task = self._get(port['id'])
+        self.assertEqual(constants.TASK_BLOCKED, task.status)
+        self.assertEqual(1, task.blockers)
+        self.assertIsNone(task.escalate_at)
+        self.assertEqual(
+            [self.network['id']],
+            [task['id'] for task in tasks_db.claim_tasks(
+                self.session, 10, 'operator', 60)])
+
+    def test_task_needing_no_open_task_is_pending(self):
+        self._end(self.network['id'])
+        port = self._create_port()
+        self.assertEqual(constants.TASK_PENDING, port['status'])
+        self.assertEqual(0, port['blockers'])
+
+    def test_ending_task_releases_dependents(self):
+        port = self._create_port()
+        self._end(self.network['id'])
+        task = self._get(port['id'])
+        self.assertEqual(constants.TASK_PENDING, task.status)
+        self.assertEqual(0, task.blockers)
+        self.assertEqual(task.deadline, task.escalate_at)
+        self.assertEqual(0, self.session.query(
+            hdn_models.HdnTaskDependency).count())
+
+    def test_task_waits_for_every_task(self):
+        subnet = tasks_db.create_task(self.session,
+                                      _task('sub', object_type='subnet'))
+        port = self._create_port((('network', 'net'), ('subnet', 'sub')))
+        self.assertEqual(2, port['blockers'])
+        self._end(self.network['id'])
+        task = self._get(port['id'])
+        self.assertEqual(constants.TASK_BLOCKED, task.status)
+        self.assertEqual(1, task.blockers)
+        self._end(subnet['id'], constants.TASK_FAILED)
+        self.assertEqual(constants.TASK_PENDING,
+                         self._get(port['id']).status)
+
+    def test_blocked_task_cannot_be_made_pending(self):
+        port = self._create_port()
+        self.assertRaises(exceptions.TaskBlocked, self._end, port['id'],
+                          constants.TASK_PENDING)
+
+    def test_blocked_task_can_end(self):
+        port = self._create_port()
+        self._end(port['id'])
+        task = self._get(port['id'])
+        self.assertEqual(constants.TASK_COMPLETED, task.status)
+        self.assertEqual(0, task.blockers)
+        self.assertEqual(0, self.session.query(
+            hdn_models.HdnTaskDependency).count())
+
+    def test_reopened_task_is_escalated_from_deadline(self):
+        self._end(self.network['id'])
+        port = self._create_port()
+        self._end(port['id'])
+        self.assertIsNone(self._get(port['id']).escalate_at)
+        self._end(port['id'], constants.TASK_PENDING)
+        task = self._get(port['id'])
+        self.assertEqual(task.deadline, task.escalate_at)
+
+    def test_end_tasks_releases_dependents(self):
+        port = self._create_port()
+        self.assertEqual([self.network['id']], tasks_db.end_tasks(
+            self.session, 'network', ['net'], constants.TASK_COMPLETED))
+        self.assertEqual(constants.TASK_COMPLETED,
+                         self._get(self.network['id']).status)
+        self.assertEqual(constants.TASK_PENDING,
+                         self._get(port['id']).status)
+
+    def test_deleting_task_releases_dependents(self):
+        port = self._create_port()
+        tasks_db.delete_task(self.session, self.network['id'])
+        self.assertEqual(constants.TASK_PENDING,
+                         self._get(port['id']).status)
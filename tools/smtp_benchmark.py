@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the per-message cost of sending HDN notifications.
+
+A local SMTP stand-in is started on the loopback interface, optionally
+adding an artificial delay before every group of replies in order to
+emulate the round-trip time to a real relay. The same number of messages
+is then sent opening a new session for each message, as hdnlib used to do,
+through the SMTP session pool one message at a time, and through the pool
+as a single batch. The stand-in advertises PIPELINING, so the batch is
+pipelined unless --no-pipelining is given.
+
+Usage: smtp_benchmark.py [--messages N] [--latency SECONDS] [--no-pipelining]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import smtplib
+import sys
+import threading
+import time
+
+from six.moves import socketserver
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from hdn.common import smtppool  # noqa
+
+SENDER = 'hdn@localhost'
+RECIPIENTS = ['operator@localhost']
+MESSAGE = ("Subject: [HDN] Create port request:bench\r\n\r\n"
+           "id: bench\r\nstatus: PENDING_CREATE\r\n")
+
+
+class SMTPStandinHandler(socketserver.BaseRequestHandler):
+
+    def reply(self, line):
+        self.replies.append(line.encode('ascii') + b"\r\n")
+
+    def flush(self):
+        # Replies to all the commands received at once are sent together,
+        # after a single round-trip delay
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.request.sendall(b"".join(self.replies))
+        self.replies = []
+
+    def process(self, line):
+        if self.in_data:
+            if line == b".":
+                self.in_data = False
+                self.server.delivered += 1
+                self.reply("250 2.0.0 Ok: queued")
+            return
+        command = line.decode('ascii').split(' ', 1)[0].upper()
+        if command == 'EHLO':
+            self.reply("250-localhost\r\n250-AUTH PLAIN")
+            if self.server.pipelining:
+                self.reply("250-PIPELINING")
+            self.reply("250 8BITMIME")
+        elif command == 'AUTH':
+            self.reply("235 2.7.0 Authentication successful")
+        elif command == 'DATA':
+            self.in_data = True
+            self.reply("354 End data with <CR><LF>.<CR><LF>")
+        elif command == 'QUIT':
+            self.reply("221 2.0.0 Bye")
+            self.closing = True
+        else:
+            # HELO, MAIL, RCPT, RSET, NOOP
+            self.reply("250 2.0.0 Ok")
+
+    def handle(self):
+        self.replies = []
+        self.in_data = False
+        self.closing = False
+        self.reply("220 localhost HDN benchmark stand-in")
+        buf = b""
+        while True:
+            self.flush()
+            if self.closing:
+                return
+            # Read until there is something to reply, e.g. a complete
+            # command or the end of a message
+            while not self.replies:
+                data = self.request.recv(65536)
+                if not data:
+                    return
+                lines = (buf + data).split(b"\r\n")
+                buf = lines.pop()
+                for line in lines:
+                    self.process(line)
+
+
+class SMTPStandin(socketserver.ThreadingTCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency=0, pipelining=True):
+        socketserver.ThreadingTCPServer.__init__(
+            self, ('127.0.0.1', 0), SMTPStandinHandler)
+        self.latency = latency
+        self.pipelining = pipelining
+        self.delivered = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def send_unpooled(port, count):
+    for _i in range(count):
+        server = smtplib.SMTP('127.0.0.1', port)
+        server.ehlo()
+        server.login(SENDER, 'password')
+        server.sendmail(SENDER, RECIPIENTS, MESSAGE)
+        server.close()
+
+
+def send_pooled(port, count):
+    pool = smtppool.SMTPSessionPool('127.0.0.1', port,
+                                    user=SENDER, password='password',
+                                    starttls=False, max_size=1)
+    for _i in range(count):
+        pool.sendmail(SENDER, RECIPIENTS, MESSAGE)
+    pool.close()
+
+
+def send_batch(port, count):
+    pool = smtppool.SMTPSessionPool('127.0.0.1', port,
+                                    user=SENDER, password='password',
+                                    starttls=False, max_size=1)
+    results = pool.sendmany(SENDER, [(RECIPIENTS, MESSAGE)] * count)
+    pool.close()
+    failed = len([result for result in results if result is not None])
+    if failed:
+        print("%d messages were not accepted" % failed)
+
+
+def run(name, func, port, count):
+    start = time.time()
+    func(port, count)
+    elapsed = time.time() - start
+    print("%-10s %6d messages  %8.3fs  %8.3f ms/message" %
+          (name, count, elapsed, elapsed * 1000.0 / count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.001,
+                        help="Round-trip delay, in seconds, emulated by "
+                             "the SMTP stand-in")
+    parser.add_argument('--no-pipelining', action='store_true',
+                        help="Do not advertise the PIPELINING extension")
+    args = parser.parse_args()
+
+    standin = SMTPStandin(latency=args.latency,
+                          pipelining=not args.no_pipelining)
+    thread = threading.Thread(target=standin.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        run('unpooled', send_unpooled, standin.port, args.messages)
+        run('pooled', send_pooled, standin.port, args.messages)
+        run('batch', send_batch, standin.port, args.messages)
+    finally:
+        standin.shutdown()
+
+
+if __name__ == '__main__':
+    main()
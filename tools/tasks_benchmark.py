@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# Copyright 2015 Taturiello Consulting
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the cost of listing HDN tasks as the task table grows.
+
+The hdntasks table is filled with the given numbers of tasks, and for each
+size a page of tasks is listed in a few ways the API does: the first page,
+a page deep into the listing using a marker, a page of the pending tasks
+of a single tenant, and the same with only a couple of fields. Unless
+--no-baseline is given, the same listing is also done by loading every
+task and filtering, sorting and paginating in Python, as a reference.
+Claiming tasks, finding the open tasks due for escalation and reading the
+tasks changed after a given change, as watchers do, are measured as well,
+and so is creating tasks for a batch of events, first with an INSERT per
+event and then with multi-row INSERT statements, as done for the events
+triggered by a transaction.
+
+With --explain, the query plans of the statements run by the listings,
+claims, escalations and watches are printed instead, for the largest size,
+to check that they are answered through the indexes of the hdntasks table.
+The exit status is then 1 if any of them scans the whole table.
+
+Usage: tasks_benchmark.py [--connection URL] [--sizes N,N,...] [--page N]
+                          [--explain]
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import os
+import random
+import re
+import sys
+import time
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy import orm
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from hdn.common import constants  # noqa
+from hdn.db.models import hdn_models  # noqa
+from hdn.db import tasks_db  # noqa
+
+TENANTS = ['tenant-%03d' % index for index in range(100)]
+TYPES = ['network', 'subnet', 'port', 'router']
+ACTIONS = ['create', 'update', 'delete']
+BATCH_SIZE = 10000
+EPOCH = datetime.datetime(2015, 1, 1)
+DEADLINE = datetime.timedelta(days=1)
+
+
+def populate(session, start, stop):
+    rand = random.Random(start)
+    table = hdn_models.HdnTask.__table__
+    changes = hdn_models.HdnTaskChange.__table__
+    for batch_start in range(start, stop, BATCH_SIZE):
+        rows = []
+        for index in range(batch_start, min(stop, batch_start + BATCH_SIZE)):
+            # Most tasks were dealt with already
+            status = (constants.TASK_PENDING if rand.random() < 0.1
+                      else constants.TASK_COMPLETED)
+            created_at = EPOCH + datetime.timedelta(seconds=index)
+            rows.append({'id': '%08x-0000-0000-0000-%012x' % (
+                            rand.getrandbits(32), index),
+                         'tenant_id': rand.choice(TENANTS),
+                         'action': rand.choice(ACTIONS),
+                         'object_id': '%036x' % index,
+                         'object_type': rand.choice(TYPES),
+                         'status': status,
+                         'priority': rand.randint(
+                             constants.TASK_PRIORITY_HIGHEST,
+                             constants.TASK_PRIORITY_LOWEST),
+                         'created_at': created_at,
+                         # Tasks are changed ten at a time
+                         'seq': index // 10 + 1,
+                         'deadline': created_at + DEADLINE,
+                         # Only open tasks are escalated
+                         'escalate_at': (created_at + DEADLINE
+                                         if status == constants.TASK_PENDING
+                                         else None)})
+        with session.begin():
+            session.execute(table.insert(), rows)
+            session.execute(changes.insert(), [
+                {'id': seq, 'created_at': EPOCH + datetime.timedelta(
+                    seconds=(seq - 1) * 10)}
+                for seq in sorted(set(row['seq'] for row in rows))
+                if (seq - 1) * 10 >= start])
+
+
+def python_listing(session, tenant_id, page):
+    tasks = [task for task in session.query(hdn_models.HdnTask)
+             if task.tenant_id == tenant_id and
+             task.status == constants.TASK_PENDING]
+    tasks.sort(key=lambda task: task.id)
+    result = [{'id': task.id, 'status': task.status}
+              for task in tasks[:page]]
+    session.expunge_all()
+    return result
+
+
+def claim(session, page):
+    # Claims are rolled back, so that every run finds the same tasks
+    session.begin()
+    try:
+        return tasks_db.claim_tasks(session, page, 'benchmark', 60)
+    finally:
+        session.rollback()
+
+
+def _is_full_scan(dialect, row):
+    if dialect == 'sqlite':
+        detail = str(row[-1])
+        return (re.match(r'SCAN (TABLE )?hdntasks\b', detail) is not None and
+                'INDEX' not in detail)
+    if dialect == 'mysql':
+        return row['table'] == 'hdntasks' and row['type'] == 'ALL'
+    return 'Seq Scan on hdntasks' in str(row[0])
+
+
+def explain(session, name, func):
+    """Print the query plans of the SELECT statements run by func.
+
+    Returns the number of plans which scan the whole hdntasks table.
+    """
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    engine = session.get_bind()
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        func()
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+    prefix = ('EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite'
+              else 'EXPLAIN ')
+    full_scans = 0
+    print(name)
+    for statement, parameters in statements:
+        print("  %s" % " ".join(statement.split()))
+        for row in session.connection().execute(prefix + statement,
+                                                parameters):
+            marker = ''
+            if _is_full_scan(engine.dialect.name, row):
+                marker = '  <- full scan'
+                full_scans += 1
+            print("    %s%s" % (" ".join(str(column) for column in row),
+                                marker))
+    return full_scans
+
+
+def measure_creation(session, count):
+    tasks = [{'tenant_id': TENANTS[index % len(TENANTS)],
+              'object': '%036x' % index,
+              'type': 'port',
+              'action': 'create'} for index in range(count)]
+    start = time.time()
+    for task in tasks:
+        with session.begin():
+            tasks_db.create_task(session, task)
+    single = time.time() - start
+    start = time.time()
+    with session.begin():
+        tasks_db.create_tasks(session, tasks)
+    batched = time.time() - start
+    with session.begin():
+        session.query(hdn_models.HdnTask).delete()
+        session.query(hdn_models.HdnTaskChange).delete()
+    for name, elapsed in (('per event', single), ('batched', batched)):
+        print("  %-12s %6d tasks  %8.3fs  %10.0f tasks/s" %
+              (name, count, elapsed, count / elapsed))
+
+
+def measure(func, repeat):
+    start = time.time()
+    for _i in range(repeat):
+        result = func()
+    return (time.time() - start) * 1000.0 / repeat, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--connection', default='sqlite://',
+                        help="Database URL, an in-memory SQLite database "
+                             "by default")
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help="Comma separated numbers of tasks")
+    parser.add_argument('--page', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--no-baseline', action='store_true',
+                        help="Do not list tasks in Python for reference")
+    parser.add_argument('--events', type=int, default=1000,
+                        help="Number of tasks created for measuring task "
+                             "creation")
+    parser.add_argument('--explain', action='store_true',
+                        help="Print query plans instead of timings")
+    args = parser.parse_args()
+
+    engine = sa.create_engine(args.connection)
+    hdn_models.HdnTask.__table__.create(engine, checkfirst=True)
+    hdn_models.HdnTaskChange.__table__.create(engine, checkfirst=True)
+    session = orm.sessionmaker(bind=engine, autocommit=True)()
+    tenant_id = TENANTS[0]
+    pending = {'tenant_id': [tenant_id],
+               'status': [constants.TASK_PENDING]}
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+    if args.explain:
+        sizes = sizes[-1:]
+    else:
+        print("Task creation")
+        measure_creation(session, args.events)
+    count = 0
+    for size in sizes:
+        start = time.time()
+        populate(session, count, size)
+        count = size
+        print("%d tasks (%.1fs to populate)" % (size, time.time() - start))
+        # A marker about 90% into the listing
+        marker = session.query(hdn_models.HdnTask.id).order_by(
+            hdn_models.HdnTask.id).offset(size * 9 // 10).first()[0]
+        by_age = [('priority', True), ('created_at', True)]
+        # Escalations due by the time the tasks around the marker were
+        # created, as read by the escalator after a long backlog
+        marker_age = EPOCH + DEADLINE + datetime.timedelta(
+            seconds=size * 9 // 10)
+        listings = [
+            ('first page', lambda: tasks_db.get_tasks(
+                session, limit=args.page)),
+            ('deep page', lambda: tasks_db.get_tasks(
+                session, limit=args.page, marker=marker)),
+            ('pending', lambda: tasks_db.get_tasks(
+                session, filters=pending, limit=args.page)),
+            ('fields', lambda: tasks_db.get_tasks(
+                session, filters=pending, fields=['id', 'status'],
+                limit=args.page)),
+            ('by age', lambda: tasks_db.get_tasks(
+                session, filters=pending, sorts=by_age, limit=args.page)),
+            ('object', lambda: tasks_db.get_tasks(
+                session, filters={'object': ['%036x' % (size // 2)]})),
+            ('claim', lambda: claim(session, args.page)),
+            ('escalations', lambda: tasks_db.get_escalations(
+                session, marker_age, args.page)),
+            ('changes', lambda: tasks_db.get_changes(
+                session, size // 100 * 9, args.page)[0]),
+        ]
+        if args.explain:
+            full_scans = sum(explain(session, name, func)
+                             for name, func in listings)
+            if full_scans:
+                print("%d query plans scan the whole hdntasks table" %
+                      full_scans)
+                return 1
+            continue
+        if not args.no_baseline:
+            listings.append(('python', lambda: python_listing(
+                session, tenant_id, args.page)))
+        for name, func in listings:
+            elapsed, returned = measure(func, args.repeat)
+            print("  %-12s %4d tasks  %10.3f ms" % (name, returned, elapsed))
+
+
+if __name__ == '__main__':
+    sys.exit(main())